@@ -6,11 +6,21 @@ Der Chatverlauf wird in der Liste 'chat_history' gespeichert und bei jeder Anfra
 an das Modell übergeben, um kontextbezogene Antworten zu ermöglichen.
 Eine Systemnachricht legt zu Beginn das Verhalten des Assistenten fest.
 Der Chat läuft in einer Schleife, bis der Benutzer 'exit' eingibt.
+
+Die Antwort wird gestreamt: Tokens erscheinen, sobald das Modell sie erzeugt. Nach jeder Antwort
+werden die Zeit bis zum ersten Token (TTFT) und die Tokens pro Sekunde ausgegeben.
+Mit --no-stream wird wie bisher auf die vollständige Antwort gewartet.
 """
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+import sys
+
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 
-llm = ChatOpenAI(model="gpt-4o-mini")
+from streaming import stream_response  # Gestreamte Ausgabe mit TTFT und Tokens pro Sekunde
+
+llm = ChatOpenAI(model="gpt-4o-mini", stream_usage=True)  # stream_usage: Token-Zahlen auch beim Streaming
+stream = "--no-stream" not in sys.argv
+
 
 chat_history = [] # Liste für die Chat-History
 
@@ -26,11 +36,15 @@ while True:
     Hier wird das aktuelle Chat-Verlauf an das Modell übergeben und die Antwort generiert.
     Die Antwort wird der Chat-History hinzugefügt und auf der Konsole ausgegeben.
     """
-    result = llm.invoke(chat_history)
+    if stream:
+        result = stream_response(llm, chat_history)
+    else:
+        result = llm.invoke(chat_history)
+        print(result.content)
     chat_history.append(result)
-    print(result.content)
 
 print("---- Message History ----")
 print(chat_history)
 
 # docker-compose run --rm app langchain/1_chat_moddels/4_chat_models_conversation_with_user.py
+# docker-compose run --rm app langchain/1_chat_moddels/4_chat_models_conversation_with_user.py --no-stream
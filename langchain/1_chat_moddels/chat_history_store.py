@@ -0,0 +1,272 @@
+"""
+Chat-History mit Write-Behind: Nachrichten werden im Hintergrund gebündelt gespeichert
+
+Bisher kostete jede Nachricht zwei synchrone Firestore-Aufrufe (get + update) vor der nächsten Eingabe.
+Hier landet eine Nachricht zunächst nur im Speicher; ein Hintergrund-Thread schreibt die gesammelten
+Nachrichten mit einem einzigen Aufruf:
+- sobald max_batch Nachrichten warten oder flush_interval Sekunden seit der ersten vergangen sind
+- beim Beenden des Programms (atexit) bzw. bei close()
+- schlägt ein Schreibvorgang fehl, bleiben die Nachrichten vorgemerkt und werden beim nächsten Mal erneut geschrieben
+
+Speicher-Backends (gleiche Schnittstelle wie HistoryStore):
+- FirestoreHistoryStore: ein Dokument pro Sitzung, Nachrichten als Array (set mit merge, ohne vorheriges get)
+- SQLiteHistoryStore: lokale SQLite-Datei oder ':memory:' zum Testen ohne Firebase;
+  mit 'latency' lässt sich die Antwortzeit eines entfernten Dienstes nachstellen
+"""
+import abc  # Für die Schnittstelle der Speicher-Backends
+import atexit  # Für das Speichern beim Programmende
+import datetime  # Für Zeitstempel
+import sqlite3  # Für den lokalen Speicher
+import threading  # Für den Hintergrund-Thread
+import time  # Für das Zeitfenster und die nachgestellte Latenz
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+MESSAGE_CLASSES = {"system": SystemMessage, "human": HumanMessage, "ai": AIMessage}
+
+
+def message_to_dict(message, msg_type):
+    """LangChain-Nachricht -> gespeichertes Format."""
+    return {"type": msg_type, "content": message.content, "timestamp": datetime.datetime.now().isoformat()}
+
+
+def dict_to_message(data):
+    """Gespeichertes Format -> LangChain-Nachricht (None bei unbekanntem Typ)."""
+    cls = MESSAGE_CLASSES.get(data.get("type"))
+    return cls(content=data["content"]) if cls else None
+
+
+class HistoryStore(abc.ABC):
+    """Schnittstelle der Speicher-Backends."""
+
+    @abc.abstractmethod
+    def load(self, session_id):
+        """Liefert alle gespeicherten Nachrichten der Sitzung als Liste von Dicts (leer, wenn es keine gibt)."""
+
+    @abc.abstractmethod
+    def append(self, session_id, messages):
+        """Hängt die Nachrichten (Dicts) mit einem einzigen Schreibvorgang an."""
+
+
+class FirestoreHistoryStore(HistoryStore):
+    """
+    Ein Firestore-Dokument pro Sitzung mit dem Array 'messages'.
+
+    Args:
+        db: Firestore-Client (firestore.client())
+        collection: Name der Collection
+    """
+
+    def __init__(self, db, collection="chat_history"):
+        from firebase_admin import firestore  # Nur für dieses Backend nötig
+
+        self.db = db
+        self.collection = collection
+        self._firestore = firestore
+        self._existing = set()  # Sitzungen, deren Dokument schon existiert
+
+    def load(self, session_id):
+        doc = self.db.collection(self.collection).document(session_id).get()
+        if not doc.exists:
+            return []
+        self._existing.add(session_id)
+        return doc.to_dict().get("messages", [])
+
+    def append(self, session_id, messages):
+        now = datetime.datetime.now().isoformat()
+        data = {"messages": self._firestore.ArrayUnion(list(messages)), "updated_at": now}
+        if session_id not in self._existing:
+            data["created_at"] = now
+        # merge=True legt das Dokument bei Bedarf an: kein get() vor dem Schreiben nötig
+        self.db.collection(self.collection).document(session_id).set(data, merge=True)
+        self._existing.add(session_id)
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """
+    Lokaler Speicher in SQLite (Datei oder ':memory:'), z.B. zum Testen ohne Firebase.
+
+    Args:
+        path: Pfad der Datenbank
+        latency: Künstliche Verzögerung pro Aufruf in Sekunden (Nachbildung eines entfernten Dienstes)
+    """
+
+    def __init__(self, path=":memory:", latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "session_id TEXT, seq INTEGER, type TEXT, content TEXT, timestamp TEXT, PRIMARY KEY (session_id, seq))"
+        )
+        self._conn.commit()
+
+    def _round_trip(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def load(self, session_id):
+        self._round_trip()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT type, content, timestamp FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return [{"type": t, "content": content, "timestamp": timestamp} for t, content, timestamp in rows]
+
+    def append(self, session_id, messages):
+        self._round_trip()
+        with self._lock, self._conn:
+            (start,) = self._conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            self._conn.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                [(session_id, start + i, m["type"], m["content"], m["timestamp"]) for i, m in enumerate(messages)],
+            )
+
+
+class WriteBehindHistory:
+    """
+    Puffert Nachrichten einer Sitzung und schreibt sie gebündelt in einem Hintergrund-Thread.
+
+    Args:
+        store: Speicher-Backend (HistoryStore)
+        session_id: ID der Sitzung
+        max_batch: Sofort schreiben, sobald so viele Nachrichten warten
+        flush_interval: Spätestens nach so vielen Sekunden schreiben
+    """
+
+    def __init__(self, store, session_id, max_batch=20, flush_interval=2.0):
+        self.store = store
+        self.session_id = session_id
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._first_pending_at = None
+        self._writing = False
+        self._closed = False
+        self._retry_at = 0.0  # Nach einem Fehler erst nach flush_interval erneut schreiben
+        self._condition = threading.Condition()
+        self.stats = {"messages": 0, "writes": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def load(self):
+        """Gespeicherte Nachrichten als LangChain-Nachrichten (synchron, einmal beim Start)."""
+        return [m for m in map(dict_to_message, self.store.load(self.session_id)) if m is not None]
+
+    def add(self, message, msg_type):
+        """Merkt die Nachricht zum Speichern vor und kehrt sofort zurück."""
+        with self._condition:
+            if not self._pending:
+                self._first_pending_at = time.monotonic()
+            self._pending.append(message_to_dict(message, msg_type))
+            self.stats["messages"] += 1
+            if len(self._pending) in (1, self.max_batch):  # Zeitfenster starten bzw. sofort schreiben
+                self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._writing:  # flush() schreibt gerade; die Reihenfolge muss erhalten bleiben
+                        self._condition.wait()
+                        continue
+                    if self._pending:
+                        now = time.monotonic()
+                        due = self._first_pending_at + self.flush_interval
+                        if len(self._pending) >= self.max_batch:
+                            due = max(now, self._retry_at)
+                        if due <= now:
+                            break
+                        self._condition.wait(due - now)
+                    else:
+                        self._condition.wait()
+                if self._closed and not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+                self._writing = True
+            self._write(batch)
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+                if self._closed:
+                    return  # close() schreibt fehlgeschlagene Reste selbst
+
+    def _write(self, batch):
+        try:
+            self.store.append(self.session_id, batch)
+            self.stats["writes"] += 1
+        except Exception as e:
+            print(f"Fehler beim Speichern der Chat-History: {e}")
+            self.stats["errors"] += 1
+            with self._condition:
+                # Vorne wieder einreihen; das Zeitfenster beginnt neu
+                self._pending[:0] = batch
+                self._first_pending_at = time.monotonic()
+                self._retry_at = self._first_pending_at + self.flush_interval
+
+    def flush(self):
+        """Schreibt alle vorgemerkten Nachrichten sofort (blockierend)."""
+        with self._condition:
+            while self._writing:
+                self._condition.wait()
+            batch, self._pending = self._pending, []
+            self._writing = bool(batch)
+        if batch:
+            self._write(batch)
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+    def close(self):
+        """Beendet den Hintergrund-Thread und schreibt den Rest."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.flush()
+        if self._pending:
+            print(f"{len(self._pending)} Nachrichten konnten nicht gespeichert werden.")
+
+    def print_stats(self):
+        """Gibt aus, wie viele Nachrichten mit wie vielen Schreibvorgängen gespeichert wurden."""
+        print(
+            f"--- Chat history: {self.stats['messages']} messages in {self.stats['writes']} writes "
+            f"({self.stats['errors']} errors) ---"
+        )
+
+
+if __name__ == "__main__":
+    # Demo: Wartezeit pro Runde bei synchronem Speichern (get + update) gegenüber Write-Behind
+    turns, latency = 20, 0.08
+    human, ai = HumanMessage(content="Hallo"), AIMessage(content="Hallo! Wie kann ich helfen?")
+
+    store = SQLiteHistoryStore(latency=latency)
+    start = time.perf_counter()
+    for _ in range(turns):
+        for message, msg_type in ((human, "human"), (ai, "ai")):
+            store.load("sync")  # Entspricht chat_ref.get()
+            store.append("sync", [message_to_dict(message, msg_type)])  # Entspricht chat_ref.update()
+    sync_ms = (time.perf_counter() - start) * 1000 / turns
+
+    store = SQLiteHistoryStore(latency=latency)
+    history = WriteBehindHistory(store, "write-behind", flush_interval=0.5)
+    start = time.perf_counter()
+    for _ in range(turns):
+        history.add(human, "human")
+        history.add(ai, "ai")
+    behind_ms = (time.perf_counter() - start) * 1000 / turns
+    history.close()
+    assert len(store.load("write-behind")) == 2 * turns
+
+    print(f"synchronous:  {sync_ms:.1f}ms per turn spent saving ({4 * turns} calls)")
+    print(f"write-behind: {behind_ms:.3f}ms per turn spent saving ({store.calls - 1} calls)")
+    history.print_stats()
+
+# docker-compose run --rm app langchain/1_chat_moddels/chat_history_store.py
@@ -0,0 +1,52 @@
+"""
+Gestreamte Antworten für die Chat-, Chain- und RAG-Skripte
+
+stream_response() gibt die Antwort Token für Token aus, sobald das Modell sie erzeugt, und misst
+die Zeit bis zum ersten Token (TTFT) und die Tokens pro Sekunde der Generierung. Die Token-Zahl
+stammt aus den Usage-Metadaten (ChatOpenAI mit stream_usage=True), nicht aus der Zahl der Stücke.
+Gestreamt werden kann ein Chat-Modell (Stücke sind AIMessageChunks) oder eine ganze Chain
+(z.B. mit StrOutputParser, Stücke sind Strings).
+
+Genutzt von 1_chat_moddels/4_ und 5_, 3_chains/1_chains_basics.py und 4_RAGs/3_rag_one_off_question.py.
+"""
+import functools  # Für das Aufsummieren der Usage-Metadaten
+import time  # Für die Messung von TTFT und Tokens pro Sekunde
+
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.messages import AIMessage
+from langchain_core.messages.ai import add_usage
+
+
+def stream_response(runnable, input, start=None):
+    """
+    Gibt die Antwort Token für Token aus und liefert sie als AIMessage (mit Usage-Metadaten) zurück.
+
+    Args:
+        runnable: Chat-Modell oder Chain
+        input: Nachrichten bzw. Eingabe der Chain
+        start: Beginn der Anfrage für die TTFT (z.B. vor dem Retrieval); Standard: Aufruf dieser Funktion
+
+    Liefert das Modell keinen einzigen Chunk, wird eine leere AIMessage zurückgegeben.
+    """
+    start = start if start is not None else time.perf_counter()
+    first_token_at = None
+    usage = UsageMetadataCallbackHandler()  # Sammelt die Token-Zahlen aller Modellaufrufe
+    pieces = []
+    for chunk in runnable.stream(input, config={"callbacks": [usage]}):
+        text = chunk if isinstance(chunk, str) else chunk.content
+        if first_token_at is None and text:
+            first_token_at = time.perf_counter()
+        print(text, end="", flush=True)
+        pieces.append(text)
+    end = time.perf_counter()
+    print()
+    if not pieces:
+        print("(empty response)")
+        return AIMessage(content="")
+    usage_metadata = functools.reduce(add_usage, usage.usage_metadata.values(), None)
+    output_tokens = (usage_metadata or {}).get("output_tokens", 0)
+    ttft = (first_token_at or end) - start
+    generation = end - (first_token_at or end)
+    rate = output_tokens / generation if generation > 0 else 0.0
+    print(f"(TTFT {ttft * 1000:.0f}ms, {output_tokens} tokens, {rate:.1f} tokens/s)")
+    return AIMessage(content="".join(pieces), usage_metadata=usage_metadata)
@@ -11,13 +11,25 @@ In diesem Beispiel wird eine einfache Chain erstellt, die:
 
 Diese Verkettung wird mit dem Pipe-Operator (|) realisiert, was den Code
 übersichtlicher und modularer gestaltet als verschachtelte Funktionsaufrufe.
+
+Die Chain wird gestreamt (chain.stream): jeder Baustein reicht seine Teilergebnisse sofort weiter,
+der StrOutputParser liefert also Text-Stücke, sobald das LLM sie erzeugt. Ausgegeben werden
+die Zeit bis zum ersten Token (TTFT) und die Tokens pro Sekunde; die Token-Zahl stammt aus den
+Usage-Metadaten des Modells (ein Stück ist nicht unbedingt ein Token). Mit --no-stream wird wie
+bisher chain.invoke() verwendet.
 """
+import os
+import sys
+
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "1_chat_moddels"))
+from streaming import stream_response  # Gestreamte Ausgabe mit TTFT und Tokens pro Sekunde
 
-model = ChatOpenAI(model="gpt-4o-mini")
+
+model = ChatOpenAI(model="gpt-4o-mini", stream_usage=True)  # stream_usage: Token-Zahlen auch beim Streaming
 
 
 messages = [
@@ -29,8 +41,11 @@ prompt_template = ChatPromptTemplate.from_messages(messages)
 
 chain = prompt_template | model | StrOutputParser()
 
-result = chain.invoke({"topic": "LLMOps", "number": 3})
-
-print(result)
+if "--no-stream" in sys.argv:
+    result = chain.invoke({"topic": "LLMOps", "number": 3})
+    print(result)
+else:
+    stream_response(chain, {"topic": "LLMOps", "number": 3})  # Der StrOutputParser liefert Text-Stücke
 
-# docker-compose run --rm app langchain/3_chains/1_chains_basics.py
\ No newline at end of file
+# docker-compose run --rm app langchain/3_chains/1_chains_basics.py
+# docker-compose run --rm app langchain/3_chains/1_chains_basics.py --no-stream
\ No newline at end of file
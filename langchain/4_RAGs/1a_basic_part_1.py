@@ -9,57 +9,74 @@ Dieses Skript implementiert den ersten Teil eines RAG-Systems mit LangChain:
 
 Die Vektordatenbank wird nur erstellt, wenn sie nicht bereits existiert.
 Dies ermöglicht eine effiziente Wiederverwendung für spätere Abfragen.
+Mit --incremental werden nur geänderte Chunks neu eingebettet (siehe ingestion.py).
 """
-from langchain_community.document_loaders import TextLoader  # Zum Laden von Textdokumenten
-from langchain_text_splitters import CharacterTextSplitter  # Zum Aufteilen von Dokumenten in Chunks
 from langchain_chroma import Chroma  # Vektordatenbank für die Speicherung von Embeddings
 from langchain_openai import OpenAIEmbeddings  # OpenAI-API für Embeddings
 import os  # Für Dateisystem-Operationen
+import sys  # Für Kommandozeilenargumente
+
+from embedding_cache import CachedEmbeddings
+from ingestion import incremental_ingest, load_manifest, manifest_path_for, print_ingest_stats
+from streaming_splitter import StreamingCharacterSplitter  # Liest Dateien fensterweise statt komplett
 
 # Definiere die Verzeichnisse für Quelldatei und Vektordatenbank
 current_dir = os.path.dirname(os.path.abspath(__file__))  # Aktuelles Verzeichnis ermitteln
-file_path = os.path.join(current_dir, "documents", "lord_of_the_rings.txt")  # Pfad zur Textdatei
+books_dir = os.path.join(current_dir, "documents")  # Verzeichnis der Textdateien
+file_path = os.path.join(books_dir, "lord_of_the_rings.txt")  # Pfad zur Textdatei
 persistent_directory = os.path.join(current_dir, "db", "chroma_db")  # Speicherort für die Vektordatenbank
 
+# Inkrementeller Modus: bestehende Datenbank mit der Quelldatei abgleichen
+incremental = "--incremental" in sys.argv
+
 # Überprüfe, ob die Chroma-Vektordatenbank bereits existiert
-if not os.path.exists(persistent_directory):
-    print("Persistent directory does not extist. Initializing vector store...")  # Statusmeldung
+if not os.path.exists(persistent_directory) or incremental:
+    if not os.path.exists(persistent_directory):
+        print("Persistent directory does not extist. Initializing vector store...")  # Statusmeldung
+    else:
+        print("Incremental mode. Syncing vector store with document...")  # Statusmeldung
     
     # Stelle sicher, dass die Textdatei existiert
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Text file not found at {file_path}")  # Fehler, wenn Datei fehlt
     
-    # Lade die Textdatei mit dem TextLoader
-    loader = TextLoader(file_path)  # Initialisiere den Loader mit dem Dateipfad
-    documents = loader.load()  # Lade das Dokument in den Speicher
-    
     # Teile das Dokument in Chunks auf
-    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=50)  # 1000 Zeichen pro Chunk mit 50 Zeichen Überlappung
-    docs = text_splitter.split_documents(documents)  # Führe die Aufteilung durch
-    
-    # Zeige Informationen über die erzeugten Chunks an
-    print("\n--- Document Chunks Information ---")
-    print(f"Number of document chunks: {len(docs)}")  # Anzahl der erzeugten Chunks
-    print(f"Sample chunk:\n{docs[0].page_content}")  # Beispielinhalt des ersten Chunks
+    text_splitter = StreamingCharacterSplitter(chunk_size=1000, chunk_overlap=50)  # 1000 Zeichen pro Chunk mit 50 Zeichen Überlappung
     
     # Erstelle Embeddings mit OpenAI
-    print("\n--- Creating embeddings ---")
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small",  # Verwende das kleine OpenAI-Embedding-Modell
+    embeddings = CachedEmbeddings(
+        OpenAIEmbeddings(
+            model="text-embedding-3-small",  # Verwende das kleine OpenAI-Embedding-Modell
+        ),
+        cache_dir=os.path.join(current_dir, "db", "embedding_cache"),  # Gemeinsamer lokaler Embedding-Cache aller 4_RAGs-Skripte
     )
-    print("\n--- Finished creating embeddings ---")
     
-    # Erstelle die Vektordatenbank und speichere sie automatisch
-    print("\n--- Creating vector store ---")
-    db = Chroma.from_documents(
-        documents=docs,  # Die aufgeteilten Dokumente
-        embedding=embeddings,  # Die Embedding-Funktion
+    # Öffne (oder erstelle) die Vektordatenbank
+    manifest_path = manifest_path_for(persistent_directory)
+    db = Chroma(
+        embedding_function=embeddings,  # Die Embedding-Funktion
         persist_directory=persistent_directory,  # Wo die Datenbank gespeichert werden soll
     )
-    print("\n--- Vector store created and persisted ---")
+    
+    # Bestehende Datenbank ohne Manifest: Chunk-IDs sind unbekannt, daher einmalig neu aufbauen
+    if load_manifest(manifest_path) is None and db.get(limit=1)["ids"]:
+        print("No ingest manifest found. Rebuilding collection once...")
+        db.reset_collection()
+    
+    # Nur neue oder geänderte Chunks einbetten. Quelle ist der Pfad relativ zu documents/ (wie der Dateiname
+    # in 2a), damit Chunk-IDs und Manifest auf dem Host und in Docker gleich bleiben. Ein Manifest mit dem
+    # früheren absoluten Pfad wird dabei einmalig neu abgeglichen (Embeddings kommen aus dem Cache).
+    print("\n--- Creating embeddings and syncing vector store ---")
+    source = os.path.relpath(file_path, books_dir)
+    stats = incremental_ingest(db, {source: file_path}, text_splitter, manifest_path)
+    print_ingest_stats(stats)
+    embeddings.print_stats()  # Treffer/Fehlschläge des Embedding-Caches
+    print("\n--- Vector store synced and persisted ---")
 
 else:
     print("Vector store already exists. No need to initialize.")  # Meldung, wenn Datenbank bereits existiert
+    print("Run with --incremental to sync a changed document.")
 
 # Befehl zum Ausführen des Skripts in einer Docker-Umgebung
-# docker-compose run --rm app langchain/4_RAGs/1a_basic_part_1.py 
\ No newline at end of file
+# docker-compose run --rm app langchain/4_RAGs/1a_basic_part_1.py
+# docker-compose run --rm app langchain/4_RAGs/1a_basic_part_1.py --incremental 
\ No newline at end of file
@@ -1,7 +1,11 @@
-from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
 import os
 
+from embedding_batcher import BatchingEmbeddings
+from embedding_cache import CachedEmbeddings
+from reranking import DEFAULT_FETCH_K, RerankingRetriever, load_reranker
+from vector_store import load_vector_store
+
 """
 RAG (Retrieval Augmented Generation) Basisimplementierung - Teil 2: Abfrage der Vektordatenbank
 
@@ -18,6 +22,8 @@ Verwendete Parameter:
 - Embedding-Modell: text-embedding-3-small (OpenAI)
 - Maximale Anzahl zurückgegebener Dokumente: 3
 - Minimaler Ähnlichkeitsschwellenwert: 0.5 (50%)
+- Optionales Re-Ranking: 20 Kandidaten abrufen, lokal neu bewerten, die besten 3 behalten
+  (RAG_RERANKER=lexical|cross-encoder, Standard none, siehe reranking.py)
 - Beispielabfrage: "Where does Gandalf meet Frodo?"
 """
 
@@ -27,24 +33,35 @@ current_dir = os.path.dirname(os.path.abspath(__file__))  # Ermittle das aktuell
 persistent_directory = os.path.join(current_dir, "db", "chroma_db")  # Pfad zur gespeicherten Vektordatenbank
 
 # Define the embedding model
-embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-small",  # Verwende das kleine OpenAI-Embedding-Modell für Effizienz
+embeddings = CachedEmbeddings(
+    BatchingEmbeddings(  # Gleichzeitige Abfragen werden zu einer Embedding-Anfrage gebündelt (siehe embedding_batcher.py)
+        OpenAIEmbeddings(
+            model="text-embedding-3-small",  # Verwende das kleine OpenAI-Embedding-Modell für Effizienz
+        ),
+    ),
+    cache_dir=os.path.join(current_dir, "db", "embedding_cache"),  # Gemeinsamer lokaler Embedding-Cache aller 4_RAGs-Skripte
 )
 
 # Load the existing vector store with the embedding function
-db = Chroma(
-    embedding_function=embeddings,  # Verwende die gleiche Embedding-Funktion wie bei der Erstellung
-    persist_directory=persistent_directory,  # Lade die Datenbank aus dem Speicherort
+# (Chroma oder lokale NumPy-Suche, per Umgebungsvariable RAG_VECTOR_STORE=chroma|bruteforce|ivf|int8|binary)
+db = load_vector_store(
+    persistent_directory,  # Lade die Datenbank aus dem Speicherort
+    embeddings,  # Verwende die gleiche Embedding-Funktion wie bei der Erstellung
 )
 
 # Define the user's query
 query = "Where does Gandalf meet Frodo?"  # Beispielabfrage zum Testen des RAG-Systems
 
+# Optionales Re-Ranking der Kandidaten (None, wenn RAG_RERANKER=none)
+reranker = load_reranker(os.path.join(current_dir, "db"))
+
 # Retrive relevant documents based on the query
 retrieved = db.as_retriever(
     search_type="similarity_score_threshold",  # Verwende Schwellenwert-basierte Ähnlichkeitssuche
-    search_kwargs={"k": 3, "score_threshold": 0.5},  # Maximal 3 Dokumente mit mindestens 50% Ähnlichkeit
+    search_kwargs={"k": DEFAULT_FETCH_K if reranker else 3, "score_threshold": 0.5},  # Maximal 3 Dokumente (bzw. 20 Kandidaten für das Re-Ranking) mit mindestens 50% Ähnlichkeit
 )
+if reranker:
+    retrieved = RerankingRetriever(base_retriever=retrieved, reranker=reranker, k=3)  # Die besten 3 Kandidaten
 relevant_docs = retrieved.invoke(query)  # Führe die Abfrage durch und erhalte relevante Dokumente
 
 print("\n--- Relevant documents ---")
@@ -53,5 +70,9 @@ for i, doc in enumerate(relevant_docs, 1):  # Durchlaufe alle gefundenen relevan
     if doc.metadata:  # Falls Metadaten vorhanden sind
         print(f"Source: {doc.metadata.get('source', 'Unknown')}")  # Zeige die Quelle des Dokuments an
 
+embeddings.print_stats()  # Treffer/Fehlschläge des Embedding-Caches
+if reranker:
+    reranker.print_stats()  # Neu bewertete und aus dem Cache gelesene Paare
+
 # Befehl zum Ausführen des Skripts in einer Docker-Umgebung
 # docker-compose run --rm app langchain/4_RAGs/1b_basic_part_2.py 
\ No newline at end of file
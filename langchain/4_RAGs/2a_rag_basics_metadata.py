@@ -10,12 +10,24 @@ Dieses Skript implementiert ein RAG-System mit Metadatenanreicherung:
 
 Die Metadaten ermöglichen später eine gezieltere Suche und bessere Quellenangaben.
 Die Vektordatenbank wird nur erstellt, wenn sie nicht bereits existiert.
+Mit --incremental wird eine bestehende Datenbank mit dem Dokumentverzeichnis abgeglichen:
+nur neue oder geänderte Chunks werden eingebettet, Chunks gelöschter Dateien entfernt (siehe ingestion.py).
+Nach jeder Synchronisierung wird der BM25-Index für die hybride Suche neu aufgebaut (siehe bm25_index.py).
+Mit --parallel werden die Bücher in mehreren Prozessen gelesen und aufgeteilt.
+Mit --shards source|hash werden die Bücher statt in eine Collection auf mehrere Shards verteilt
+('<persist_directory>_shards', parallel synchronisiert; Abfrage mit RAG_VECTOR_STORE=sharded, siehe sharded_store.py).
 """
-from langchain_community.document_loaders import TextLoader  # Zum Laden von Textdokumenten
-from langchain_text_splitters import CharacterTextSplitter  # Zum Aufteilen von Dokumenten in Chunks
 from langchain_chroma import Chroma  # Vektordatenbank für die Speicherung von Embeddings
 from langchain_openai import OpenAIEmbeddings  # OpenAI-API für Embeddings
 import os  # Für Dateisystem-Operationen
+import sys  # Für Kommandozeilenargumente
+
+from bm25_index import BM25Index, bm25_path_for
+from embedding_cache import CachedEmbeddings
+from embedding_pipeline import EmbeddingPipeline
+from ingestion import incremental_ingest, load_manifest, manifest_path_for, print_ingest_stats
+from sharded_store import ShardedVectorStore, print_shard_stats, shards_path_for
+from streaming_splitter import StreamingCharacterSplitter  # Liest Dateien fensterweise statt komplett
 
 # Definiere die Verzeichnisse für Quelldateien und Vektordatenbank
 current_dir = os.path.dirname(os.path.abspath(__file__))  # Aktuelles Verzeichnis ermitteln
@@ -26,55 +38,98 @@ persistent_directory = os.path.join(db_dir, "chroma_db_with_metadata")  # Speich
 print(f"Books directory: {db_dir}")
 print(f"Persistent directory: {persistent_directory}")
 
+# Inkrementeller Modus: bestehende Datenbank mit den Quelldateien abgleichen
+incremental = "--incremental" in sys.argv
+# Paralleler Modus: Lesen und Aufteilen der Bücher auf alle CPU-Kerne verteilen
+workers = os.cpu_count() if "--parallel" in sys.argv else None
+# Sharding: ein Shard pro Buch ('source') oder Bücher per Hash auf 16 Shards verteilt ('hash')
+shard_strategy = sys.argv[sys.argv.index("--shards") + 1] if "--shards" in sys.argv else None
+
+if shard_strategy:
+    # Jeder Shard hat sein eigenes Manifest und wird unabhängig (und parallel zu den anderen) synchronisiert
+    if not os.path.exists(books_dir):
+        raise FileNotFoundError(f"Books directory not found at {books_dir}")  # Fehler, wenn Verzeichnis fehlt
+    book_files = [f for f in os.listdir(books_dir) if f.endswith(".txt")]  # Filtere nach .txt-Dateien
+    sources = {book_file: os.path.join(books_dir, book_file) for book_file in book_files}
+    embeddings = CachedEmbeddings(
+        OpenAIEmbeddings(model="text-embedding-3-small"),
+        cache_dir=os.path.join(current_dir, "db", "embedding_cache"),  # Gemeinsamer lokaler Embedding-Cache aller 4_RAGs-Skripte
+    )
+    store = ShardedVectorStore(shards_path_for(persistent_directory), embeddings, strategy=shard_strategy)
+    print(f"\n--- Syncing {shard_strategy} shards in {store.root} ---")
+    shard_stats = store.sync(
+        sources,
+        StreamingCharacterSplitter(chunk_size=1000, chunk_overlap=50),  # Gleiche Chunks wie ohne Sharding
+        workers=workers,
+        batch_size=64,  # Chunks pro Embedding-Anfrage
+        max_in_flight=4,  # Gleichzeitige Embedding-Anfragen pro Shard
+    )
+    print_shard_stats(shard_stats)
+    embeddings.print_stats()  # Treffer/Fehlschläge des Embedding-Caches
+
 # Überprüfe, ob die Chroma-Vektordatenbank bereits existiert
-if not os.path.exists(persistent_directory):
-    print("Persistent directory does not extist. Initializing vector store...")  # Statusmeldung
+elif not os.path.exists(persistent_directory) or incremental:
+    if not os.path.exists(persistent_directory):
+        print("Persistent directory does not extist. Initializing vector store...")  # Statusmeldung
+    else:
+        print("Incremental mode. Syncing vector store with documents...")  # Statusmeldung
     
     # Stelle sicher, dass das Dokumentverzeichnis existiert
     if not os.path.exists(books_dir):
         raise FileNotFoundError(f"Books directory not found at {books_dir}")  # Fehler, wenn Verzeichnis fehlt
     
-    # Sammle alle Textdateien aus dem Verzeichnis
+    # Sammle alle Textdateien aus dem Verzeichnis (Quelldateiname als Metadatum 'source')
     book_files = [f for f in os.listdir(books_dir) if f.endswith(".txt")]  # Filtere nach .txt-Dateien
+    sources = {book_file: os.path.join(books_dir, book_file) for book_file in book_files}
     
-    # Lade alle Textdateien und füge Metadaten hinzu
-    documents = []
-    for book_file in book_files:  # Iteriere über alle Textdateien
-        file_path = os.path.join(books_dir, book_file)  # Vollständiger Pfad zur Datei
-        loader = TextLoader(file_path)  # Initialisiere den Loader
-        book_docs = loader.load()  # Lade das Dokument
-        for doc in book_docs:  # Für jedes geladene Dokument
-            doc.metadata = {"source": book_file}  # Füge Metadaten hinzu (Quelldateiname)
-            documents.append(doc)  # Füge das Dokument zur Liste hinzu
+    # 1000 Zeichen pro Chunk mit 50 Zeichen Überlappung
+    text_splitter = StreamingCharacterSplitter(chunk_size=1000, chunk_overlap=50)
     
-    # Teile die Dokumente in Chunks auf
-    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=50)  # 1000 Zeichen pro Chunk mit 50 Zeichen Überlappung
-    docs = text_splitter.split_documents(documents)  # Führe die Aufteilung durch (Metadaten werden übernommen)
-    
-    # Zeige Informationen über die erzeugten Chunks an
-    print("\n--- Document Chunks Information ---")
-    print(f"Number of document chunks: {len(docs)}")  # Anzahl der erzeugten Chunks
-    print(f"Sample chunk:\n{docs[0].page_content}")  # Beispielinhalt des ersten Chunks
-    print(f"Sample metadata: {docs[0].metadata}")  # Beispiel für Metadaten
-    
-    # Erstelle Embeddings mit OpenAI
-    print("\n--- Creating embeddings ---")
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small",  # Verwende das kleine OpenAI-Embedding-Modell
+    # Embedding-Modell von OpenAI
+    embeddings = CachedEmbeddings(
+        OpenAIEmbeddings(
+            model="text-embedding-3-small",  # Verwende das kleine OpenAI-Embedding-Modell
+        ),
+        cache_dir=os.path.join(current_dir, "db", "embedding_cache"),  # Gemeinsamer lokaler Embedding-Cache aller 4_RAGs-Skripte
     )
-    print("\n--- Finished creating embeddings ---")
     
-    # Erstelle die Vektordatenbank und speichere sie automatisch
-    print("\n--- Creating vector store ---")
-    db = Chroma.from_documents(
-        documents=docs,  # Die aufgeteilten Dokumente mit Metadaten
-        embedding=embeddings,  # Die Embedding-Funktion
+    # Öffne (oder erstelle) die Vektordatenbank
+    manifest_path = manifest_path_for(persistent_directory)
+    db = Chroma(
+        embedding_function=embeddings,  # Die Embedding-Funktion
         persist_directory=persistent_directory,  # Wo die Datenbank gespeichert werden soll
     )
-    print("\n--- Vector store created and persisted ---")
+    
+    # Bestehende Datenbank ohne Manifest: Chunk-IDs sind unbekannt, daher einmalig neu aufbauen
+    if load_manifest(manifest_path) is None and db.get(limit=1)["ids"]:
+        print("No ingest manifest found. Rebuilding collection once...")
+        db.reset_collection()
+    
+    # Asynchrone Embedding-Pipeline: Batches, begrenzte Parallelität, Backoff bei HTTP 429
+    pipeline = EmbeddingPipeline(
+        embeddings,
+        batch_size=64,  # Chunks pro Embedding-Anfrage
+        max_in_flight=4,  # Gleichzeitige Embedding-Anfragen
+        requests_per_second=None,  # Optionales Limit für Anfragen pro Sekunde
+    )
+    
+    # Nur neue oder geänderte Chunks einbetten, verschwundene Quellen löschen
+    print("\n--- Creating embeddings and syncing vector store ---")
+    stats = incremental_ingest(db, sources, text_splitter, manifest_path, pipeline=pipeline, workers=workers)
+    print_ingest_stats(stats)
+    embeddings.print_stats()  # Treffer/Fehlschläge des Embedding-Caches
+    
+    # Lexikalischen Index aus den gespeicherten Chunks aufbauen (keine Embedding-Aufrufe)
+    bm25 = BM25Index.build_from_chroma(db, bm25_path_for(persistent_directory))
+    print(f"BM25 index: {len(bm25)} chunks, {len(bm25.vocab)} terms")
+    print("\n--- Vector store synced and persisted ---")
 
 else:
     print("Vector store already exists. No need to initialize.")  # Meldung, wenn Datenbank bereits existiert
+    print("Run with --incremental to sync changed documents.")
 
 # Befehl zum Ausführen des Skripts in einer Docker-Umgebung
-# docker-compose run --rm app langchain/4_RAGs/2a_rag_basics_metadata.py 
\ No newline at end of file
+# docker-compose run --rm app langchain/4_RAGs/2a_rag_basics_metadata.py
+# docker-compose run --rm app langchain/4_RAGs/2a_rag_basics_metadata.py --incremental
+# docker-compose run --rm app langchain/4_RAGs/2a_rag_basics_metadata.py --incremental --parallel
+# docker-compose run --rm app langchain/4_RAGs/2a_rag_basics_metadata.py --shards source 
\ No newline at end of file
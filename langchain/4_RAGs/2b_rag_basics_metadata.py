@@ -1,13 +1,19 @@
-from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
 import os
+import sys
+
+from bm25_index import HybridRetriever, load_bm25_index
+from embedding_batcher import BatchingEmbeddings
+from embedding_cache import CachedEmbeddings
+from reranking import DEFAULT_FETCH_K, RerankingRetriever, load_reranker
+from vector_store import load_vector_store
 
 """
 RAG (Retrieval Augmented Generation) mit Metadaten - Abfragephase
 
 Dieses Skript demonstriert die Abfragefunktionalität eines RAG-Systems mit Metadaten:
 - Laden einer existierenden Chroma-Vektordatenbank mit Metadaten
-- Konfiguration eines Retrievers mit Schwellenwert-basierter Ähnlichkeitssuche
+- Konfiguration eines hybriden Retrievers (BM25 + Schwellenwert-basierte Ähnlichkeitssuche, siehe bm25_index.py)
 - Durchführung einer semantischen Suche mit einer Benutzerabfrage
 - Anzeige der relevanten Dokumentenabschnitte mit Quellenangaben aus den Metadaten
 
@@ -18,6 +24,9 @@ Verwendete Parameter:
 - Embedding-Modell: text-embedding-3-small (OpenAI)
 - Maximale Anzahl zurückgegebener Dokumente: 3
 - Minimaler Ähnlichkeitsschwellenwert: 0.2 (20%)
+- Retriever: 'hybrid' (Standard) oder 'dense', per Umgebungsvariable RAG_RETRIEVER
+- Optionales Re-Ranking der Vektorsuche ('dense'): 20 Kandidaten, die besten 3 bleiben (RAG_RERANKER, siehe reranking.py)
+- Optionaler Quellen-Filter: --source Dracula.txt
 - Beispielabfrage: "Where is Dracula's castle located?"
 """
 
@@ -28,30 +37,58 @@ db_dir = os.path.join(current_dir, "db")  # Übergeordnetes Verzeichnis für die
 persistent_directory = os.path.join(db_dir, "chroma_db_with_metadata")  # Speicherort der Vektordatenbank mit Metadaten
 
 # Define the embedding model
-embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-small",  # Verwende das gleiche Embedding-Modell wie bei der Erstellung
+embeddings = CachedEmbeddings(
+    BatchingEmbeddings(  # Gleichzeitige Abfragen werden zu einer Embedding-Anfrage gebündelt (siehe embedding_batcher.py)
+        OpenAIEmbeddings(
+            model="text-embedding-3-small",  # Verwende das gleiche Embedding-Modell wie bei der Erstellung
+        ),
+    ),
+    cache_dir=os.path.join(current_dir, "db", "embedding_cache"),  # Gemeinsamer lokaler Embedding-Cache aller 4_RAGs-Skripte
 )
 
 # Load the existing vector store with the embedding function
-db = Chroma(
-    embedding_function=embeddings,  # Verwende die gleiche Embedding-Funktion wie bei der Erstellung
-    persist_directory=persistent_directory,  # Lade die Datenbank aus dem Speicherort
+# (Chroma oder lokale NumPy-Suche, per Umgebungsvariable RAG_VECTOR_STORE=chroma|bruteforce|ivf|int8|binary)
+db = load_vector_store(
+    persistent_directory,  # Lade die Datenbank aus dem Speicherort
+    embeddings,  # Verwende die gleiche Embedding-Funktion wie bei der Erstellung
 )
 
 # Define the user's query
 query = "Where is Dracula's castle located?"  # Beispielabfrage zum Testen der Metadaten-Funktion
 
+# Optionaler Metadaten-Filter, z.B. --source Dracula.txt (wird vor der Vektorsuche ausgewertet)
+search_filter = {"source": sys.argv[sys.argv.index("--source") + 1]} if "--source" in sys.argv else None
+
 # Retrive relevant documents based on the query
-retrieved = db.as_retriever(
-    search_type="similarity_score_threshold",  # Verwende Schwellenwert-basierte Ähnlichkeitssuche
-    search_kwargs={"k": 3, "score_threshold": 0.2},  # Maximal 3 Dokumente mit mindestens 20% Ähnlichkeit (niedriger Schwellenwert für breitere Ergebnisse)
-)
+if os.environ.get("RAG_RETRIEVER", "hybrid") == "hybrid":
+    # BM25 zuerst; die Vektorsuche läuft nur, wenn die lexikalischen Treffer schwach sind
+    retrieved = HybridRetriever(
+        vector_store=db,
+        bm25=load_bm25_index(persistent_directory),  # Lexikalischer Index neben der Vektordatenbank
+        k=3,  # Maximal 3 Dokumente
+        score_threshold=0.2,  # Mindestens 20% Ähnlichkeit für Treffer der Vektorsuche
+        filter=search_filter,  # Nur Chunks aus der gewählten Quelle
+    )
+else:
+    # Der hybride Retriever gewichtet Wörter bereits über BM25; neu bewertet wird nur die reine Vektorsuche
+    reranker = load_reranker(db_dir)
+    retrieved = db.as_retriever(
+        search_type="similarity_score_threshold",  # Verwende Schwellenwert-basierte Ähnlichkeitssuche
+        search_kwargs={"k": DEFAULT_FETCH_K if reranker else 3, "score_threshold": 0.2, "filter": search_filter},  # Maximal 3 Dokumente (bzw. 20 Kandidaten für das Re-Ranking) mit mindestens 20% Ähnlichkeit (niedriger Schwellenwert für breitere Ergebnisse)
+    )
+    if reranker:
+        retrieved = RerankingRetriever(base_retriever=retrieved, reranker=reranker, k=3)  # Die besten 3 Kandidaten
 relevant_docs = retrieved.invoke(query)  # Führe die Abfrage durch und erhalte relevante Dokumente
 
 print("\n--- Relevant documents ---")
 for i, doc in enumerate(relevant_docs, 1):  # Durchlaufe alle gefundenen relevanten Dokumente
     print(f"\nDocument {i}: {doc.page_content}")  # Zeige den Inhalt des Dokuments an
     print(f"Source: {doc.metadata['source']}")  # Zeige die Quelle aus den Metadaten an (direkte Indizierung statt get)
+    if "retrieval" in doc.metadata:
+        print(f"Retrieval: {doc.metadata['retrieval']}")  # 'bm25', 'dense' oder 'hybrid' (beide Ranglisten)
+
+embeddings.print_stats()  # Treffer/Fehlschläge des Embedding-Caches
 
 # Befehl zum Ausführen des Skripts in einer Docker-Umgebung
-# docker-compose run --rm app langchain/4_RAGs/2b_rag_basics_metadata.py 
\ No newline at end of file
+# docker-compose run --rm app langchain/4_RAGs/2b_rag_basics_metadata.py
+# docker-compose run --rm app langchain/4_RAGs/2b_rag_basics_metadata.py --source Dracula.txt 
\ No newline at end of file
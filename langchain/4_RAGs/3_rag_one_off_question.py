@@ -1,7 +1,19 @@
-from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from context_packing import TokenCounter, pack_context, print_packing_stats
+from embedding_batcher import BatchingEmbeddings
+from embedding_cache import CachedEmbeddings
+from reranking import DEFAULT_FETCH_K, load_reranker
+from semantic_cache import SemanticCache, index_version
+from vector_store import load_vector_store
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "1_chat_moddels"))
+from streaming import stream_response  # Gestreamte Ausgabe mit TTFT und Tokens pro Sekunde
 
 """
 RAG (Retrieval Augmented Generation) mit LLM-Integration - Vollständige Implementierung
@@ -26,7 +38,17 @@ Im Unterschied zu früheren Beispielen:
 Verwendete Komponenten:
 - Embedding-Modell: text-embedding-3-small (OpenAI)
 - LLM-Modell: gpt-4o-mini (OpenAI)
-- Retriever-Konfiguration: Ähnlichkeitssuche mit k=1 (ein relevantes Dokument)
+- Retriever-Konfiguration: Ähnlichkeitssuche mit k=1 (ein relevantes Dokument), optional mit --source gefiltert
+- Optionales Re-Ranking: 20 Kandidaten abrufen, lokal neu bewerten, nur der beste kommt in den Prompt
+  (RAG_RERANKER=lexical|cross-encoder, Standard none, siehe reranking.py)
+- Kontext-Aufbereitung: benachbarte Chunks zusammenführen, Duplikate entfernen, Token-Budget 800
+  (Obergrenze; bei k=1 bleibt der Prompt so kurz wie bisher)
+  (siehe context_packing.py)
+- Streaming der Antwort (Standard, --no-stream schaltet ab) mit Ausgabe von TTFT und Tokens pro Sekunde;
+  LLM-Client und Tokenizer werden parallel zum Retrieval vorbereitet
+- Micro-Batching der Abfrage-Embeddings (RAG_EMBED_BATCH_WAIT_MS, siehe embedding_batcher.py)
+- Semantischer Antwort-Cache: ähnliche Frage + gleiche Chunks = gespeicherte Antwort ohne LLM-Aufruf
+  (siehe semantic_cache.py)
 """
 
 # Initialisierung des LLM-Modells
@@ -36,25 +58,59 @@ db_dir = os.path.join(current_dir, "db")  # Übergeordnetes Verzeichnis für die
 persistent_directory = os.path.join(db_dir, "chroma_db_with_metadata")  # Speicherort der Vektordatenbank mit Metadaten
 
 # Define the embedding model
-embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-small",  # Verwende das gleiche Embedding-Modell wie bei der Erstellung
+embeddings = CachedEmbeddings(
+    BatchingEmbeddings(  # Gleichzeitige Abfragen werden zu einer Embedding-Anfrage gebündelt (siehe embedding_batcher.py)
+        OpenAIEmbeddings(
+            model="text-embedding-3-small",  # Verwende das gleiche Embedding-Modell wie bei der Erstellung
+        ),
+    ),
+    cache_dir=os.path.join(current_dir, "db", "embedding_cache"),  # Gemeinsamer lokaler Embedding-Cache aller 4_RAGs-Skripte
 )
 
 # Load the existing vector store with the embedding function
-db = Chroma(
-    embedding_function=embeddings,  # Verwende die gleiche Embedding-Funktion wie bei der Erstellung
-    persist_directory=persistent_directory,  # Lade die Datenbank aus dem Speicherort
+# (Chroma oder lokale NumPy-Suche, per Umgebungsvariable RAG_VECTOR_STORE=chroma|bruteforce|ivf|int8|binary)
+db = load_vector_store(
+    persistent_directory,  # Lade die Datenbank aus dem Speicherort
+    embeddings,  # Verwende die gleiche Embedding-Funktion wie bei der Erstellung
 )
 
 # Define the user's query
 query = "Where is Dracula's castle located?"  # Beispielabfrage zum Testen der Metadaten-Funktion
+if "--query" in sys.argv:  # Eigene Frage, z.B. über 'runner.py ask ...'
+    query = sys.argv[sys.argv.index("--query") + 1]
 
-# Retrive relevant documents based on the query
-retrieved = db.as_retriever(
-    search_type="similarity",  # Verwende Schwellenwert-basierte Ähnlichkeitssuche
-    search_kwargs={"k": 1},  # Maximal 3 Dokumente mit mindestens 20% Ähnlichkeit (niedriger Schwellenwert für breitere Ergebnisse)
+# Optionaler Metadaten-Filter, z.B. --source Dracula.txt (wird vor der Vektorsuche ausgewertet)
+search_filter = {"source": sys.argv[sys.argv.index("--source") + 1]} if "--source" in sys.argv else None
+
+# Semantischer Antwort-Cache; wird bei jeder Änderung des Index automatisch geleert
+answer_cache = SemanticCache(
+    os.path.join(db_dir, "semantic_cache.sqlite"),
+    index_version(persistent_directory),
+    threshold=0.95,  # Mindest-Kosinus-Ähnlichkeit zur gespeicherten Frage
 )
-relevant_docs = retrieved.invoke(query)  # Führe die Abfrage durch und erhalte relevante Dokumente
+
+stream = "--no-stream" not in sys.argv  # Streaming-Modus (Standard)
+
+# Optionales Re-Ranking der Kandidaten (None, wenn RAG_RERANKER=none)
+reranker = load_reranker(db_dir)
+
+start = time.perf_counter()
+# LLM-Client und Tokenizer im Hintergrund vorbereiten, während das Retrieval läuft
+preparation = ThreadPoolExecutor(max_workers=2)
+model_future = preparation.submit(ChatOpenAI, model="gpt-4o-mini", stream_usage=True)
+token_counter_future = preparation.submit(TokenCounter, "gpt-4o-mini")  # Lädt die tiktoken-Kodierung
+
+# Die Abfrage nur einmal einbetten: der Vektor dient für Retrieval und Cache-Schlüssel
+query_embedding = embeddings.embed_query(query)
+
+# Retrive relevant documents based on the query
+if reranker:
+    candidates = db.similarity_search_by_vector(query_embedding, k=DEFAULT_FETCH_K, filter=search_filter)  # Mehr Kandidaten abrufen
+    relevant_docs = reranker.rerank(query, candidates, k=1)  # Nur der beste Chunk geht in den Prompt
+else:
+    relevant_docs = db.similarity_search_by_vector(query_embedding, k=1, filter=search_filter)  # Ähnlichkeitssuche, ein Dokument
+chunk_ids = [doc.id for doc in relevant_docs]
+retrieval_ms = (time.perf_counter() - start) * 1000
 """
 print("\n--- Relevant documents ---")
 for i, doc in enumerate(relevant_docs, 1):  # Durchlaufe alle gefundenen relevanten Dokumente
@@ -62,23 +118,55 @@ for i, doc in enumerate(relevant_docs, 1):  # Durchlaufe alle gefundenen relevan
     print(f"Source: {doc.metadata['source']}")  # Zeige die Quelle aus den Metadaten an (direkte Indizierung statt get)
 """
 
-combined_input = (
-    "Here are some documents that might help answer the question: "
-    + query
-    + "\n\n Relevant documents: "
-    + "\n".join([doc.page_content for doc in relevant_docs])
-    + "\n\n Please provide a rough answer based only on the provided documents. If the answer ist not in the documents, respond with 'Not provided in the documents'."
-)
+cached_answer = answer_cache.lookup(query_embedding, chunk_ids)
+if cached_answer is not None:
+    print(cached_answer)
+    print(f"\n(answer from semantic cache in {(time.perf_counter() - start) * 1000:.1f}ms)")
+else:
+    # Benachbarte Chunks zusammenführen, Überlappung und Duplikate entfernen, bis zum Token-Budget packen
+    passages, packing_stats = pack_context(
+        relevant_docs,
+        token_budget=800,  # Maximale Tokens für die Dokumente im Prompt
+        token_counter=token_counter_future.result(),  # Lokaler Tokenizer des Antwortmodells
+    )
+    print_packing_stats(packing_stats)
+
+    combined_input = (
+        "Here are some documents that might help answer the question: "
+        + query
+        + "\n\n Relevant documents: "
+        + "\n".join([passage["text"] for passage in passages])
+        + "\n\n Please provide a rough answer based only on the provided documents. If the answer ist not in the documents, respond with 'Not provided in the documents'."
+    )
+
+    model = model_future.result()
+
+    message = [
+        SystemMessage(content="You are a helpful assistant."),
+        HumanMessage(content=combined_input),
+    ]
 
-model = ChatOpenAI(model="gpt-4o-mini")
+    if stream:
+        # Tokens ausgeben, sobald sie erzeugt werden; TTFT wird ab Beginn der Anfrage gemessen
+        result = stream_response(model, message, start=start)
+        print(f"(retrieval {retrieval_ms:.0f}ms, total {(time.perf_counter() - start) * 1000:.0f}ms)")
+    else:
+        result = model.invoke(message)
+        print(result.content)
+        print(f"\n(answer from LLM in {(time.perf_counter() - start) * 1000:.1f}ms)")
+    tokens = (result.usage_metadata or {}).get("total_tokens", 0)  # Für die Statistik eingesparter Tokens
+    if result.content:  # Leere Antworten (z.B. abgebrochener Stream) nicht zwischenspeichern
+        answer_cache.put(query, query_embedding, chunk_ids, result.content, tokens)
 
-message = [
-    SystemMessage(content="You are a helpful assistant."),
-    HumanMessage(content=combined_input),
-]
+preparation.shutdown(wait=False)
 
-result = model.invoke(message)
-print(result.content)
+answer_cache.print_stats()  # Trefferquote und eingesparte Tokens über alle Läufe
+embeddings.print_stats()  # Treffer/Fehlschläge des Embedding-Caches
+if reranker:
+    reranker.print_stats()  # Neu bewertete und aus dem Cache gelesene Paare
 
 # Befehl zum Ausführen des Skripts in einer Docker-Umgebung
-# docker-compose run --rm app langchain/4_RAGs/3_rag_one_off_question.py
\ No newline at end of file
+# docker-compose run --rm app langchain/4_RAGs/3_rag_one_off_question.py
+# docker-compose run --rm app langchain/4_RAGs/3_rag_one_off_question.py --source Dracula.txt
+# docker-compose run --rm app langchain/4_RAGs/3_rag_one_off_question.py --no-stream
+# docker-compose run --rm app langchain/4_RAGs/3_rag_one_off_question.py --query "Who is Captain Ahab?"
\ No newline at end of file
@@ -0,0 +1,268 @@
+"""
+BM25-Index und hybride Suche (BM25 + Vektorsuche) mit Reciprocal Rank Fusion
+
+Eigennamen wie "Dracula" oder "Transylvania" findet eine lexikalische Suche oft zuverlässiger
+als eine reine Embedding-Suche. Dieses Modul stellt dafür bereit:
+- BM25Index: kompakter invertierter Index (Term -> Postings mit Termfrequenz) als NumPy-Arrays
+- Aufbau während der Ingestion aus den Chunks der Chroma-Collection (ohne Embedding-Aufrufe)
+- Metadaten-Filter (Chroma-Syntax) über einen eigenen MetadataIndex (metadata_index.py): nur passende
+  Chunks konkurrieren um die Top-k, statt die globalen Top-k nachträglich zu filtern
+- HybridRetriever: BM25 zuerst; die Vektorsuche läuft nur, wenn das lexikalische Ergebnis schwach ist.
+  Beide Ranglisten werden dann per Reciprocal Rank Fusion (RRF) zusammengeführt.
+
+Eine lexikalische Abfrage braucht keinen Embedding-Aufruf und dauert auf dem Beispielkorpus
+weniger als eine Millisekunde.
+"""
+import json  # Für Vokabular und Parameter
+import os  # Für Dateisystem-Operationen
+from collections import Counter  # Für die Termfrequenzen
+from typing import Optional
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from metadata_index import MetadataIndex
+from text_utils import tokenize
+
+BM25_DIRNAME = "bm25"  # Unterverzeichnis neben der Chroma-Collection
+
+
+class BM25Index:
+    """
+    Invertierter Index mit BM25-Scoring.
+
+    Die Postings aller Terme liegen hintereinander in zwei Arrays (Dokumentnummer, Termfrequenz);
+    term_offsets[t]:term_offsets[t + 1] ist der Bereich von Term t.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "params.json"), "r", encoding="utf-8") as f:
+            params = json.load(f)
+        self.k1, self.b, self.avgdl = params["k1"], params["b"], params["avgdl"]
+        with open(os.path.join(path, "vocab.json"), "r", encoding="utf-8") as f:
+            self.vocab = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, "ids.json"), "r", encoding="utf-8") as f:
+            self.ids = json.load(f)
+        self.postings_docs = np.load(os.path.join(path, "postings_docs.npy"), mmap_mode="r")
+        self.postings_tf = np.load(os.path.join(path, "postings_tf.npy"), mmap_mode="r")
+        self.term_offsets = np.load(os.path.join(path, "term_offsets.npy"))
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"))
+        self.idf = np.load(os.path.join(path, "idf.npy"))
+        # Ältere Indizes ohne Metadaten können nicht gefiltert werden (load_bm25_index baut sie neu)
+        has_metadata = all(os.path.exists(os.path.join(path, name)) for name in MetadataIndex.files)
+        self.metadata_index = MetadataIndex(path) if has_metadata else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, path, chunks, k1=1.5, b=0.75):
+        """
+        Baut den Index aus (ID, Text, Metadaten)-Tupeln und speichert ihn in 'path'.
+
+        Zwischenspeicher sind Arrays pro Term, nicht pro Chunk; die Chunk-Texte selbst
+        werden nicht aufbewahrt. Die Metadaten landen im MetadataIndex für gefilterte Suchen.
+        """
+        vocab = {}
+        term_docs, term_tfs = [], []
+        ids, doc_lengths, metadatas = [], [], []
+        for doc_index, (doc_id, text, metadata) in enumerate(chunks):
+            tokens = tokenize(text)
+            ids.append(doc_id)
+            metadatas.append(metadata)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                term_id = vocab.setdefault(term, len(vocab))
+                if term_id == len(term_docs):
+                    term_docs.append([])
+                    term_tfs.append([])
+                term_docs[term_id].append(doc_index)
+                term_tfs[term_id].append(tf)
+
+        n_docs = len(ids)
+        doc_freq = np.array([len(docs) for docs in term_docs], dtype=np.int64)
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=term_offsets[1:])
+        postings_docs = np.fromiter(
+            (d for docs in term_docs for d in docs), dtype=np.int32, count=int(term_offsets[-1])
+        )
+        postings_tf = np.fromiter(
+            (min(tf, 65535) for tfs in term_tfs for tf in tfs), dtype=np.uint16, count=int(term_offsets[-1])
+        )
+        idf = np.log(1.0 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "postings_docs.npy"), postings_docs)
+        np.save(os.path.join(path, "postings_tf.npy"), postings_tf)
+        np.save(os.path.join(path, "term_offsets.npy"), term_offsets)
+        np.save(os.path.join(path, "doc_lengths.npy"), np.array(doc_lengths, dtype=np.int32))
+        np.save(os.path.join(path, "idf.npy"), idf)
+        MetadataIndex.build(path, metadatas)
+        with open(os.path.join(path, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(list(vocab), f)
+        with open(os.path.join(path, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(ids, f)
+        avgdl = float(np.mean(doc_lengths)) if doc_lengths else 0.0
+        with open(os.path.join(path, "params.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": k1, "b": b, "avgdl": avgdl, "documents": n_docs, "terms": len(vocab)}, f)
+        return cls(path)
+
+    @classmethod
+    def build_from_chroma(cls, db, path, page_size=5000, **kwargs):
+        """Baut den Index seitenweise aus den in Chroma gespeicherten Chunks."""
+        def chunks():
+            offset = 0
+            while True:
+                page = db.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+                if not page["ids"]:
+                    return
+                yield from zip(page["ids"], page["documents"], page["metadatas"])
+                offset += len(page["ids"])
+        return cls.build(path, chunks(), **kwargs)
+
+    def max_score(self, query):
+        """Höchstmöglicher Score für die Abfrage (alle Terme mit hoher Frequenz im Chunk)."""
+        term_ids = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        return float(self.idf[term_ids].sum() * (self.k1 + 1)) if term_ids else 0.0
+
+    def search(self, query, k=4, filter=None):
+        """Liefert [(Chunk-ID, BM25-Score)] absteigend sortiert, optional nur Chunks passend zum Metadaten-Filter."""
+        term_ids = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        if not term_ids or k <= 0:
+            return []
+        docs, contributions = [], []
+        for term_id in term_ids:
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            doc_index = np.asarray(self.postings_docs[start:end])
+            tf = np.asarray(self.postings_tf[start:end], dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_index] / self.avgdl)
+            docs.append(doc_index)
+            contributions.append(self.idf[term_id] * tf * (self.k1 + 1) / (tf + norm))
+        docs = np.concatenate(docs)
+        # Scores nur für Chunks berechnen, die mindestens einen Abfrageterm enthalten
+        candidates, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        if filter:
+            if self.metadata_index is None:
+                raise ValueError(f"BM25 index in {self.path} has no metadata index; rebuild it to use filters")
+            allowed = self.metadata_index.mask(filter)[candidates]  # Vor der Top-k-Auswahl filtern
+            candidates, scores = candidates[allowed], scores[allowed]
+            if not len(candidates):
+                return []
+        k = min(k, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(self.ids[candidates[i]], float(scores[i])) for i in best]
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    """Führt mehrere Ranglisten von IDs zusammen: score(d) = Σ 1 / (rrf_k + Rang)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Hybrider Retriever: BM25 + Vektorsuche, zusammengeführt per Reciprocal Rank Fusion.
+
+    Die Vektorsuche (und damit der Embedding-Aufruf) wird übersprungen, wenn BM25 mindestens
+    k Treffer hat und der beste Treffer mindestens 'dense_threshold' des höchstmöglichen
+    BM25-Scores der Abfrage erreicht.
+    """
+
+    vector_store: object
+    bm25: object
+    k: int = 3
+    fetch_k: int = 20  # Kandidaten pro Rangliste vor der Fusion
+    rrf_k: int = 60
+    dense_threshold: float = 0.5
+    score_threshold: float = 0.0  # Mindest-Relevanz für Treffer der Vektorsuche
+    filter: Optional[dict] = None  # Metadaten-Filter in Chroma-Syntax, z.B. {"source": "Dracula.txt"}
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        lexical = self.bm25.search(query, self.fetch_k, filter=self.filter)
+        lexical_ids = [doc_id for doc_id, _ in lexical]
+        max_score = self.bm25.max_score(query)
+        confident = (
+            len(lexical) >= self.k and max_score > 0 and lexical[0][1] / max_score >= self.dense_threshold
+        )
+        if confident:
+            return self._documents(lexical_ids[:self.k], "bm25")
+
+        dense = self.vector_store.similarity_search_with_relevance_scores(
+            query, k=self.fetch_k, score_threshold=self.score_threshold, filter=self.filter
+        )
+        dense_docs = {doc.id: doc for doc, _ in dense}
+        fused = reciprocal_rank_fusion([lexical_ids, list(dense_docs)], self.rrf_k)[:self.k]
+        # Nur die Treffer, die ausschließlich BM25 geliefert hat, müssen noch geladen werden
+        by_id = self._by_id([doc_id for doc_id in fused if doc_id not in dense_docs])
+        by_id.update(dense_docs)
+        lexical_set = set(lexical_ids)
+        return [
+            self._tagged(by_id[doc_id], "hybrid" if doc_id in lexical_set and doc_id in dense_docs
+                         else "bm25" if doc_id in lexical_set else "dense")
+            for doc_id in fused if doc_id in by_id
+        ]
+
+    def _by_id(self, ids):
+        return {doc.id: doc for doc in self.vector_store.get_by_ids(ids)} if ids else {}
+
+    def _documents(self, ids, retrieval):
+        by_id = self._by_id(ids)
+        return [self._tagged(by_id[doc_id], retrieval) for doc_id in ids if doc_id in by_id]
+
+    @staticmethod
+    def _tagged(doc, retrieval):
+        """Kopie des Dokuments mit der Herkunft des Treffers im Metadatum 'retrieval'."""
+        return Document(id=doc.id, page_content=doc.page_content, metadata={**(doc.metadata or {}), "retrieval": retrieval})
+
+
+def bm25_path_for(persistent_directory):
+    """Pfad des BM25-Index neben der Chroma-Collection."""
+    return os.path.join(persistent_directory, BM25_DIRNAME)
+
+
+def load_bm25_index(persistent_directory, db=None):
+    """
+    Öffnet den BM25-Index einer Chroma-Datenbank.
+
+    Fehlt der Index (oder sein Metadaten-Index) oder ist die Ingestion seitdem gelaufen, wird er aus den gespeicherten
+    Chunks neu gebaut (ohne Embedding-Aufrufe).
+    """
+    path = bm25_path_for(persistent_directory)
+    params_path = os.path.join(path, "params.json")
+    manifest_path = os.path.join(persistent_directory, "ingest_manifest.json")
+    has_metadata = all(os.path.exists(os.path.join(path, name)) for name in MetadataIndex.files)
+    if not os.path.exists(params_path) or not has_metadata or (
+        os.path.exists(manifest_path) and os.path.getmtime(manifest_path) > os.path.getmtime(params_path)
+    ):
+        if db is None:
+            from langchain_chroma import Chroma  # Nur zum Neuaufbau nötig
+            db = Chroma(persist_directory=persistent_directory)
+        print(f"Building BM25 index in {path}...")
+        return BM25Index.build_from_chroma(db, path)
+    return BM25Index(path)
+
+
+if __name__ == "__main__":
+    # Lexikalische Suche ohne Embedding-Aufruf, mit Latenzmessung
+    import sys
+    import time
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    index = BM25Index(bm25_path_for(os.path.join(current_dir, "db", "chroma_db_with_metadata")))
+    query = " ".join(sys.argv[1:]) or "Where is Dracula's castle located?"
+    start = time.perf_counter()
+    results = index.search(query, k=5)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{len(index)} chunks, query {query!r} answered in {elapsed:.3f}ms")
+    for doc_id, score in results:
+        print(f"{score:8.3f}  {doc_id}")
+
+# docker-compose run --rm app langchain/4_RAGs/bm25_index.py "Where is Dracula's castle located?"
@@ -0,0 +1,242 @@
+"""
+Kompakter, spaltenorientierter Chunk-Speicher (Texte, IDs und Metadaten ohne Python-Objekte pro Chunk)
+
+Statt einer Liste von Documents (bzw. einer chunks.jsonl, die komplett in Python-Listen geladen wird)
+liegen die Chunks in wenigen Dateien, die per mmap gelesen werden:
+- chunks_text.bin / chunks_text_offsets.npy: alle Texte hintereinander als UTF-8, Chunk i = Bytes [o[i], o[i+1])
+- chunks_ids.bin / chunks_ids_offsets.npy: die IDs nach demselben Schema
+- chunks_metadata.npz / chunks_metadata.json: Metadaten spaltenweise
+  - Ganzzahlen (z.B. 'chunk_index') als int64-Spalte
+  - alle anderen Werte (z.B. 'source') dictionary-kodiert: int32-Codes + Liste der verschiedenen Werte
+  - fehlende Schlüssel: Code -1 bzw. MISSING_INT
+
+Documents entstehen erst beim Zugriff auf eine Zeile (z.B. für die k Treffer einer Suche);
+der Text wird dabei direkt aus der Memory-Map geschnitten. Der Speicherbedarf im Prozess hängt
+damit nicht mehr von der Korpusgröße ab. Beim Schreiben werden die Chunks gestreamt.
+"""
+import json  # Für die Wertelisten der Metadaten
+import mmap  # Für den Zugriff auf die Textpuffer
+import os  # Für Dateisystem-Operationen
+from array import array  # Kompakte Puffer beim Schreiben
+
+import numpy as np
+from langchain_core.documents import Document
+
+MISSING_INT = np.iinfo(np.int64).min  # Markiert fehlende Ganzzahlen
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class _BufferWriter:
+    """Schreibt Strings hintereinander in eine Datei und merkt sich die Byte-Offsets."""
+
+    def __init__(self, path):
+        self._file = open(path, "wb")
+        self.offsets = array("q", [0])
+
+    def append(self, text):
+        data = text.encode("utf-8")
+        self._file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self, offsets_path):
+        self._file.close()
+        np.save(offsets_path, np.frombuffer(self.offsets, dtype=np.int64))
+
+
+class _Buffer:
+    """Gelesener Puffer: Zeile i als String, per Slice aus der Memory-Map."""
+
+    def __init__(self, path, offsets_path):
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        with open(path, "rb") as f:
+            # Leere Dateien lassen sich nicht mappen
+            self._view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)) if os.path.getsize(path) else b""
+
+    def __getitem__(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return str(self._view[start:end], "utf-8")
+
+
+class ChunkStore:
+    """
+    Chunks (ID, Text, Metadaten) als Puffer mit Offsets und dictionary-kodierten Metadatenspalten.
+
+    Args:
+        path: Verzeichnis mit den Dateien aus ChunkStore.files
+    """
+
+    files = (
+        "chunks_text.bin", "chunks_text_offsets.npy", "chunks_ids.bin", "chunks_ids_offsets.npy",
+        "chunks_metadata.npz", "chunks_metadata.json",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._texts = _Buffer(os.path.join(path, "chunks_text.bin"), os.path.join(path, "chunks_text_offsets.npy"))
+        self._ids = _Buffer(os.path.join(path, "chunks_ids.bin"), os.path.join(path, "chunks_ids_offsets.npy"))
+        with open(os.path.join(path, "chunks_metadata.json"), "r", encoding="utf-8") as f:
+            schema = json.load(f)
+        self.count = schema["count"]
+        self._keys = schema["keys"]  # Schlüssel in der ursprünglichen Reihenfolge
+        self._values = schema["values"]  # Schlüssel -> Liste der verschiedenen Werte
+        with np.load(os.path.join(path, "chunks_metadata.npz")) as columns:
+            self._columns = {name: columns[f"c{i}"] for i, name in enumerate(schema["columns"])}
+        self._rows = None  # ID -> Zeile, erst bei Bedarf aufgebaut
+
+    @staticmethod
+    def build(path, chunks):
+        """
+        Schreibt einen Chunk-Speicher aus einem Iterator von (ID, Text, Metadaten), ohne alle Chunks im Speicher zu halten.
+
+        Returns:
+            Anzahl geschriebener Chunks
+        """
+        os.makedirs(path, exist_ok=True)
+        texts = _BufferWriter(os.path.join(path, "chunks_text.bin"))
+        ids = _BufferWriter(os.path.join(path, "chunks_ids.bin"))
+        keys = {}  # Schlüssel -> Reihenfolge des ersten Auftretens
+        codes, ints, dictionaries = {}, {}, {}
+        count = 0
+        for doc_id, text, metadata in chunks:
+            ids.append(doc_id)
+            texts.append(text)
+            for key, value in (metadata or {}).items():
+                keys.setdefault(key, len(keys))
+                if _is_int(value):
+                    column = ints.get(key)
+                    if column is None:
+                        column = ints[key] = array("q", [MISSING_INT]) * count  # Frühere Zeilen ohne Wert
+                    column.extend([MISSING_INT] * (count - len(column)))
+                    column.append(value)
+                else:
+                    column = codes.get(key)
+                    if column is None:
+                        column = codes[key] = array("i", [-1]) * count
+                        dictionaries[key] = {}
+                    column.extend([-1] * (count - len(column)))
+                    encoded = json.dumps(value)
+                    column.append(dictionaries[key].setdefault(encoded, len(dictionaries[key])))
+            count += 1
+        texts.close(os.path.join(path, "chunks_text_offsets.npy"))
+        ids.close(os.path.join(path, "chunks_ids_offsets.npy"))
+
+        columns = {}
+        for key, column in codes.items():
+            column.extend([-1] * (count - len(column)))
+            columns[f"codes:{key}"] = np.frombuffer(column, dtype=np.int32)
+        for key, column in ints.items():
+            column.extend([MISSING_INT] * (count - len(column)))
+            columns[f"int:{key}"] = np.frombuffer(column, dtype=np.int64)
+        # Spalten über ihre Position ansprechen: Schlüssel dürfen beliebige Zeichen enthalten
+        np.savez(os.path.join(path, "chunks_metadata.npz"), **{f"c{i}": a for i, a in enumerate(columns.values())})
+        schema = {
+            "count": count,
+            "keys": list(keys),
+            "columns": list(columns),
+            "values": {key: [json.loads(v) for v in dictionary] for key, dictionary in dictionaries.items()},
+        }
+        with open(os.path.join(path, "chunks_metadata.json"), "w", encoding="utf-8") as f:
+            json.dump(schema, f)
+        return count
+
+    def __len__(self):
+        return self.count
+
+    def _column(self, kind, key):
+        return self._columns.get(f"{kind}:{key}")
+
+    def id(self, row):
+        return self._ids[row]
+
+    def text(self, row):
+        return self._texts[row]
+
+    def metadata(self, row):
+        metadata = {}
+        for key in self._keys:
+            codes = self._column("codes", key)
+            if codes is not None and codes[row] >= 0:
+                metadata[key] = self._values[key][codes[row]]
+                continue
+            ints = self._column("int", key)
+            if ints is not None and ints[row] != MISSING_INT:
+                metadata[key] = int(ints[row])
+        return metadata
+
+    def values(self, key):
+        """Verschiedene (dictionary-kodierte) Werte eines Schlüssels, ohne die Zeilen zu lesen."""
+        return list(self._values.get(key, []))
+
+    def document(self, row):
+        """Document für eine Zeile (wird erst hier erzeugt)."""
+        return Document(id=self.id(row), page_content=self.text(row), metadata=self.metadata(row))
+
+    def row(self, doc_id):
+        """Zeile einer ID oder None."""
+        if self._rows is None:
+            self._rows = {self.id(row): row for row in range(self.count)}
+        return self._rows.get(doc_id)
+
+    def iter_ids(self):
+        return (self.id(row) for row in range(self.count))
+
+    def iter_texts(self):
+        return (self.text(row) for row in range(self.count))
+
+    def iter_metadatas(self):
+        return (self.metadata(row) for row in range(self.count))
+
+    def nbytes(self):
+        """Größe der Dateien auf der Festplatte."""
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in self.files)
+
+
+def migrate_jsonl(path):
+    """Wandelt eine chunks.jsonl (ältere Exporte von LocalVectorStore) gestreamt in einen ChunkStore um."""
+    jsonl_path = os.path.join(path, "chunks.jsonl")
+
+    def chunks():
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            for line in f:
+                chunk = json.loads(line)
+                yield chunk["id"], chunk["text"], chunk["metadata"]
+
+    ChunkStore.build(path, chunks())
+    os.remove(jsonl_path)
+
+
+if __name__ == "__main__":
+    # Speicherbedarf: chunks.jsonl in Python-Listen gegenüber dem ChunkStore
+    import sys
+    import time
+    import tracemalloc
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "db", "chroma_db_with_metadata_local"
+    )
+    store = ChunkStore(path)
+    tracemalloc.start()
+    ids = list(store.iter_ids())
+    texts = list(store.iter_texts())
+    metadatas = list(store.iter_metadatas())
+    as_lists = tracemalloc.get_traced_memory()[0]
+    del ids, texts, metadatas
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    reopened = ChunkStore(path)
+    as_store = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    rows = np.random.default_rng(0).integers(len(reopened), size=1000)
+    start = time.perf_counter()
+    for row in rows:
+        reopened.document(int(row))
+    elapsed = (time.perf_counter() - start) * 1_000_000 / len(rows)
+    print(f"{len(store)} chunks, {store.nbytes() / 1e6:.1f} MB on disk")
+    print(f"Resident after loading: Python lists {as_lists / 1e6:.2f} MB, ChunkStore {as_store / 1e6:.3f} MB")
+    print(f"Document from row: {elapsed:.1f}µs")
+
+# docker-compose run --rm app langchain/4_RAGs/chunk_store.py
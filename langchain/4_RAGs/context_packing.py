@@ -0,0 +1,204 @@
+"""
+Kontext-Aufbereitung für den Prompt: Zusammenführen, Deduplizieren, Token-Budget
+
+Statt die abgerufenen Chunks einfach aneinanderzuhängen, werden sie vor dem LLM-Aufruf aufbereitet:
+- Benachbarte Chunks derselben Quelle (aufeinanderfolgender 'chunk_index') werden zu einer Passage
+  zusammengeführt; die doppelt enthaltene Überlappung an der Chunkgrenze wird entfernt
+- Nahezu identische Passagen werden per MinHash (Jaccard-Schätzung über Wort-Shingles) verworfen
+- Die Passagen werden nach Relevanz gierig bis zum Token-Budget gepackt (Tokenizer: tiktoken, lokal)
+
+Mit größerem k wächst der Prompt damit nicht mehr linear, und kein Text wird doppelt gesendet.
+"""
+import hashlib  # Für die Shingle-Hashes
+import re  # Für die Wort-Tokenisierung
+
+import numpy as np
+
+DEFAULT_TOKEN_BUDGET = 800
+MERSENNE_PRIME = (1 << 61) - 1
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class TokenCounter:
+    """
+    Zählt Tokens mit tiktoken für das angegebene Modell.
+
+    Ist die Kodierung nicht verfügbar (z.B. offline ohne tiktoken-Cache), wird mit
+    4 Zeichen pro Token geschätzt.
+    """
+
+    def __init__(self, model="gpt-4o-mini"):
+        try:
+            import tiktoken
+            self._encoding = tiktoken.encoding_for_model(model)
+        except Exception as exc:  # Download der Kodierung fehlgeschlagen oder tiktoken fehlt
+            print(f"tiktoken encoding for {model} unavailable ({type(exc).__name__}), estimating 4 chars per token")
+            self._encoding = None
+
+    def count(self, text):
+        if self._encoding is None:
+            return (len(text) + 3) // 4
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text, max_tokens):
+        """Kürzt einen Text auf höchstens max_tokens Tokens."""
+        if self._encoding is None:
+            return text[:max_tokens * 4]
+        return self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+class MinHasher:
+    """MinHash-Signaturen über Wort-Shingles; Anteil gleicher Minima ≈ Jaccard-Ähnlichkeit."""
+
+    def __init__(self, num_perm=64, shingle_size=5, seed=1):
+        rng = np.random.default_rng(seed)
+        # a * h + b bleibt mit 32-Bit-Hashes und a, b < 2^31 unterhalb von 2^64
+        self._a = rng.integers(1, 1 << 31, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, num_perm, dtype=np.uint64)
+        self.shingle_size = shingle_size
+
+    def signature(self, text):
+        words = WORD_PATTERN.findall(text.lower())
+        n = self.shingle_size
+        shingles = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles],
+            dtype=np.uint64,
+        )
+        return ((hashes[:, None] * self._a + self._b) % MERSENNE_PRIME).min(axis=0)
+
+    @staticmethod
+    def similarity(signature_a, signature_b):
+        return float(np.mean(signature_a == signature_b))
+
+
+def strip_overlap(previous, text, separator="\n\n", max_overlap=1000):
+    """
+    Entfernt am Anfang von 'text' den Teil, mit dem 'previous' endet (Chunk-Überlappung).
+
+    Der Splitter überlappt nur ganze Abschnitte; als Überlappung zählt daher nur ein Bereich,
+    der in beiden Chunks an einer Abschnittsgrenze ('separator') liegt.
+    """
+    for size in range(min(len(previous), len(text), max_overlap), 0, -1):
+        if (
+            text.startswith(separator, size)
+            and previous.endswith(text[:size])
+            and (size == len(previous) or previous[:-size].endswith(separator))
+        ):
+            return text[size:].lstrip()
+    return text
+
+
+def _passage(text, source, rank, doc_id):
+    return {"text": text, "source": source, "rank": rank, "chunk_ids": [doc_id], "parts": []}
+
+
+def merge_adjacent(docs):
+    """
+    Führt benachbarte Chunks derselben Quelle zusammen.
+
+    Args:
+        docs: Documents in Relevanz-Reihenfolge (mit Metadaten 'source' und 'chunk_index')
+
+    Returns:
+        Passagen als Dictionaries (text, source, rank, chunk_ids, parts), sortiert nach Rang;
+        'parts' enthält die einzelnen Chunks einer zusammengeführten Passage (ohne Überlappung)
+    """
+    passages, runs = [], {}
+    positioned = []
+    for rank, doc in enumerate(docs):
+        metadata = doc.metadata or {}
+        if "chunk_index" in metadata and "source" in metadata:
+            positioned.append((metadata["source"], metadata["chunk_index"], rank, doc))
+        else:
+            passages.append(_passage(doc.page_content, metadata.get("source"), rank, doc.id))
+    for source, chunk_index, rank, doc in sorted(positioned, key=lambda item: (item[0], item[1])):
+        current = runs.get(source)
+        if current is not None and chunk_index == current["last_index"] + 1:
+            text = strip_overlap(current["text"], doc.page_content)
+            current["text"] += "\n\n" + text
+            current["rank"] = min(current["rank"], rank)
+            current["chunk_ids"].append(doc.id)
+            current["parts"].append(_passage(text, source, rank, doc.id))
+        elif current is not None and chunk_index == current["last_index"]:
+            continue  # Derselbe Chunk doppelt abgerufen
+        else:
+            current = runs[source] = _passage(doc.page_content, source, rank, doc.id)
+            current["parts"] = [_passage(doc.page_content, source, rank, doc.id)]
+            passages.append(current)
+        current["last_index"] = chunk_index
+    for passage in passages:
+        passage.pop("last_index", None)
+    return sorted(passages, key=lambda passage: passage["rank"])
+
+
+def pack_context(docs, token_budget=DEFAULT_TOKEN_BUDGET, token_counter=None, dedup_threshold=0.8,
+                 minhasher=None):
+    """
+    Bereitet die abgerufenen Chunks für den Prompt auf.
+
+    Args:
+        docs: Documents in Relevanz-Reihenfolge
+        token_budget: Maximale Anzahl Tokens für alle Passagen zusammen
+        token_counter: TokenCounter (Standard: gpt-4o-mini)
+        dedup_threshold: Ab dieser geschätzten Jaccard-Ähnlichkeit gilt eine Passage als Duplikat
+        minhasher: MinHasher für die Deduplizierung
+
+    Returns:
+        (Passagen nach Relevanz, Statistik-Dictionary)
+    """
+    token_counter = token_counter or TokenCounter()
+    minhasher = minhasher or MinHasher()
+    passages = merge_adjacent(docs)
+
+    # Nahezu identische Passagen verwerfen; die relevantere bleibt erhalten
+    kept, signatures, duplicates = [], [], 0
+    for passage in passages:
+        signature = minhasher.signature(passage["text"])
+        if any(minhasher.similarity(signature, other) >= dedup_threshold for other in signatures):
+            duplicates += 1
+            continue
+        kept.append(passage)
+        signatures.append(signature)
+
+    # Gierig nach Relevanz packen. Passt eine zusammengeführte Passage nicht mehr, wird sie wieder
+    # in ihre Chunks zerlegt, damit wenigstens die relevantesten davon in den Prompt kommen.
+    packed, used, dropped = [], 0, 0
+    queue = list(kept)
+    while queue:
+        passage = queue.pop(0)
+        tokens = token_counter.count(passage["text"])
+        if used + tokens <= token_budget:
+            packed.append({**passage, "tokens": tokens})
+            used += tokens
+        elif len(passage["parts"]) > 1:
+            queue = sorted(queue + passage["parts"], key=lambda p: p["rank"])
+        else:
+            dropped += 1
+    packed.sort(key=lambda p: p["rank"])
+    if not packed and kept:
+        # Nicht einmal die relevanteste Passage passt: gekürzt übernehmen
+        text = token_counter.truncate(kept[0]["text"], token_budget)
+        packed.append({**kept[0], "text": text, "tokens": token_counter.count(text)})
+        used = packed[0]["tokens"]
+        dropped -= 1
+
+    stats = {
+        "chunks": len(docs),
+        "passages": len(passages),
+        "duplicates_removed": duplicates,
+        "passages_dropped": dropped,
+        "tokens_before": sum(token_counter.count(doc.page_content) for doc in docs),
+        "tokens_after": used,
+        "token_budget": token_budget,
+    }
+    return packed, stats
+
+
+def print_packing_stats(stats):
+    """Gibt die Statistik der Kontext-Aufbereitung aus."""
+    print(
+        f"\n--- Context: {stats['chunks']} chunks -> {stats['passages']} passages, "
+        f"{stats['duplicates_removed']} duplicates, {stats['passages_dropped']} over budget, "
+        f"{stats['tokens_before']} -> {stats['tokens_after']} tokens (budget {stats['token_budget']}) ---"
+    )
@@ -0,0 +1,290 @@
+"""
+Micro-Batching für Abfrage-Embeddings
+
+Viele gleichzeitige Fragen erzeugen sonst je eine eigene Embedding-Anfrage. Der Batcher sammelt
+die Abfragetexte stattdessen kurz ein und schickt sie gemeinsam ab:
+- Ein Batch wird gesendet, sobald max_batch_size Texte warten oder max_wait_ms seit dem ersten Text vergangen sind
+- Gleiche Texte innerhalb eines Batches werden nur einmal eingebettet
+- Jeder Aufrufer erhält genau seinen Vektor zurück; ein Fehler des Batches geht an alle wartenden Aufrufer
+- Die zusätzliche Latenz pro Abfrage ist durch max_wait_ms begrenzt
+
+Bei N gleichzeitigen Fragen sinkt die Zahl der Embedding-Anfragen damit auf etwa N / max_batch_size.
+
+Varianten:
+- EmbeddingBatcher: für Threads (synchrone Skripte, Retriever in Thread-Pools)
+- AsyncEmbeddingBatcher: für Coroutinen einer Event-Loop (rag_server.py)
+- BatchingEmbeddings: LangChain-Embeddings, deren embed_query/aembed_query über die Batcher laufen;
+  Fenster und Batchgröße per RAG_EMBED_BATCH_WAIT_MS und RAG_EMBED_BATCH_SIZE einstellbar
+"""
+import asyncio  # Für die Sammelphase und die wartenden Aufrufer
+import os  # Für die Konfiguration per Umgebungsvariable
+import threading  # Für den synchronen Batcher
+import time  # Für das Sammelfenster
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MAX_WAIT_MS = 5.0
+DEFAULT_MAX_BATCH_SIZE = 64
+
+
+def _new_stats():
+    return {"queries": 0, "batches": 0, "texts_sent": 0, "largest_batch": 0, "errors": 0}
+
+
+def _summary(stats):
+    stats = dict(stats)
+    stats["avg_batch_size"] = round(stats["queries"] / stats["batches"], 2) if stats["batches"] else 0.0
+    return stats
+
+
+class _Request:
+    __slots__ = ("text", "result", "error", "done", "leader", "deadline")
+
+    def __init__(self, text):
+        self.text = text
+        self.result = self.error = None
+        self.done = self.leader = False
+        self.deadline = 0.0
+
+
+class EmbeddingBatcher:
+    """
+    Bündelt gleichzeitige embed_query-Aufrufe aus mehreren Threads zu einem embed_documents-Aufruf.
+
+    Der erste Aufrufer eines Batches wartet das Sammelfenster ab und sendet den Batch selbst;
+    alle anderen warten nur auf ihr Ergebnis. Es gibt keinen Hintergrund-Thread.
+
+    Args:
+        embeddings: LangChain-Embeddings (embed_documents wird verwendet)
+        max_wait_ms: Maximale Wartezeit des ersten Textes im Batch
+        max_batch_size: Maximale Anzahl Texte pro Embedding-Anfrage
+    """
+
+    def __init__(self, embeddings, max_wait_ms=DEFAULT_MAX_WAIT_MS, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+        self.embeddings = embeddings
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._condition = threading.Condition()
+        self._stats = _new_stats()
+
+    def embed_query(self, text):
+        request = _Request(text)
+        with self._condition:
+            self._pending.append(request)
+            self._stats["queries"] += 1
+            if len(self._pending) == 1:
+                request.leader = True
+                request.deadline = time.monotonic() + self.max_wait
+            self._condition.notify_all()  # Weckt den Leiter, falls der Batch jetzt voll ist
+            while not request.done and not request.leader:
+                self._condition.wait()
+            if request.done:
+                if request.error is not None:
+                    raise request.error
+                return request.result
+            while len(self._pending) < self.max_batch_size:
+                remaining = request.deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            if self._pending:
+                # Überzählige Texte bilden sofort den nächsten Batch, ihr Fenster ist schon abgelaufen
+                self._pending[0].leader = True
+                self._pending[0].deadline = time.monotonic()
+                self._condition.notify_all()
+
+        texts = list(dict.fromkeys(item.text for item in batch))
+        try:
+            vectors = dict(zip(texts, self.embeddings.embed_documents(texts)))
+        except Exception as exc:
+            vectors, error = None, exc
+        with self._condition:
+            self._stats["batches"] += 1
+            self._stats["texts_sent"] += len(texts)
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+            if vectors is None:
+                self._stats["errors"] += 1
+            for item in batch:
+                item.done = True
+                if vectors is None:
+                    item.error = error
+                else:
+                    item.result = vectors[item.text]
+            self._condition.notify_all()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    @property
+    def stats(self):
+        with self._condition:
+            return _summary(self._stats)
+
+
+class AsyncEmbeddingBatcher:
+    """
+    Bündelt gleichzeitige embed_query-Aufrufe innerhalb einer Event-Loop zu einem aembed_documents-Aufruf.
+
+    Args:
+        embeddings: LangChain-Embeddings (aembed_documents wird verwendet)
+        max_wait_ms: Maximale Wartezeit des ersten Textes im Batch
+        max_batch_size: Maximale Anzahl Texte pro Embedding-Anfrage
+    """
+
+    def __init__(self, embeddings, max_wait_ms=DEFAULT_MAX_WAIT_MS, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+        self.embeddings = embeddings
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending = []  # (Text, Future) der laufenden Sammelphase
+        self._timer = None
+        self._tasks = set()  # Referenzen auf laufende Batches, damit sie nicht eingesammelt werden
+        self._stats = _new_stats()
+
+    async def embed_query(self, text):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self._stats["queries"] += 1
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self._stats["batches"] += 1
+        self._stats["texts_sent"] += len(texts)
+        self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+        try:
+            vectors = await self.embeddings.aembed_documents(texts)
+        except Exception as exc:
+            self._stats["errors"] += 1
+            for _, future in batch:
+                if not future.done():  # Abgebrochene Aufrufer (Timeout) überspringen
+                    future.set_exception(exc)
+            return
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    @property
+    def stats(self):
+        return _summary(self._stats)
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    LangChain-Embeddings mit Micro-Batching der Abfragen; Dokument-Embeddings werden direkt weitergereicht.
+
+    Zusammen mit CachedEmbeddings gehört dieser Wrapper nach innen, damit Cache-Treffer nicht
+    auf das Sammelfenster warten: CachedEmbeddings(BatchingEmbeddings(OpenAIEmbeddings(...)), ...)
+
+    Args:
+        embeddings: Das eigentliche Embedding-Modell
+        max_wait_ms: Sammelfenster (Standard: RAG_EMBED_BATCH_WAIT_MS oder 5ms)
+        max_batch_size: Maximale Batchgröße (Standard: RAG_EMBED_BATCH_SIZE oder 64)
+    """
+
+    def __init__(self, embeddings, max_wait_ms=None, max_batch_size=None):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)  # Für den Schlüssel des Embedding-Caches
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else float(
+            os.environ.get("RAG_EMBED_BATCH_WAIT_MS", DEFAULT_MAX_WAIT_MS))
+        self.max_batch_size = max_batch_size or int(os.environ.get("RAG_EMBED_BATCH_SIZE", DEFAULT_MAX_BATCH_SIZE))
+        self.batcher = EmbeddingBatcher(embeddings, self.max_wait_ms, self.max_batch_size)
+        self._async_batchers = {}  # Ein AsyncEmbeddingBatcher pro Event-Loop
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.batcher.embed_query(text)
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        loop = asyncio.get_running_loop()
+        batcher = self._async_batchers.get(loop)
+        if batcher is None:
+            batcher = self._async_batchers[loop] = AsyncEmbeddingBatcher(
+                self.embeddings, self.max_wait_ms, self.max_batch_size
+            )
+        return await batcher.embed_query(text)
+
+    @property
+    def stats(self):
+        """Summe über den synchronen und alle asynchronen Batcher."""
+        parts = [self.batcher.stats] + [batcher.stats for batcher in self._async_batchers.values()]
+        total = _new_stats()
+        for part in parts:
+            for key in total:
+                total[key] = max(total[key], part[key]) if key == "largest_batch" else total[key] + part[key]
+        return _summary(total)
+
+    def print_stats(self):
+        """Gibt die Batching-Statistik aus."""
+        stats = self.stats
+        print(
+            f"\n--- Embedding batching: {stats['queries']} queries in {stats['batches']} requests "
+            f"(avg {stats['avg_batch_size']}, max {stats['largest_batch']}, window {self.max_wait_ms}ms) ---"
+        )
+
+
+if __name__ == "__main__":
+    # Demo: Embedding-Anfragen und Latenz bei vielen gleichzeitigen Fragen, mit und ohne Batching
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+
+    from langchain_openai import OpenAIEmbeddings
+
+    from mock_openai_server import start_background_server
+
+    parser = argparse.ArgumentParser(description="Micro-batching demo against the local mock server")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock server latency per request")
+    parser.add_argument("--threads", type=int, default=64, help="Concurrent callers")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--window-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    server, base_url = start_background_server(latency=args.latency)
+    model = OpenAIEmbeddings(model="text-embedding-3-small", base_url=base_url, api_key="test",
+                             check_embedding_ctx_length=False)
+
+    for name, embeddings in [("direct", model), ("batched", BatchingEmbeddings(model, args.window_ms))]:
+        before = server.RequestHandlerClass.stats["requests"]
+        latencies = []
+
+        def ask(i):
+            start = time.perf_counter()
+            embeddings.embed_query(f"Where is Dracula's castle located? ({i})")
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            list(executor.map(ask, range(args.queries)))
+        elapsed = time.perf_counter() - start
+        round_trips = server.RequestHandlerClass.stats["requests"] - before
+        latencies.sort()
+        print(
+            f"{name:<8} {args.queries} queries in {elapsed:.2f}s: {round_trips} embedding requests "
+            f"({round_trips / elapsed:.1f}/s), p50={latencies[len(latencies) // 2] * 1000:.1f}ms "
+            f"p95={latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms"
+        )
+
+# docker-compose run --rm app langchain/4_RAGs/embedding_batcher.py
@@ -0,0 +1,288 @@
+"""
+Persistenter Embedding-Cache auf der Festplatte
+
+Dieses Modul stellt einen lokalen Cache für Embeddings bereit, den alle 4_RAGs-Skripte teilen:
+- Schlüssel: SHA-256 aus Modell-Fingerabdruck (Modellname, API-Adresse, Dimension) und Text;
+  Vektoren eines Test-Servers (mock_openai_server.py) landen so nie unter dem Schlüssel der echten API
+- Vektoren: memory-mapped float32-Matrix (eine Zeile pro Eintrag)
+- Schlüsselindex: SQLite-Tabelle (Schlüssel -> Zeile, Zeitpunkt der letzten Nutzung)
+- Größenbegrenzung: bei vollem Cache wird der am längsten nicht genutzte Eintrag ersetzt (LRU);
+  die Kapazität wird beim Anlegen festgelegt, ein abweichender Wert später ist ein Fehler
+- Lesen und Schreiben laufen unter derselben SQLite-Schreibsperre, damit kein Prozess eine Zeile liest,
+  die ein anderer gerade neu vergibt; geschrieben werden nur die Speicherseiten der geänderten Zeilen
+- Treffer/Fehlschläge werden gezählt und können ausgegeben werden
+
+CachedEmbeddings umschließt ein beliebiges LangChain-Embedding (z.B. OpenAIEmbeddings).
+Bereits bekannte Texte und Abfragen werden direkt aus dem Cache beantwortet,
+nur unbekannte Texte gehen an die Embedding-API.
+"""
+import asyncio  # Für die async-Methoden
+import hashlib  # Für die Cache-Schlüssel
+import mmap  # Für die Vektormatrix
+import os  # Für Dateisystem-Operationen
+import sqlite3  # Für den Schlüsselindex
+import threading  # Für den Zugriff aus mehreren Threads
+import time  # Für die LRU-Zeitstempel
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MAX_ENTRIES = 100_000  # ~600 MB bei 1536 Dimensionen (Datei wird sparse angelegt)
+
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+def embedding_fingerprint(embeddings):
+    """Modellname, API-Adresse und Dimension des Modells (auch durch Wrapper wie BatchingEmbeddings hindurch)."""
+    inner = embeddings
+    while hasattr(inner, "embeddings") and isinstance(inner.embeddings, Embeddings):
+        inner = inner.embeddings  # Wrapper: Adresse und Dimension stehen am eigentlichen Modell
+    model = getattr(embeddings, "model", type(embeddings).__name__)
+    base_url = getattr(inner, "openai_api_base", None) or os.environ.get("OPENAI_BASE_URL") or DEFAULT_BASE_URL
+    dimensions = getattr(inner, "dimensions", None)
+    return f"{model}@{base_url.rstrip('/')}" + (f":{dimensions}" if dimensions else "")
+
+
+def cache_key(fingerprint, text):
+    """Schlüssel aus Modell-Fingerabdruck und Text-Hash."""
+    return hashlib.sha256(f"{fingerprint}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Memory-mapped float32-Matrix mit SQLite-Schlüsselindex und LRU-Verdrängung."""
+
+    def __init__(self, cache_dir, max_entries=None):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, "index.sqlite"),
+            check_same_thread=False,
+            timeout=30,
+            isolation_level=None,  # Transaktionen werden explizit gesteuert
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, slot INTEGER UNIQUE NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+        # Kapazität wird beim ersten Anlegen festgelegt, damit die Matrixgröße stabil bleibt
+        stored = self._get_meta("max_entries")
+        if stored is not None and max_entries is not None and int(stored) != max_entries:
+            raise ValueError(
+                f"Embedding cache in {cache_dir} was created with max_entries={stored}, not {max_entries}; "
+                f"delete the directory to change the capacity"
+            )
+        self.max_entries = int(stored or max_entries or DEFAULT_MAX_ENTRIES)
+        self._set_meta("max_entries", self.max_entries)
+        dim = self._get_meta("dim")
+        self.dim = int(dim) if dim else None
+        self._matrix = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _open_matrix(self, dim):
+        """Öffnet (oder erzeugt) die Vektormatrix als Memory-Map."""
+        if self._matrix is not None:
+            return self._matrix
+        if self.dim is None:
+            self.dim = dim
+            self._set_meta("dim", dim)
+        if self.dim != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match cache dimension {self.dim}")
+        size = self.max_entries * self.dim * 4
+        with open(self.vectors_path, "a+b") as f:
+            if os.path.getsize(self.vectors_path) < size:
+                f.truncate(size)  # Sparse-Datei: belegt nur Platz für geschriebene Zeilen
+            self._mmap = mmap.mmap(f.fileno(), size)
+        self._matrix = np.frombuffer(self._mmap, dtype=np.float32).reshape(self.max_entries, self.dim)
+        return self._matrix
+
+    def _flush_rows(self, slots):
+        """Schreibt nur die Speicherseiten der geänderten Zeilen auf die Platte (statt der ganzen Matrix)."""
+        row_bytes = self.dim * 4
+        ranges = []
+        for slot in sorted(set(slots)):
+            start = slot * row_bytes // mmap.PAGESIZE * mmap.PAGESIZE
+            end = (slot + 1) * row_bytes
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+        for start, end in ranges:
+            self._mmap.flush(start, end - start)
+
+    def get_many(self, keys):
+        """Liefert {Schlüssel: Vektor} für alle gefundenen Schlüssel und aktualisiert ihre LRU-Zeit."""
+        if self.dim is None:
+            # Ein anderer Prozess könnte den Cache inzwischen befüllt haben
+            dim = self._get_meta("dim")
+            self.dim = int(dim) if dim else None
+        if not keys or self.dim is None:
+            self.misses += len(keys)
+            return {}
+        found = {}
+        with self._lock:
+            matrix = self._open_matrix(self.dim)
+            # Schreibsperre schon beim Lesen: ein anderer Prozess kann eine Zeile sonst zwischen
+            # Schlüsselabfrage und Kopie des Vektors verdrängen und neu belegen
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for i in range(0, len(keys), 500):  # SQLite-Limit für Parameter beachten
+                    batch = keys[i:i + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._conn.execute(
+                        f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", batch
+                    ).fetchall()
+                    for key, slot in rows:
+                        found[key] = np.array(matrix[slot])
+                if found:
+                    now = time.time()
+                    self._conn.executemany(
+                        "UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Speichert [(Schlüssel, Vektor)] und verdrängt bei Bedarf die ältesten Einträge."""
+        if not items:
+            return
+        with self._lock:
+            matrix = self._open_matrix(len(items[0][1]))
+            now = time.time()
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")  # Slot-Vergabe auch zwischen Prozessen serialisieren
+            try:
+                slots = []
+                for key, vector in items:
+                    row = cur.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        slot = row[0]
+                    else:
+                        slot = self._allocate_slot(cur)
+                    matrix[slot] = np.asarray(vector, dtype=np.float32)
+                    slots.append(slot)
+                    cur.execute(
+                        "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                        (key, slot, now),
+                    )
+                self._flush_rows(slots)
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+
+    def _allocate_slot(self, cur):
+        """Freie Zeile vergeben oder den am längsten ungenutzten Eintrag verdrängen."""
+        count = cur.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count < self.max_entries:
+            # Höchste belegte Zeile + 1; Lücken entstehen nicht, da nur ersetzt wird
+            top = cur.execute("SELECT MAX(slot) FROM entries").fetchone()[0]
+            return 0 if top is None else top + 1
+        key, slot = cur.execute(
+            "SELECT key, slot FROM entries ORDER BY last_used ASC LIMIT 1"
+        ).fetchone()
+        cur.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.evictions += 1
+        return slot
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @property
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self),
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain-Embeddings mit vorgeschaltetem EmbeddingCache.
+
+    Args:
+        embeddings: Das eigentliche Embedding-Modell (z.B. OpenAIEmbeddings)
+        cache_dir: Verzeichnis des Caches (von allen Skripten gemeinsam genutzt)
+        max_entries: Maximale Anzahl gespeicherter Vektoren (nur beim Anlegen; Standard DEFAULT_MAX_ENTRIES)
+    """
+
+    def __init__(self, embeddings, cache_dir, max_entries=None):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.fingerprint = embedding_fingerprint(embeddings)  # Gleiches Modell, anderer Server = anderer Schlüssel
+        self.cache = EmbeddingCache(cache_dir, max_entries=max_entries)
+
+    def _lookup(self, texts):
+        keys = [cache_key(self.fingerprint, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+        # Jeder fehlende Text wird nur einmal an die API geschickt
+        missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in found))
+        return keys, found, missing
+
+    def _store(self, missing, vectors, found):
+        items = [(cache_key(self.fingerprint, text), vector) for text, vector in zip(missing, vectors)]
+        self.cache.put_many(items)
+        found.update((key, np.asarray(vector, dtype=np.float32)) for key, vector in items)
+
+    def embed_documents(self, texts):
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            self._store(missing, self.embeddings.embed_documents(missing), found)
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        keys, found, missing = self._lookup([text])
+        if missing:
+            self._store(missing, [self.embeddings.embed_query(text)], found)
+        return found[keys[0]].tolist()
+
+    # SQLite und Memory-Map blockieren: im Worker-Thread ausführen, damit die Event-Loop frei bleibt
+    async def aembed_documents(self, texts):
+        keys, found, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(missing)
+            await asyncio.to_thread(self._store, missing, vectors, found)
+        return [found[key].tolist() for key in keys]
+
+    async def aembed_query(self, text):
+        keys, found, missing = await asyncio.to_thread(self._lookup, [text])
+        if missing:
+            vectors = [await self.embeddings.aembed_query(text)]
+            await asyncio.to_thread(self._store, missing, vectors, found)
+        return found[keys[0]].tolist()
+
+    @property
+    def stats(self):
+        return self.cache.stats
+
+    def print_stats(self):
+        """Gibt die Cache-Statistiken aus."""
+        stats = self.stats
+        print(
+            f"\n--- Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"(hit rate {stats['hit_rate']:.1%}), {stats['entries']} entries, "
+            f"{stats['evictions']} evictions ---"
+        )
@@ -0,0 +1,262 @@
+"""
+Asynchrone, gebatchte Embedding-Pipeline mit Rate-Limit-Backpressure
+
+Statt Chroma.from_documents (ein undurchsichtiger Aufruf für den ganzen Korpus) werden Chunks hier
+in einer asyncio-Pipeline verarbeitet:
+- Chunks werden in Batches konfigurierbarer Größe zusammengefasst
+- Höchstens max_in_flight Embedding-Anfragen laufen gleichzeitig (Semaphore)
+- Ein Token-Bucket begrenzt die Anfragen pro Sekunde
+- HTTP 429 (und 5xx) werden mit exponentiellem Backoff + Jitter wiederholt, Retry-After wird beachtet
+- Fertige Batches werden sofort in den Vektorspeicher geschrieben, während spätere Batches noch eingebettet werden
+
+Die Laufzeit skaliert damit mit der erlaubten Parallelität statt mit der Korpusgröße.
+
+Async-Clients (z.B. OpenAIEmbeddings) bleiben an die Event-Loop ihres ersten Aufrufs gebunden.
+Synchrone Aufrufer verwenden deshalb run_sync(): alle Läufe teilen sich eine dauerhafte Loop in
+einem Hintergrund-Thread statt für jeden Lauf mit asyncio.run eine neue zu starten.
+Mit mock_openai_server.py lässt sich die Pipeline lokal testen:
+
+    python langchain/4_RAGs/embedding_pipeline.py --latency 0.2 --max-rps 40
+"""
+import asyncio  # Für die nebenläufige Verarbeitung
+import itertools  # Für das batchweise Lesen der Eingabe
+import random  # Für den Jitter beim Backoff
+import threading  # Für die gemeinsame Event-Loop
+import time  # Für Token-Bucket und Laufzeitmessung
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_MAX_IN_FLIGHT = 4
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def run_sync(coroutine):
+    """
+    Führt eine Coroutine auf der gemeinsamen Hintergrund-Loop aus und wartet auf das Ergebnis.
+
+    Kann aus beliebigen Threads (auch gleichzeitig) aufgerufen werden, nicht aber aus der Loop selbst.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="embedding-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coroutine, _loop).result()
+
+
+class TokenBucket:
+    """Token-Bucket: erlaubt im Mittel 'rate' Anfragen pro Sekunde mit Bursts bis 'capacity'."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1.0):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+def _status_code(exc):
+    """HTTP-Statuscode aus OpenAI-/httpx-Ausnahmen ermitteln (falls vorhanden)."""
+    status = getattr(exc, "status_code", None)
+    if status is None and getattr(exc, "response", None) is not None:
+        status = getattr(exc.response, "status_code", None)
+    return status
+
+
+def _retry_after(exc):
+    """Retry-After-Header (in Sekunden) aus der Antwort lesen."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc):
+    """Rate-Limits, Serverfehler und Verbindungsabbrüche werden wiederholt."""
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(exc).__name__ in ("RateLimitError", "APIConnectionError", "APITimeoutError")
+
+
+def chroma_writer(db):
+    """Schreibfunktion für Chroma mit bereits berechneten Vektoren (idempotent dank upsert)."""
+    def write(docs, ids, vectors):
+        db._collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=[doc.page_content for doc in docs],
+            metadatas=[doc.metadata or None for doc in docs],
+        )
+    return write
+
+
+class EmbeddingPipeline:
+    """
+    Bettet einen Strom von (Document, ID)-Paaren ein und schreibt ihn batchweise weg.
+
+    Args:
+        embeddings: LangChain-Embeddings (aembed_documents wird verwendet)
+        batch_size: Anzahl Chunks pro Embedding-Anfrage
+        max_in_flight: Maximale Anzahl gleichzeitiger Embedding-Anfragen
+        requests_per_second: Obergrenze für Anfragen pro Sekunde (None = unbegrenzt)
+        max_retries: Maximale Wiederholungen pro Batch
+        base_delay / max_delay: Grenzen für den exponentiellen Backoff in Sekunden
+    """
+
+    def __init__(self, embeddings, batch_size=DEFAULT_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                 requests_per_second=None, max_retries=8, base_delay=0.5, max_delay=30.0):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def _embed_with_retry(self, texts, bucket, stats):
+        for attempt in range(self.max_retries + 1):
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                stats["requests"] += 1
+                return await self.embeddings.aembed_documents(texts)
+            except Exception as exc:
+                if attempt == self.max_retries or not is_retryable(exc):
+                    raise
+                stats["retries"] += 1
+                if _status_code(exc) == 429:
+                    stats["rate_limited"] += 1
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                delay = max(delay * random.uniform(0.5, 1.5), _retry_after(exc) or 0.0)
+                await asyncio.sleep(delay)
+
+    async def run(self, items, write):
+        """
+        Verarbeitet alle Paare aus 'items' (beliebiger Iterator, wird lazy gelesen).
+
+        'items' wird batchweise in einem Worker-Thread gelesen (Lesen und Aufteilen blockieren die Loop nicht),
+        'write(docs, ids, vectors)' wird in einem Worker-Thread aufgerufen, immer nur ein Batch zur Zeit.
+        Im Speicher liegen höchstens 2 * max_in_flight + 1 Batches (laufend, wartend, schreibend).
+        """
+        start = time.perf_counter()
+        stats = {"chunks": 0, "batches": 0, "requests": 0, "retries": 0, "rate_limited": 0}
+        bucket = TokenBucket(self.requests_per_second) if self.requests_per_second else None
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        queue = asyncio.Queue(maxsize=self.max_in_flight)  # Backpressure zum Schreiben
+
+        write_errors = []
+
+        async def writer():
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    return
+                if write_errors:
+                    continue  # Nach einem Fehler nur noch leeren, damit niemand blockiert
+                docs, ids, vectors = batch
+                try:
+                    await asyncio.to_thread(write, docs, ids, vectors)
+                except Exception as exc:
+                    write_errors.append(exc)
+                    continue
+                stats["chunks"] += len(ids)
+                stats["batches"] += 1
+
+        async def embed_batch(docs, ids):
+            # Der Slot wird erst freigegeben, wenn der Batch in der Schreib-Queue liegt
+            try:
+                vectors = await self._embed_with_retry([doc.page_content for doc in docs], bucket, stats)
+                await queue.put((docs, ids, vectors))
+            finally:
+                semaphore.release()
+
+        writer_task = asyncio.create_task(writer())
+        tasks = set()
+        try:
+            items = iter(items)
+            while True:
+                batch = await asyncio.to_thread(lambda: list(itertools.islice(items, self.batch_size)))
+                if not batch:
+                    break
+                await semaphore.acquire()  # Wartet, solange max_in_flight Anfragen laufen
+                tasks.add(asyncio.create_task(embed_batch([doc for doc, _ in batch], [doc_id for _, doc_id in batch])))
+                self._raise_failed(tasks, write_errors)
+            await asyncio.gather(*tasks)
+            await queue.put(None)
+            await writer_task
+            self._raise_failed(tasks, write_errors)
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer_task.cancel()
+
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        stats["chunks_per_second"] = round(stats["chunks"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+        return stats
+
+    @staticmethod
+    def _raise_failed(tasks, write_errors):
+        """Fertige Tasks aufräumen und Fehler sofort weitergeben statt erst am Ende."""
+        if write_errors:
+            raise write_errors[0]
+        for task in [t for t in tasks if t.done()]:
+            tasks.discard(task)
+            task.result()
+
+
+if __name__ == "__main__":
+    # Demo: Ingestion-Laufzeit bei unterschiedlicher Parallelität gegen den lokalen Fake-Server
+    import argparse
+    import os
+
+    from langchain_openai import OpenAIEmbeddings
+    from langchain_text_splitters import CharacterTextSplitter
+
+    from ingestion import chunk_ids, load_and_split
+    from mock_openai_server import start_background_server
+
+    parser = argparse.ArgumentParser(description="Embedding pipeline demo against the local mock server")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock server latency per request")
+    parser.add_argument("--max-rps", type=int, default=0, help="Mock server rate limit (0 = unlimited)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    server, base_url = start_background_server(latency=args.latency, max_rps=args.max_rps)
+    embeddings = OpenAIEmbeddings(
+        model="text-embedding-3-small",
+        base_url=base_url,
+        api_key="test",
+        check_embedding_ctx_length=False,  # Texte direkt senden, ohne lokale Tokenisierung
+        max_retries=0,  # Wiederholungen übernimmt die Pipeline
+    )
+
+    books_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "documents")
+    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=50)
+    items = []
+    for book_file in sorted(f for f in os.listdir(books_dir) if f.endswith(".txt")):
+        docs = load_and_split(os.path.join(books_dir, book_file), book_file, text_splitter)
+        items.extend(zip(docs, chunk_ids(book_file, [doc.page_content for doc in docs])))
+    print(f"{len(items)} chunks, batch size {args.batch_size}, mock latency {args.latency}s")
+
+    for concurrency in args.concurrency:
+        pipeline = EmbeddingPipeline(embeddings, batch_size=args.batch_size, max_in_flight=concurrency)
+        stats = run_sync(pipeline.run(iter(items), lambda docs, ids, vectors: None))  # Eine Loop für alle Läufe
+        print(f"max_in_flight={concurrency:>3}: {stats}")
+
+# docker-compose run --rm app langchain/4_RAGs/embedding_pipeline.py
@@ -0,0 +1,352 @@
+"""
+Inkrementelle, inhaltsbasierte Ingestion für die RAG-Indexskripte
+
+Dieses Modul wird von 1a_basic_part_1.py und 2a_rag_basics_metadata.py verwendet:
+- Jede Quelldatei wird per SHA-256 gehasht
+- Jeder Chunk erhält eine deterministische ID aus Quelle und Chunk-Hash
+- Die Hashes werden in einem Manifest neben der Chroma-Collection gespeichert
+- Bei einem erneuten Lauf werden nur neue oder geänderte Chunks eingebettet
+- Chunks von gelöschten Quelldateien werden aus der Collection entfernt
+- Das Manifest wird erst am Ende geschrieben; bricht ein Lauf vorher ab, bleibt es als 'pending'
+  markiert und der nächste Lauf löscht Chunks, die in keinem Manifest-Eintrag stehen (Waisen)
+- Jeder Chunk trägt die Metadaten 'source' und 'chunk_index' (Position in der Datei);
+  verschiebt sich ein unveränderter Chunk, werden nur seine Metadaten aktualisiert (ohne neues Embedding)
+
+Eine geänderte Datei kostet damit nur die Embeddings der tatsächlich geänderten Chunks
+statt eines kompletten Neuaufbaus der Vektordatenbank.
+
+Laden, Aufteilen, Einbetten und Schreiben bilden eine Generator-Kette: mit einem
+StreamingCharacterSplitter liegt nie eine ganze Datei oder der ganze Korpus im Speicher,
+sondern nur das aktuelle Lesefenster und die Batches der Embedding-Pipeline.
+Der maximale RSS wird in der Zusammenfassung ausgegeben.
+
+Optional (workers > 1) werden Lesen und Aufteilen der Dateien auf mehrere Prozesse verteilt.
+Das Einbetten bleibt im Hauptprozess; die Chunks sind identisch mit dem seriellen Pfad.
+"""
+import asyncio  # Für die asynchrone Embedding-Pipeline
+import collections  # Für die Warteschlange des Prozess-Pools
+import hashlib  # Für die Inhalts-Hashes von Dateien und Chunks
+import itertools  # Für das parallele Durchlaufen von Chunks und IDs
+import json  # Für das Manifest
+import os  # Für Dateisystem-Operationen
+import resource  # Für den maximalen Speicherverbrauch (RSS)
+import sys  # Für plattformabhängige Einheiten
+import time  # Für die Laufzeitmessung
+from concurrent.futures import ProcessPoolExecutor  # Für paralleles Lesen und Aufteilen
+
+from langchain_core.documents import Document
+
+from embedding_pipeline import EmbeddingPipeline, chroma_writer, run_sync
+
+MANIFEST_FILENAME = "ingest_manifest.json"  # Dateiname des Manifests im Chroma-Verzeichnis
+MANIFEST_VERSION = 2  # Version 2: Chunks tragen zusätzlich das Metadatum 'chunk_index'
+
+
+def file_sha256(file_path, block_size=1 << 20):
+    """Berechnet den SHA-256-Hash einer Datei blockweise (ohne sie komplett zu laden)."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_sha256(text):
+    """Berechnet den SHA-256-Hash eines Chunk-Textes."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def iter_chunk_ids(source, texts):
+    """
+    Erzeugt deterministische Chunk-IDs der Form '<quelle-hash>-<chunk-hash>-<n>'.
+
+    Die ID hängt nur vom Inhalt ab, nicht von der Position in der Datei. Wird vorne in
+    einem Buch ein Absatz eingefügt, behalten alle unveränderten Chunks ihre ID.
+    '<n>' zählt identische Chunks innerhalb derselben Quelle durch.
+    """
+    source_hash = hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+    seen = {}
+    for text in texts:
+        text_hash = chunk_sha256(text)[:24]
+        n = seen.get(text_hash, 0)
+        seen[text_hash] = n + 1
+        yield f"{source_hash}-{text_hash}-{n}"
+
+
+def chunk_ids(source, texts):
+    """Chunk-IDs für eine Liste von Chunk-Texten (siehe iter_chunk_ids)."""
+    return list(iter_chunk_ids(source, texts))
+
+
+def peak_rss_mb():
+    """Maximaler Arbeitsspeicher (RSS) des Prozesses in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux liefert KB, macOS Bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def manifest_path_for(persistent_directory):
+    """Pfad des Manifests neben der Chroma-Collection."""
+    return os.path.join(persistent_directory, MANIFEST_FILENAME)
+
+
+def load_manifest(manifest_path):
+    """Lädt das Manifest oder gibt None zurück, falls es (noch) nicht existiert."""
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if not 1 <= manifest.get("version", 0) <= MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(manifest_path, manifest):
+    """Schreibt das Manifest atomar (erst in eine temporäre Datei, dann umbenennen)."""
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def iter_collection_ids(db, page_size=5000):
+    """Alle Chunk-IDs der Collection, seitenweise gelesen (ohne Texte und Embeddings)."""
+    offset = 0
+    while True:
+        ids = db.get(include=[], limit=page_size, offset=offset)["ids"]
+        if not ids:
+            return
+        yield from ids
+        offset += len(ids)
+
+
+def iter_chunk_texts(file_path, text_splitter):
+    """
+    Liefert die Chunk-Texte einer Textdatei lazy.
+
+    Mit einem StreamingCharacterSplitter wird die Datei fensterweise gelesen,
+    andere Splitter erhalten den kompletten Text.
+    """
+    if hasattr(text_splitter, "iter_file_chunks"):
+        yield from text_splitter.iter_file_chunks(file_path)
+    else:
+        with open(file_path, "r", encoding="utf-8") as f:
+            yield from text_splitter.split_text(f.read())
+
+
+def iter_documents(file_path, source, text_splitter):
+    """Liefert die Chunks einer Textdatei lazy als Documents mit Quelle und Position als Metadaten."""
+    for chunk_index, chunk in enumerate(iter_chunk_texts(file_path, text_splitter)):
+        yield Document(page_content=chunk, metadata={"source": source, "chunk_index": chunk_index})
+
+
+def load_and_split(file_path, source, text_splitter):
+    """Lädt eine Textdatei, teilt sie in Chunks und setzt Quelle und Position als Metadaten."""
+    return list(iter_documents(file_path, source, text_splitter))
+
+
+def _split_file(task):
+    """
+    Worker-Funktion für den Prozess-Pool: Datei hashen und (falls geändert) aufteilen.
+
+    Gibt (Quelle, Datei-Hash, Chunk-Texte) zurück; bei unveränderter Datei ist die Liste None.
+    """
+    source, file_path, known_hash, text_splitter = task
+    file_hash = file_sha256(file_path)
+    if file_hash == known_hash:
+        return source, file_hash, None
+    return source, file_hash, list(iter_chunk_texts(file_path, text_splitter))
+
+
+def iter_file_splits(sources, text_splitter, known_hashes, workers=None):
+    """
+    Liefert (Quelle, Datei-Hash, Chunk-Texte) für alle Quellen in sortierter Reihenfolge.
+
+    Ohne 'workers' wird seriell und lazy gelesen. Mit 'workers' > 1 werden Lesen, Hashen und
+    Aufteilen auf einen ProcessPoolExecutor verteilt. Die Ergebnisse kommen trotzdem in derselben
+    Reihenfolge und mit denselben Chunks wie im seriellen Pfad zurück. Es sind höchstens
+    2 * workers Dateien gleichzeitig in Arbeit, damit der Speicher begrenzt bleibt.
+    """
+    tasks = [
+        (source, file_path, known_hashes.get(source), text_splitter)
+        for source, file_path in sorted(sources.items())
+    ]
+    if not workers or workers <= 1:
+        for source, file_path, known_hash, _ in tasks:
+            file_hash = file_sha256(file_path)
+            if file_hash == known_hash:
+                yield source, file_hash, None
+            else:
+                yield source, file_hash, iter_chunk_texts(file_path, text_splitter)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(executor.submit(_split_file, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def incremental_ingest(db, sources, text_splitter, manifest_path, pipeline=None, workers=None):
+    """
+    Gleicht die Chroma-Collection mit den Quelldateien ab (synchrone Variante von aincremental_ingest).
+
+    Alle Aufrufe laufen auf der gemeinsamen Event-Loop der Embedding-Pipeline (siehe run_sync),
+    damit der Async-Client der Embeddings über mehrere Aufrufe hinweg gültig bleibt.
+    Parameter und Rückgabe wie aincremental_ingest.
+    """
+    return run_sync(aincremental_ingest(db, sources, text_splitter, manifest_path, pipeline, workers))
+
+
+async def aincremental_ingest(db, sources, text_splitter, manifest_path, pipeline=None, workers=None):
+    """
+    Gleicht die Chroma-Collection mit den Quelldateien ab.
+
+    Aufrufer mit eigener Event-Loop (z.B. mehrere Shards gleichzeitig) warten direkt auf diese Coroutine.
+    Blockierende Chroma- und Dateizugriffe laufen in Worker-Threads.
+
+    Args:
+        db: Chroma-Vektordatenbank (mit Embedding-Funktion)
+        sources: Dictionary {Quelle (Metadatum 'source'): Dateipfad}
+        text_splitter: Splitter für die Chunk-Aufteilung
+        manifest_path: Pfad des Manifests mit Datei- und Chunk-Hashes
+        pipeline: EmbeddingPipeline für das Einbetten und Schreiben
+            (Standard: Pipeline mit der Embedding-Funktion der Datenbank)
+        workers: Anzahl Prozesse für Lesen und Aufteilen (None = seriell im Hauptprozess)
+
+    Returns:
+        Dictionary mit Statistiken des Laufs
+    """
+    start = time.perf_counter()
+    manifest = load_manifest(manifest_path)
+    # Ohne Manifest oder nach einem abgebrochenen Lauf können Chunks ohne Manifest-Eintrag in der
+    # Collection liegen: diese werden am Ende abgeglichen
+    reconcile = manifest is None or manifest.get("pending", False)
+    if manifest is None:
+        manifest = {"version": MANIFEST_VERSION, "files": {}}
+    else:
+        await asyncio.to_thread(save_manifest, manifest_path, {**manifest, "pending": True})
+    old_files = manifest["files"]
+    # Manifeste vor Version 2: gespeicherte Chunks haben noch kein 'chunk_index'
+    migrate = manifest["version"] < 2
+    new_files = {}
+    stale_ids = []
+    metadata_updates = []  # (ID, Metadaten) unveränderter Chunks mit neuer Position
+    stats = {"files_unchanged": 0, "files_changed": 0, "files_removed": 0,
+             "chunks_added": 0, "chunks_deleted": 0, "chunks_kept": 0, "chunks_reindexed": 0,
+             "chunks_orphaned": 0}
+
+    def new_chunks():
+        """Liefert lazy alle neuen (Document, ID)-Paare und merkt sich veraltete IDs."""
+        known_hashes = {source: entry["sha256"] for source, entry in old_files.items()}
+        for source, file_hash, texts in iter_file_splits(sources, text_splitter, known_hashes, workers):
+            previous = old_files.get(source)
+
+            # Unveränderte Datei: nichts neu einbetten
+            if texts is None:
+                new_files[source] = previous
+                stats["files_unchanged"] += 1
+                stats["chunks_kept"] += len(previous["chunks"])
+                if migrate:
+                    metadata_updates.extend(
+                        (doc_id, {"source": source, "chunk_index": i})
+                        for i, doc_id in enumerate(previous["chunks"])
+                    )
+                continue
+
+            old_positions = {doc_id: i for i, doc_id in enumerate(previous["chunks"])} if previous else {}
+            ids = []
+
+            # Nur neue Chunks gehen in die Embedding-Pipeline (im Hauptprozess)
+            texts, id_texts = itertools.tee(texts)
+            added = 0
+            for chunk_index, (text, doc_id) in enumerate(zip(texts, iter_chunk_ids(source, id_texts))):
+                ids.append(doc_id)
+                metadata = {"source": source, "chunk_index": chunk_index}
+                if doc_id not in old_positions:
+                    added += 1
+                    yield Document(page_content=text, metadata=metadata), doc_id
+                elif migrate or old_positions[doc_id] != chunk_index:
+                    # Unveränderter Chunk an neuer Position: nur die Metadaten aktualisieren
+                    metadata_updates.append((doc_id, metadata))
+
+            # Chunks, die in der neuen Fassung nicht mehr vorkommen, werden danach gelöscht
+            stale = sorted(set(old_positions) - set(ids))
+            stale_ids.extend(stale)
+            new_files[source] = {"sha256": file_hash, "chunks": ids}
+            stats["files_changed"] += 1
+            stats["chunks_added"] += added
+            stats["chunks_deleted"] += len(stale)
+            stats["chunks_kept"] += len(ids) - added
+
+    # Einbetten und Schreiben laufen batchweise und nebenläufig (siehe embedding_pipeline.py)
+    if pipeline is None:
+        pipeline = EmbeddingPipeline(db.embeddings)
+    pipeline_stats = await pipeline.run(new_chunks(), chroma_writer(db))
+    stats["embedding_requests"] = pipeline_stats["requests"]
+    stats["embedding_retries"] = pipeline_stats["retries"]
+
+    # Quelldateien, die verschwunden sind: alle ihre Chunks löschen
+    for source in sorted(set(old_files) - set(sources)):
+        stale = old_files[source]["chunks"]
+        stale_ids.extend(stale)
+        stats["files_removed"] += 1
+        stats["chunks_deleted"] += len(stale)
+
+    def apply_changes():
+        if reconcile:
+            # Chunks aus abgebrochenen Läufen, die weder im neuen Manifest stehen noch ohnehin gelöscht werden
+            known = {doc_id for entry in new_files.values() for doc_id in entry["chunks"]}
+            known.update(stale_ids)
+            orphans = [doc_id for doc_id in iter_collection_ids(db) if doc_id not in known]
+            stale_ids.extend(orphans)
+            stats["chunks_orphaned"] = len(orphans)
+            stats["chunks_deleted"] += len(orphans)
+        for i in range(0, len(stale_ids), 5000):  # Chroma begrenzt die Batchgröße
+            db.delete(ids=stale_ids[i:i + 5000])
+        for i in range(0, len(metadata_updates), 5000):
+            batch = metadata_updates[i:i + 5000]
+            db._collection.update(ids=[doc_id for doc_id, _ in batch], metadatas=[m for _, m in batch])
+        manifest["version"] = MANIFEST_VERSION
+        manifest["files"] = new_files
+        manifest.pop("pending", None)
+        save_manifest(manifest_path, manifest)
+
+    await asyncio.to_thread(apply_changes)
+    stats["chunks_reindexed"] = len(metadata_updates)
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    stats["peak_rss_mb"] = peak_rss_mb()
+    return stats
+
+
+def print_ingest_stats(stats):
+    """Gibt die Statistiken eines Ingestion-Laufs aus."""
+    print("\n--- Ingestion summary ---")
+    for key, value in stats.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    # Vergleicht den seriellen mit dem parallelen Pfad (Chunks und Laufzeit)
+    from streaming_splitter import StreamingCharacterSplitter
+
+    books_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "documents")
+    sources = {f: os.path.join(books_dir, f) for f in os.listdir(books_dir) if f.endswith(".txt")}
+    text_splitter = StreamingCharacterSplitter(chunk_size=1000, chunk_overlap=50)
+
+    parallel = max(2, os.cpu_count() or 1)
+    results = {}
+    for workers in (None, parallel):
+        start = time.perf_counter()
+        results[workers] = [
+            (source, file_hash, list(texts))
+            for source, file_hash, texts in iter_file_splits(sources, text_splitter, {}, workers)
+        ]
+        chunks = sum(len(texts) for _, _, texts in results[workers])
+        print(f"workers={workers}: {chunks} chunks in {time.perf_counter() - start:.3f}s")
+    identical = results[None] == results[parallel]
+    print("Serial and parallel output identical:", identical)
@@ -0,0 +1,177 @@
+"""
+Lasttest für rag_server.py
+
+Schickt Fragen aus benchmark_queries.json mit steigender Parallelität an den RAG-Server und misst:
+- Durchsatz (Fragen pro Sekunde) und p50/p95/p99-Latenz pro Parallelitätsstufe
+- Fehler und Zeitüberschreitungen (HTTP 5xx)
+- Embedding-Anfragen an die API gegenüber der Zahl der Fragen (Micro-Batching, aus GET /stats)
+
+Ohne --url wird alles lokal gestartet: der Fake-Server aus mock_openai_server.py (Embeddings und Chat)
+in einem Hintergrund-Thread und der RAG-Server als eigener Prozess, der über OPENAI_BASE_URL auf den
+Fake-Server zeigt. Der Embedding-Cache ist dabei abgeschaltet, damit jede Frage die volle Kette
+durchläuft. Jede Frage bekommt eine laufende Nummer, damit keine zwei Texte gleich sind.
+Der Antwort-Cache bleibt aktiv (in einer temporären Datei), damit dessen Abfragen und Schreibzugriffe
+mitgemessen werden; mit --no-answer-cache lässt er sich für den Vergleich abschalten.
+"""
+import argparse  # Für die Kommandozeilenoptionen
+import asyncio  # Für die gleichzeitigen Anfragen
+import json  # Für die Fragen und NDJSON-Antworten
+import os  # Für Umgebungsvariablen und Pfade
+import subprocess  # Für den RAG-Server-Prozess
+import sys  # Für den Python-Interpreter
+import tempfile  # Für die Datei des Antwort-Caches
+import time  # Für die Zeitmessung
+
+import httpx
+import numpy as np
+
+from mock_openai_server import start_background_server
+
+current_dir = os.path.dirname(os.path.abspath(__file__))  # Aktuelles Verzeichnis ermitteln
+
+
+async def _ask(client, url, question, stream):
+    """Eine Frage stellen; liefert (Latenz in Sekunden, Erfolg)."""
+    start = time.perf_counter()
+    try:
+        payload = {"question": question, "stream": stream}
+        if stream:
+            async with client.stream("POST", f"{url}/ask", json=payload) as response:
+                last = None
+                async for line in response.aiter_lines():
+                    last = line or last
+                ok = response.status_code == 200 and last is not None and "error" not in json.loads(last)
+        else:
+            response = await client.post(f"{url}/ask", json=payload)
+            ok = response.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+async def run_level(url, questions, concurrency, total, stream, offset=0):
+    """Stellt 'total' Fragen mit höchstens 'concurrency' gleichzeitig offenen Anfragen (Nummern ab 'offset')."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(120.0)) as client:
+        before = (await client.get(f"{url}/stats")).json()
+        latencies, failures = [], 0
+        next_index = 0
+
+        async def worker():
+            nonlocal next_index, failures
+            while next_index < total:
+                i = next_index
+                next_index += 1
+                question = f"{questions[i % len(questions)]} ({offset + i})"  # Jede Frage einmalig, auch über Stufen
+                latency, ok = await _ask(client, url, question, stream)
+                latencies.append(latency)
+                failures += not ok
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        after = (await client.get(f"{url}/stats")).json()
+
+    batcher_before, batcher_after = before["embedding_batcher"], after["embedding_batcher"]
+    cache_hits = after["server"]["cache_hits"] - before["server"]["cache_hits"]
+    queries = batcher_after["queries"] - batcher_before["queries"]
+    batches = batcher_after["batches"] - batcher_before["batches"]
+    milliseconds = np.array(latencies) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "failures": failures,
+        "requests_per_second": round(total / elapsed, 1),
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 1),
+        "p95_ms": round(float(np.percentile(milliseconds, 95)), 1),
+        "p99_ms": round(float(np.percentile(milliseconds, 99)), 1),
+        "embedding_requests": batches,
+        "questions_per_embedding_request": round(queries / batches, 1) if batches else 0.0,
+        "answer_cache_hits": cache_hits,
+    }
+
+
+def start_local_stack(args):
+    """Startet Fake-Server (Thread) und RAG-Server (Prozess); liefert (URL, Prozess, Fake-Server)."""
+    mock, base_url = start_background_server(latency=args.mock_latency, token_latency=args.token_latency,
+                                             dim=args.dim)
+    env = dict(os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY="test")
+    command = [
+        sys.executable, os.path.join(current_dir, "rag_server.py"),
+        "--port", str(args.port),
+        "--timeout", str(args.timeout),
+        "--no-embedding-cache",
+    ]
+    if args.no_answer_cache:
+        command.append("--no-answer-cache")
+    else:
+        # Eigener Cache pro Lauf: Antworten des Fake-Servers landen nicht im echten Cache
+        command += ["--answer-cache-path", os.path.join(tempfile.mkdtemp(prefix="load_test_"), "answers.sqlite")]
+    if args.persist_directory:
+        command += ["--persist-directory", args.persist_directory]
+    process = subprocess.Popen(command, env=env)
+    url = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"rag_server.py exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{url}/health", timeout=1.0).status_code == 200:
+                return url, process, mock
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("rag_server.py did not start within 120s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for rag_server.py")
+    parser.add_argument("--url", help="Running RAG server (default: start server and mock LLM locally)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=200, help="Questions per concurrency level")
+    parser.add_argument("--stream", action="store_true", help="Use streamed answers")
+    parser.add_argument("--port", type=int, default=8080, help="Port for the locally started RAG server")
+    parser.add_argument("--persist-directory", help="Chroma database for the locally started RAG server")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-question timeout of the RAG server")
+    parser.add_argument("--mock-latency", type=float, default=0.05, help="Mock API latency per request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Mock delay between streamed tokens")
+    parser.add_argument("--dim", type=int, default=1536, help="Mock embedding dimension (must match the database)")
+    parser.add_argument("--no-answer-cache", action="store_true",
+                        help="Start the local RAG server without the semantic answer cache")
+    args = parser.parse_args()
+
+    with open(os.path.join(current_dir, "benchmark_queries.json"), "r", encoding="utf-8") as f:
+        questions = [query["query"] for query in json.load(f)]
+
+    process = mock = None
+    url = args.url
+    if url is None:
+        url, process, mock = start_local_stack(args)
+    try:
+        print(f"Load test against {url} ({args.requests} questions per level, stream={args.stream})")
+        for level, concurrency in enumerate(args.concurrency):
+            result = asyncio.run(
+                run_level(url, questions, concurrency, args.requests, args.stream, offset=level * args.requests)
+            )
+            print(
+                f"concurrency={result['concurrency']:>4}: {result['requests_per_second']:>7} req/s "
+                f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms "
+                f"failures={result['failures']} embedding requests={result['embedding_requests']} "
+                f"({result['questions_per_embedding_request']} questions each) "
+                f"answer cache hits={result['answer_cache_hits']}"
+            )
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if mock is not None:
+            print(f"Mock server stats: {mock.RequestHandlerClass.stats}")
+            mock.shutdown()
+
+
+if __name__ == "__main__":
+    main()
+
+# Befehl zum Ausführen des Skripts in einer Docker-Umgebung
+# docker-compose run --rm app langchain/4_RAGs/load_test.py
+# docker-compose run --rm app langchain/4_RAGs/load_test.py --stream --token-latency 0.01
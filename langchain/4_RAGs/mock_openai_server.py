@@ -0,0 +1,246 @@
+"""
+Lokaler Fake-Server für die OpenAI-Embedding- und Chat-API
+
+Dieser Server beantwortet POST /v1/embeddings und /v1/chat/completions im Format der OpenAI-API,
+ohne Netzwerk und ohne Kosten:
+- Deterministische Embeddings per Feature-Hashing der Wörter (gleicher Text = gleicher Vektor)
+- Unterstützt Text-Eingaben, Token-Listen und encoding_format 'float' bzw. 'base64'
+- Chat-Antworten aus den ersten Wörtern der letzten Nachricht, auch gestreamt (Server-Sent Events)
+  mit einstellbarer Pause pro Token (--token-latency)
+- Künstliche Latenz pro Anfrage (--latency)
+- Rate-Limit in Anfragen pro Sekunde (--max-rps); Überschreitungen liefern HTTP 429 mit Retry-After
+- Zufällige Serverfehler (--error-rate) zum Testen der Retry-Logik
+- HTTP/1.1 mit Keep-Alive, damit wiederverwendete Verbindungen der Clients sichtbar werden
+
+Damit lassen sich die Ingestion-Pipeline (embedding_pipeline.py) und alle anderen 4_RAGs-Skripte
+offline testen, indem man die OpenAI-Clients auf den Server umleitet. Die Skripte schreiben nach
+<Skriptverzeichnis>/db; damit die Fake-Vektoren weder in der echten Chroma-Datenbank noch im echten
+Embedding-Cache landen, läuft der Test in einer Kopie des Verzeichnisses (eigenes db/):
+
+    python langchain/4_RAGs/mock_openai_server.py --port 8089 --latency 0.2 --max-rps 20
+    rm -rf /tmp/rag_mock && cp -r langchain/4_RAGs /tmp/rag_mock && rm -rf /tmp/rag_mock/db
+    OPENAI_BASE_URL=http://localhost:8089/v1 OPENAI_API_KEY=test python /tmp/rag_mock/2a_rag_basics_metadata.py
+"""
+import argparse  # Für die Kommandozeilenoptionen
+import base64  # Für encoding_format='base64'
+import hashlib  # Für das Feature-Hashing
+import json  # Für Anfragen und Antworten
+import random  # Für zufällige Fehler
+import re  # Für die Tokenisierung
+import threading  # Für den Rate-Limiter und den Hintergrundbetrieb
+import time  # Für Latenz und Rate-Limit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+DEFAULT_DIM = 1536  # Dimension von text-embedding-3-small
+ANSWER_WORDS = 40  # Länge der Chat-Antworten in Wörtern
+
+
+def hash_embedding(text, dim=DEFAULT_DIM):
+    """Deterministisches, normiertes Embedding: jedes Wort wird per Hash auf eine Dimension abgebildet."""
+    vector = np.zeros(dim, dtype=np.float32)
+    tokens = text if isinstance(text, list) else re.findall(r"\w+", text.lower())
+    for token in tokens:
+        digest = hashlib.blake2b(str(token).encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return vector / norm
+
+
+class _RateLimiter:
+    """Gleitendes Ein-Sekunden-Fenster für --max-rps."""
+
+    def __init__(self, max_rps):
+        self.max_rps = max_rps
+        self._lock = threading.Lock()
+        self._timestamps = []
+
+    def allow(self):
+        if not self.max_rps:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            self._timestamps = [t for t in self._timestamps if now - t < 1.0]
+            if len(self._timestamps) >= self.max_rps:
+                return False
+            self._timestamps.append(now)
+            return True
+
+
+class _MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 512  # Viele gleichzeitige Verbindungen beim Lasttest annehmen
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-Alive; jede Antwort hat Content-Length oder schließt die Verbindung
+    disable_nagle_algorithm = True  # Header und Body getrennt geschrieben: sonst 40ms Delayed-ACK pro Antwort
+
+    # Werden von make_server() gesetzt
+    latency = 0.0
+    token_latency = 0.0
+    error_rate = 0.0
+    dim = DEFAULT_DIM
+    limiter = _RateLimiter(0)
+    stats = {"requests": 0, "rate_limited": 0, "errors": 0, "inputs": 0, "chat_completions": 0}
+
+    def log_message(self, format, *args):
+        pass  # Keine Zugriffslogs auf der Konsole
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        request = self._read_json()  # Immer vollständig lesen, sonst stört der Rest die nächste Anfrage
+        self.stats["requests"] += 1
+        if not self.limiter.allow():
+            self.stats["rate_limited"] += 1
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                headers={"Retry-After": "1"},
+            )
+            return
+        if self.error_rate and random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            self._send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        if self.path.rstrip("/").endswith("/embeddings"):
+            self._handle_embeddings(request)
+        elif self.path.rstrip("/").endswith("/chat/completions"):
+            self._handle_chat(request)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _handle_embeddings(self, request):
+        inputs = request.get("input", [])
+        # Einzelner Text oder einzelne Token-Liste
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        self.stats["inputs"] += len(inputs)
+        dim = int(request.get("dimensions") or self.dim)
+        data = []
+        for i, item in enumerate(inputs):
+            vector = hash_embedding(item, dim)
+            if request.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(len(item) if isinstance(item, list) else len(item.split()) for item in inputs)
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "mock-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _handle_chat(self, request):
+        messages = request.get("messages", [])
+        content = messages[-1].get("content", "") if messages else ""
+        if isinstance(content, list):  # Inhalt in Teilen (z.B. Text und Bild)
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in messages)
+        words = ["Mock", "answer:"] + content.split()[:ANSWER_WORDS]
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                 "total_tokens": prompt_tokens + len(words)}
+        self.stats["chat_completions"] += 1
+        base = {"id": f"chatcmpl-mock-{self.stats['requests']}", "created": int(time.time()),
+                "model": request.get("model", "mock-chat")}
+        if not request.get("stream"):
+            self._send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": usage,
+            })
+            return
+
+        # Gestreamte Antwort: ein Chunk pro Wort, danach optional die Token-Nutzung und [DONE]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")  # Ende der Antwort = Ende der Verbindung
+        self.end_headers()
+        self.close_connection = True
+
+        def send_event(payload):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        for i, word in enumerate(words):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            delta = {"content": word if i == 0 else " " + word}
+            if i == 0:
+                delta["role"] = "assistant"
+            send_event({**base, "object": "chat.completion.chunk",
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        send_event({**base, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send_event({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def make_server(host="127.0.0.1", port=8089, latency=0.0, max_rps=0, error_rate=0.0, dim=DEFAULT_DIM,
+                token_latency=0.0):
+    """Erzeugt den Server mit eigener Handler-Klasse (Konfiguration pro Server)."""
+    handler = type("ConfiguredMockOpenAIHandler", (MockOpenAIHandler,), {
+        "latency": latency,
+        "token_latency": token_latency,
+        "error_rate": error_rate,
+        "dim": dim,
+        "limiter": _RateLimiter(max_rps),
+        "stats": {"requests": 0, "rate_limited": 0, "errors": 0, "inputs": 0, "chat_completions": 0},
+    })
+    return _MockServer((host, port), handler)
+
+
+def start_background_server(**kwargs):
+    """Startet den Server in einem Hintergrund-Thread und gibt (server, base_url) zurück."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake OpenAI API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of delay per request")
+    parser.add_argument("--max-rps", type=int, default=0, help="Requests per second before HTTP 429 (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds between streamed chat tokens")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.max_rps, args.error_rate, args.dim,
+                         args.token_latency)
+    print(f"Mock OpenAI server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nStats: {server.RequestHandlerClass.stats}")
+
+# docker-compose run --rm app langchain/4_RAGs/mock_openai_server.py --latency 0.2 --max-rps 20
@@ -0,0 +1,85 @@
+"""
+Benchmark der quantisierten Vektorspeicher (int8 / binär) gegen die exakte Suche
+
+Dieses Skript misst für den Dracula/Frankenstein-Korpus aus der Chroma-Datenbank mit Metadaten:
+- recall@k der Backends 'int8' und 'binary' bei unterschiedlicher Re-Ranking-Tiefe
+- Speicherbedarf der im RAM gehaltenen Codes im Vergleich zur float32-Matrix
+- p50/p95-Latenz pro Abfrage
+
+Referenz ist die exakte Brute-Force-Suche über die vollen Vektoren. Abfragen sind leicht verrauschte
+Chunk-Vektoren, daher sind keine Embedding-Aufrufe nötig.
+
+Dieses Skript setzt voraus, dass 2a_rag_basics_metadata.py bereits ausgeführt wurde.
+"""
+import argparse  # Für die Kommandozeilenoptionen
+import os  # Für Dateisystem-Operationen
+import time  # Für die Latenzmessung
+
+import numpy as np
+from langchain_chroma import Chroma
+
+from vector_store import LocalVectorStore, normalize
+
+current_dir = os.path.dirname(os.path.abspath(__file__))  # Aktuelles Verzeichnis ermitteln
+db_dir = os.path.join(current_dir, "db")  # Übergeordnetes Verzeichnis für die Vektordatenbank
+
+parser = argparse.ArgumentParser(description="Recall@k of int8 and binary quantized indexes")
+parser.add_argument("--persist-directory", default=os.path.join(db_dir, "chroma_db_with_metadata"))
+parser.add_argument("--sources", nargs="+", default=["Dracula.txt", "Frankenstein.txt"])
+parser.add_argument("--queries", type=int, default=200, help="Number of sampled queries")
+parser.add_argument("--k", type=int, default=5)
+parser.add_argument("--rerank", type=int, nargs="+", default=[10, 50, 100, 200])
+parser.add_argument("--noise", type=float, default=0.05, help="Gaussian noise added to query vectors")
+args = parser.parse_args()
+
+# Nur die gewünschten Bücher aus der Chroma-Collection exportieren
+db = Chroma(persist_directory=args.persist_directory)
+data = db.get(where={"source": {"$in": args.sources}}, include=["embeddings", "documents", "metadatas"])
+if not data["ids"]:
+    raise SystemExit(f"No chunks of {', '.join(args.sources)} in {args.persist_directory}; "
+                     "run 2a_rag_basics_metadata.py first")
+bench_path = os.path.join(db_dir, "quantization_benchmark_local")
+exact = LocalVectorStore.build(
+    bench_path, data["embeddings"], data["ids"], data["documents"], data["metadatas"], None,
+)
+print(f"{len(exact)} chunks from {', '.join(args.sources)}")
+
+# Abfragen: zufällige Chunk-Vektoren mit etwas Rauschen
+rng = np.random.default_rng(0)
+rows = rng.choice(len(exact), min(args.queries, len(exact)), replace=False)
+queries = normalize(
+    np.asarray(exact.vectors[rows]) + rng.normal(0, args.noise, (len(rows), exact.vectors.shape[1]))
+)
+
+
+def measure(store):
+    """Führt alle Abfragen aus und liefert (Ergebnis-IDs pro Abfrage, Latenzen in ms)."""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        docs = store.similarity_search_by_vector_with_score(query, args.k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([doc.id for doc, _ in docs])
+    return results, np.array(latencies)
+
+
+truth, latencies = measure(exact)
+float_bytes = exact.index.nbytes
+configs = [("float32 exact", exact.index.nbytes, latencies, truth)]
+for backend in ("int8", "binary"):
+    for rerank in args.rerank:
+        store = LocalVectorStore(bench_path, None, backend=backend, rerank=rerank)
+        results, latencies = measure(store)
+        configs.append((f"{backend} rerank={rerank}", store.index.nbytes, latencies, results))
+
+print(f"\n--- recall@{args.k} vs. exact search, {len(queries)} queries ---")
+for name, nbytes, latencies, results in configs:
+    recall = np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth) if t])
+    print(
+        f"{name:<20} recall@{args.k}={recall:.3f}  "
+        f"RAM={nbytes / 1024:.0f} KiB ({float_bytes / nbytes:.0f}x smaller)  "
+        f"p50={np.percentile(latencies, 50):.3f}ms  p95={np.percentile(latencies, 95):.3f}ms"
+    )
+
+# Befehl zum Ausführen des Skripts in einer Docker-Umgebung
+# docker-compose run --rm app langchain/4_RAGs/quantization_benchmark.py
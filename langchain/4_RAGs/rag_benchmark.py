@@ -0,0 +1,264 @@
+"""
+Benchmark- und Regressionssuite für die 4_RAGs-Pipeline
+
+Dieses Skript misst die komplette Kette aus Ingestion und Retrieval reproduzierbar und offline:
+- Embeddings: HashingEmbeddings (deterministisches Feature-Hashing der Wörter, keine API-Aufrufe)
+- Index: die Bücher aus documents/ werden pro Konfiguration frisch über incremental_ingest eingelesen
+- Abfragen: feste Fragen aus benchmark_queries.json; relevant ist jeder Chunk der richtigen Quelle,
+  der die markierte Textstelle ('needle') enthält. So bleiben die Labels unabhängig von der Chunkgröße.
+- Konfigurationen: Chunkgröße × Überlappung × Speicher (chroma, bruteforce, ivf, int8) × score_threshold
+  ('binary' nur auf Anfrage: die HashingEmbeddings sind dünn besetzt, fast alle Dimensionen sind 0 und
+  damit nach Vorzeichen-Quantisierung gleich; der Recall läge bei 0 und sagt nichts über echte Embeddings)
+  (alle Speicher liefern Chromas Relevanz 1 - d/√2 auf der quadrierten L2-Distanz, ein Schwellenwert
+  bedeutet also überall dasselbe; die Relevanzfunktion wird pro Ergebnis mitgespeichert)
+- Kennzahlen: recall@k, MRR, p50/p95/p99-Latenz, Ingestion-Durchsatz (Chunks/s), maximaler RSS
+
+Jede Konfiguration läuft in einem eigenen Prozess, damit der gemessene Speicher nicht von
+vorherigen Läufen abhängt. Die Ergebnisse werden als JSON gespeichert; mit --baseline wird ein
+früherer Lauf verglichen und bei Verschlechterungen mit Exit-Code 1 beendet.
+"""
+import argparse  # Für die Kommandozeilenoptionen
+import json  # Für Abfragen und Ergebnisse
+import multiprocessing  # Für einen frischen Prozess pro Konfiguration
+import os  # Für Dateisystem-Operationen
+import platform  # Für die Umgebungsangaben im Ergebnis
+import shutil  # Für das Aufräumen der Arbeitsverzeichnisse
+import sys  # Für den Exit-Code
+import tempfile  # Für die Arbeitsverzeichnisse
+import time  # Für die Latenzmessung
+from concurrent.futures import ProcessPoolExecutor  # Für die Prozess-Isolation
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from mock_openai_server import hash_embedding
+from text_utils import STOPWORDS, tokenize
+
+current_dir = os.path.dirname(os.path.abspath(__file__))  # Aktuelles Verzeichnis ermitteln
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministische Offline-Embeddings: Wörter (ohne Stoppwörter) per Hash auf Dimensionen abgebildet."""
+
+    model = "hashing"
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _embed(self, text):
+        return hash_embedding([t for t in tokenize(text) if t not in STOPWORDS], self.dim).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def load_queries(path):
+    """Lädt die Abfragen mit ihren Labels (Quelle und Textstelle)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_relevant(doc, query):
+    """Ein Chunk ist relevant, wenn er aus der richtigen Quelle stammt und die Textstelle enthält."""
+    if doc.metadata.get("source") != query["source"]:
+        return False
+    return query["needle"] in " ".join(doc.page_content.split())  # Zeilenumbrüche ignorieren
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 3) if len(values) else None
+
+
+def evaluate(store, queries, k, score_threshold):
+    """Spielt alle Abfragen ab und berechnet recall@k, MRR und Latenzen."""
+    latencies, reciprocal_ranks, returned = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        docs_and_scores = store.similarity_search_with_relevance_scores(
+            query["query"], k=k, score_threshold=score_threshold
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        returned.append(len(docs_and_scores))
+        rank = next((i for i, (doc, _) in enumerate(docs_and_scores, 1) if is_relevant(doc, query)), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    return {
+        f"recall@{k}": round(float(np.mean([rr > 0 for rr in reciprocal_ranks])), 4),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "avg_results": round(float(np.mean(returned)), 2),
+    }
+
+
+def run_config(config, queries, k, work_dir):
+    """
+    Führt eine Konfiguration (Chunkgröße, Überlappung, Speicher) für alle Schwellenwerte aus.
+
+    Läuft in einem eigenen Prozess; die Importe erfolgen erst hier.
+    """
+    import logging
+    import warnings
+
+    from langchain_chroma import Chroma
+
+    from embedding_pipeline import EmbeddingPipeline
+    from ingestion import incremental_ingest, manifest_path_for, peak_rss_mb
+    from streaming_splitter import StreamingCharacterSplitter
+    from vector_store import LocalVectorStore
+
+    logging.disable(logging.WARNING)  # Warnungen über zu große Chunks ausblenden
+    warnings.filterwarnings("ignore", message="Relevance scores must be between")
+
+    books_dir = os.path.join(current_dir, "documents")
+    sources = {f: os.path.join(books_dir, f) for f in sorted(os.listdir(books_dir)) if f.endswith(".txt")}
+    embeddings = HashingEmbeddings()
+    persist_directory = os.path.join(work_dir, "chroma")
+
+    db = Chroma(embedding_function=embeddings, persist_directory=persist_directory)
+    splitter = StreamingCharacterSplitter(chunk_size=config["chunk_size"], chunk_overlap=config["chunk_overlap"])
+    pipeline = EmbeddingPipeline(embeddings, batch_size=256, max_in_flight=4)
+    ingest = incremental_ingest(db, sources, splitter, manifest_path_for(persist_directory), pipeline=pipeline)
+
+    start = time.perf_counter()
+    if config["store"] == "chroma":
+        store = db
+    else:
+        store = LocalVectorStore.from_chroma(db, os.path.join(work_dir, "local"), backend=config["store"])
+    index_seconds = time.perf_counter() - start
+
+    results = []
+    for score_threshold in config["score_thresholds"]:
+        metrics = evaluate(store, queries, k, score_threshold)
+        results.append({
+            "chunk_size": config["chunk_size"],
+            "chunk_overlap": config["chunk_overlap"],
+            "store": config["store"],
+            "score_threshold": score_threshold,
+            "relevance_fn": store._select_relevance_score_fn().__name__,  # Skala des Schwellenwerts
+            **metrics,
+            "chunks": ingest["chunks_added"],
+            "ingest_seconds": ingest["seconds"],
+            "chunks_per_second": round(ingest["chunks_added"] / ingest["seconds"], 1) if ingest["seconds"] else None,
+            "index_seconds": round(index_seconds, 3),
+            "peak_rss_mb": peak_rss_mb(),
+        })
+    return results
+
+
+def result_key(result):
+    return (result["chunk_size"], result["chunk_overlap"], result["store"], result["score_threshold"])
+
+
+def compare(results, baseline, k, max_recall_drop, max_latency_increase, max_throughput_drop):
+    """Vergleicht mit einem früheren Lauf und liefert die Liste der Verschlechterungen."""
+    previous = {result_key(r): r for r in baseline["results"]}
+    regressions = []
+    print("\n--- Comparison with baseline ---")
+    for result in results:
+        old = previous.get(result_key(result))
+        if old is None:
+            continue
+        name = "/".join(str(part) for part in result_key(result))
+        if result["score_threshold"] and old.get("relevance_fn") != result["relevance_fn"]:
+            # Ältere Läufe der lokalen Speicher nutzten die Kosinus-Relevanz: Schwellenwert nicht vergleichbar
+            print(f"{name:<32} skipped: relevance scale {old.get('relevance_fn')} -> {result['relevance_fn']}")
+            continue
+        recall_key = f"recall@{k}"
+        checks = [
+            (recall_key, old.get(recall_key, 0) - result[recall_key] > max_recall_drop),
+            ("mrr", old["mrr"] - result["mrr"] > max_recall_drop),
+            ("p95_ms", result["p95_ms"] is not None and old.get("p95_ms") is not None
+             and result["p95_ms"] > old["p95_ms"] * (1 + max_latency_increase)),
+            # Ohne neue Chunks (z.B. leeres documents/) gibt es keinen Durchsatz: nicht vergleichbar
+            ("chunks_per_second", result["chunks_per_second"] is not None and old.get("chunks_per_second") is not None
+             and result["chunks_per_second"] < old["chunks_per_second"] * (1 - max_throughput_drop)),
+        ]
+        for metric, regressed in checks:
+            marker = "REGRESSION" if regressed else "ok"
+            print(f"{name:<32} {metric:<18} {old.get(metric)!s:>10} -> {result[metric]!s:<10} {marker}")
+            if regressed:
+                regressions.append({"config": name, "metric": metric, "baseline": old.get(metric),
+                                    "current": result[metric]})
+    return regressions
+
+
+def print_results(results, k):
+    print(f"\n--- Results (recall@{k}, MRR, latency per query, ingest throughput) ---")
+    for r in results:
+        print(
+            f"size={r['chunk_size']:<5} overlap={r['chunk_overlap']:<4} {r['store']:<10} "
+            f"threshold={r['score_threshold']:<4} recall@{k}={r[f'recall@{k}']:.3f} mrr={r['mrr']:.3f} "
+            f"p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms p99={r['p99_ms']:.2f}ms "
+            f"{r['chunks_per_second']} chunks/s rss={r['peak_rss_mb']}MB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark for the 4_RAGs pipeline")
+    parser.add_argument("--queries", default=os.path.join(current_dir, "benchmark_queries.json"))
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[500, 1000])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[50])
+    # 'binary' ist mit den dünn besetzten HashingEmbeddings sinnlos (Recall 0), siehe Modul-Docstring
+    parser.add_argument("--stores", nargs="+", default=["chroma", "bruteforce", "ivf", "int8"],
+                        choices=["chroma", "bruteforce", "ivf", "int8", "binary"])
+    parser.add_argument("--score-thresholds", type=float, nargs="+", default=[0.0, 0.2])
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--output", default=os.path.join(current_dir, "db", "benchmark_results.json"))
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--max-recall-drop", type=float, default=0.01)
+    parser.add_argument("--max-latency-increase", type=float, default=0.5, help="Allowed relative p95 increase")
+    parser.add_argument("--max-throughput-drop", type=float, default=0.3, help="Allowed relative chunks/s drop")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries)
+    configs = [
+        {"chunk_size": size, "chunk_overlap": overlap, "store": store, "score_thresholds": args.score_thresholds}
+        for size in args.chunk_sizes for overlap in args.overlaps for store in args.stores
+    ]
+    results = []
+    context = multiprocessing.get_context("spawn")  # Frischer Prozess: RSS-Messung ohne Altlasten
+    for config in configs:
+        print(f"Running chunk_size={config['chunk_size']} overlap={config['chunk_overlap']} store={config['store']}...")
+        work_dir = tempfile.mkdtemp(prefix="rag_benchmark_")
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results.extend(executor.submit(run_config, config, queries, args.k, work_dir).result())
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print_results(results, args.k)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "k": args.k,
+        "queries": len(queries),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.k, args.max_recall_drop,
+                              args.max_latency_increase, args.max_throughput_drop)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) found")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
+
+# Befehl zum Ausführen des Skripts in einer Docker-Umgebung
+# docker-compose run --rm app langchain/4_RAGs/rag_benchmark.py
+# docker-compose run --rm app langchain/4_RAGs/rag_benchmark.py --output new.json --baseline db/benchmark_results.json
@@ -0,0 +1,308 @@
+"""
+Asynchroner RAG-Server für viele gleichzeitige Fragen
+
+Dieser Server bietet den Ablauf aus 3_rag_one_off_question.py als langlebigen HTTP-Dienst an.
+Alles Teure wird nur einmal beim Start aufgebaut und von allen Anfragen gemeinsam genutzt:
+- Vektorspeicher (Chroma oder lokales Backend über RAG_VECTOR_STORE), Tokenizer, Reranker, Antwort-Cache
+- Ein gemeinsamer httpx.AsyncClient mit Verbindungspool für Embedding- und Chat-Aufrufe
+- Abfrage-Embeddings gleichzeitiger Fragen werden zu einer Anfrage gebündelt (siehe embedding_batcher.py)
+- Vektorsuche, Antwort-Cache (SQLite) und Kontext-Packing laufen in Worker-Threads, die Event-Loop blockiert nicht
+- Jede Frage hat ein Zeitlimit (--timeout); Überschreitungen liefern HTTP 504
+
+Endpunkte:
+- POST /ask   {"question": "...", "source": "Dracula.txt" (optional), "stream": false}
+              Antwort als JSON, bzw. mit "stream": true als NDJSON (ein Token pro Zeile, am Ende die Zeiten)
+- GET /stats  Zähler des Servers, des Embedding-Batchers und des Antwort-Caches
+- GET /health
+
+Der Durchsatz skaliert damit mit der Zahl gleichzeitiger Anfragen statt mit der Zahl der Prozesse.
+Lasttest gegen einen lokalen Fake-Server: siehe load_test.py.
+"""
+import argparse  # Für die Kommandozeilenoptionen
+import asyncio  # Für die nebenläufige Verarbeitung
+import json  # Für die NDJSON-Zeilen
+import os  # Für Dateisystem-Operationen
+import time  # Für die Zeitmessung
+
+import httpx
+from aiohttp import web
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from context_packing import TokenCounter, pack_context
+from embedding_batcher import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, AsyncEmbeddingBatcher
+from embedding_cache import CachedEmbeddings
+from reranking import DEFAULT_FETCH_K, load_reranker
+from semantic_cache import SemanticCache, index_version
+from vector_store import load_vector_store
+
+current_dir = os.path.dirname(os.path.abspath(__file__))  # Aktuelles Verzeichnis ermitteln
+db_dir = os.path.join(current_dir, "db")
+
+SYSTEM_PROMPT = "You are a helpful assistant."
+
+
+def build_prompt(query, passages):
+    """Kombiniert Frage und Passagen wie in 3_rag_one_off_question.py."""
+    return (
+        "Here are some documents that might help answer the question: "
+        + query
+        + "\n\n Relevant documents: "
+        + "\n".join([passage["text"] for passage in passages])
+        + "\n\n Please provide a rough answer based only on the provided documents. If the answer ist not in the documents, respond with 'Not provided in the documents'."
+    )
+
+
+class RAGService:
+    """
+    Gemeinsamer Zustand aller Anfragen: Clients, Vektorspeicher, Caches und Zähler.
+
+    Args:
+        persistent_directory: Chroma-Datenbank mit Metadaten
+        k: Anzahl Chunks pro Frage im Prompt
+        token_budget: Token-Budget für die Passagen im Prompt
+        timeout: Zeitlimit pro Frage in Sekunden
+        max_connections: Größe des HTTP-Verbindungspools zur OpenAI-API
+        batch_wait_ms / batch_size: Sammelfenster und maximale Größe der Embedding-Batches
+        answer_cache: Semantischen Antwort-Cache verwenden
+        answer_cache_path: SQLite-Datei des Antwort-Caches (Standard: db/semantic_cache.sqlite)
+        embedding_cache: Lokalen Embedding-Cache verwenden (beim Lasttest gegen den Fake-Server abschalten,
+            sonst landen dessen Vektoren unter dem echten Modellnamen im Cache)
+    """
+
+    def __init__(self, persistent_directory, k=4, token_budget=800, timeout=30.0, max_connections=100,
+                 batch_wait_ms=DEFAULT_MAX_WAIT_MS, batch_size=DEFAULT_MAX_BATCH_SIZE, answer_cache=True,
+                 embedding_cache=True, answer_cache_path=None):
+        self.k = k
+        self.token_budget = token_budget
+        self.timeout = timeout
+        # Ein Pool für alle Anfragen: Verbindungen (inkl. TLS) werden wiederverwendet statt neu aufgebaut
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout),
+        )
+        self.embeddings = OpenAIEmbeddings(
+            model="text-embedding-3-small",
+            http_async_client=self.http_client,
+            check_embedding_ctx_length=False,  # Fragen sind kurz; Texte direkt senden
+        )
+        if embedding_cache:
+            self.embeddings = CachedEmbeddings(self.embeddings, cache_dir=os.path.join(db_dir, "embedding_cache"))
+        self.db = load_vector_store(persistent_directory, self.embeddings)
+        self.model = ChatOpenAI(
+            model="gpt-4o-mini",
+            stream_usage=True,
+            http_async_client=self.http_client,
+            max_retries=1,  # Das Zeitlimit pro Frage begrenzt ohnehin die Gesamtdauer
+        )
+        self.token_counter = TokenCounter("gpt-4o-mini")
+        self.reranker = load_reranker(db_dir)  # RAG_RERANKER=lexical|cross-encoder|none
+        self.batcher = AsyncEmbeddingBatcher(self.embeddings, max_wait_ms=batch_wait_ms, max_batch_size=batch_size)
+        self.answer_cache = SemanticCache(
+            answer_cache_path or os.path.join(db_dir, "semantic_cache.sqlite"),
+            lambda: index_version(persistent_directory),  # Re-Ingest während der Laufzeit leert den Cache
+        ) if answer_cache else None
+        self.counters = {"requests": 0, "in_flight": 0, "cache_hits": 0, "timeouts": 0, "errors": 0}
+
+    async def close(self):
+        await self.http_client.aclose()
+
+    async def retrieve(self, query, search_filter=None):
+        """Bettet die Frage (gebündelt) ein und sucht die passenden Chunks; liefert (Vektor, Chunks, Zeiten)."""
+        start = time.perf_counter()
+        query_embedding = await self.batcher.embed_query(query)
+        embedded = time.perf_counter()
+        docs = await asyncio.to_thread(self._search, query, query_embedding, search_filter)
+        timings = {
+            "embedding_ms": round((embedded - start) * 1000, 1),
+            "retrieval_ms": round((time.perf_counter() - embedded) * 1000, 1),
+        }
+        return query_embedding, docs, timings
+
+    def _search(self, query, query_embedding, search_filter):
+        """Vektorsuche und Re-Ranking (läuft in einem Worker-Thread)."""
+        if self.reranker is None:
+            return self.db.similarity_search_by_vector(query_embedding, k=self.k, filter=search_filter)
+        candidates = self.db.similarity_search_by_vector(query_embedding, k=DEFAULT_FETCH_K, filter=search_filter)
+        return self.reranker.rerank(query, candidates, self.k)
+
+    def _prepare(self, query, query_embedding, docs):
+        """Antwort aus dem Cache oder die Nachrichten für das LLM (läuft in einem Worker-Thread)."""
+        chunk_ids = [doc.id for doc in docs]
+        if self.answer_cache is not None:
+            cached_answer = self.answer_cache.lookup(query_embedding, chunk_ids)
+            if cached_answer is not None:
+                return cached_answer, None
+        passages, _ = pack_context(docs, token_budget=self.token_budget, token_counter=self.token_counter)
+        return None, [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=build_prompt(query, passages))]
+
+    async def prepare(self, query, query_embedding, docs):
+        """Cache-Abfrage (SQLite) und Tokenisierung blockieren, daher im Worker-Thread."""
+        answer, messages = await asyncio.to_thread(self._prepare, query, query_embedding, docs)
+        if answer is not None:
+            self.counters["cache_hits"] += 1
+        return answer, messages
+
+    async def remember(self, query, query_embedding, docs, result):
+        if self.answer_cache is not None and result is not None and result.content:
+            tokens = (result.usage_metadata or {}).get("total_tokens", 0)
+            await asyncio.to_thread(
+                self.answer_cache.put, query, query_embedding, [doc.id for doc in docs], result.content, tokens
+            )
+
+    async def answer(self, query, search_filter=None):
+        """Vollständige Antwort als Dictionary (Antwort, Quellen, Zeiten)."""
+        start = time.perf_counter()
+        query_embedding, docs, timings = await self.retrieve(query, search_filter)
+        answer, messages = await self.prepare(query, query_embedding, docs)
+        if answer is None:
+            llm_start = time.perf_counter()
+            result = await self.model.ainvoke(messages)
+            timings["llm_ms"] = round((time.perf_counter() - llm_start) * 1000, 1)
+            await self.remember(query, query_embedding, docs, result)
+            answer = result.content
+        timings["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return {
+            "answer": answer,
+            "sources": [doc.metadata.get("source") for doc in docs],
+            "cached": "llm_ms" not in timings,
+            "timings": timings,
+        }
+
+    async def stream_answer(self, query, search_filter=None):
+        """Liefert die Antwort tokenweise und zum Schluss ein Dictionary mit Quellen und Zeiten."""
+        start = time.perf_counter()
+        query_embedding, docs, timings = await self.retrieve(query, search_filter)
+        answer, messages = await self.prepare(query, query_embedding, docs)
+        if answer is not None:
+            yield answer
+        else:
+            result = None
+            async for chunk in self.model.astream(messages):
+                if "ttft_ms" not in timings and chunk.content:
+                    timings["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                if chunk.content:
+                    yield chunk.content
+                result = chunk if result is None else result + chunk
+            await self.remember(query, query_embedding, docs, result)
+        timings["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        yield {"done": True, "sources": [doc.metadata.get("source") for doc in docs],
+               "cached": answer is not None, "timings": timings}
+
+    @property
+    def stats(self):
+        return {
+            "server": dict(self.counters),
+            "embedding_batcher": self.batcher.stats,
+            "reranker": dict(self.reranker.stats) if self.reranker is not None else None,
+            "answer_cache": self.answer_cache.stats if self.answer_cache is not None else None,
+        }
+
+
+def _error(status, message):
+    return web.json_response({"error": message}, status=status)
+
+
+async def handle_ask(request):
+    service = request.app["service"]
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        return _error(400, "Request body must be JSON")
+    query = body.get("question")
+    if not isinstance(query, str) or not query.strip():
+        return _error(400, "Field 'question' is required")
+    search_filter = {"source": body["source"]} if body.get("source") else None
+
+    service.counters["requests"] += 1
+    service.counters["in_flight"] += 1
+    try:
+        if body.get("stream"):
+            return await _stream(request, service, query, search_filter)
+        async with asyncio.timeout(service.timeout):
+            return web.json_response(await service.answer(query, search_filter))
+    except TimeoutError:
+        service.counters["timeouts"] += 1
+        return _error(504, f"No answer within {service.timeout}s")
+    except Exception as exc:  # Fehler der OpenAI-API oder des Vektorspeichers
+        service.counters["errors"] += 1
+        return _error(502, f"{type(exc).__name__}: {exc}")
+    finally:
+        service.counters["in_flight"] -= 1
+
+
+async def _stream(request, service, query, search_filter):
+    """NDJSON-Antwort; nach dem ersten Byte lassen sich Fehler nur noch als letzte Zeile melden."""
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    try:
+        async with asyncio.timeout(service.timeout):
+            async for item in service.stream_answer(query, search_filter):
+                line = item if isinstance(item, dict) else {"token": item}
+                await response.write((json.dumps(line) + "\n").encode("utf-8"))
+    except TimeoutError:
+        service.counters["timeouts"] += 1
+        await response.write((json.dumps({"error": f"No answer within {service.timeout}s"}) + "\n").encode("utf-8"))
+    except Exception as exc:
+        service.counters["errors"] += 1
+        await response.write((json.dumps({"error": f"{type(exc).__name__}: {exc}"}) + "\n").encode("utf-8"))
+    await response.write_eof()
+    return response
+
+
+async def handle_stats(request):
+    # Die Cache-Statistik schreibt offene Zähler nach SQLite
+    return web.json_response(await asyncio.to_thread(lambda: request.app["service"].stats))
+
+
+async def handle_health(request):
+    return web.json_response({"status": "ok"})
+
+
+def create_app(service):
+    app = web.Application()
+    app["service"] = service
+    app.router.add_post("/ask", handle_ask)
+    app.router.add_get("/stats", handle_stats)
+    app.router.add_get("/health", handle_health)
+
+    async def close_service(app):
+        await service.close()
+
+    app.on_cleanup.append(close_service)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Async RAG server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--persist-directory", default=os.path.join(db_dir, "chroma_db_with_metadata"))
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--token-budget", type=int, default=800)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds per question before HTTP 504")
+    parser.add_argument("--max-connections", type=int, default=100, help="Pooled connections to the OpenAI API")
+    parser.add_argument("--batch-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument("--no-answer-cache", action="store_true", help="Always ask the LLM")
+    parser.add_argument("--answer-cache-path", help="SQLite file of the answer cache (default: db/semantic_cache.sqlite)")
+    parser.add_argument("--no-embedding-cache", action="store_true", help="Always call the embedding API")
+    args = parser.parse_args()
+
+    service = RAGService(
+        args.persist_directory,
+        k=args.k,
+        token_budget=args.token_budget,
+        timeout=args.timeout,
+        max_connections=args.max_connections,
+        batch_wait_ms=args.batch_wait_ms,
+        batch_size=args.batch_size,
+        answer_cache=not args.no_answer_cache,
+        embedding_cache=not args.no_embedding_cache,
+        answer_cache_path=args.answer_cache_path,
+    )
+    print(f"RAG server listening on http://{args.host}:{args.port}")
+    web.run_app(create_app(service), host=args.host, port=args.port, print=None, backlog=1024)
+
+# Befehl zum Ausführen des Skripts in einer Docker-Umgebung
+# docker-compose run --rm -p 8080:8080 app langchain/4_RAGs/rag_server.py --host 0.0.0.0
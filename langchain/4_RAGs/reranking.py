@@ -0,0 +1,313 @@
+"""
+Re-Ranking der abgerufenen Chunks vor dem Prompt
+
+Die Reihenfolge der Vektorsuche ist nur eine grobe Schätzung der Relevanz. Statt k zu erhöhen
+(und damit den Prompt zu verlängern), werden mehr Kandidaten abgerufen und lokal neu bewertet:
+- Over-Fetch: der Basis-Retriever liefert fetch_k Kandidaten (z.B. 20)
+- Scorer (austauschbar, alle lokal auf der CPU):
+  'lexical'       BM25-artige Überlappung von Wörtern und Wortpaaren, vektorisiert über alle Kandidaten
+  'cross-encoder' Cross-Encoder aus sentence-transformers (optional, muss installiert sein)
+- Paar-Cache: Scores für (Scorer, Frage, Chunk-Text) werden in SQLite gespeichert und wiederverwendet
+- Der lexikalische Score allein ignoriert die Vektorsuche; er wird daher mit deren Rang gemischt
+  (vector_weight, beide Signale auf 0..1 normiert). Der Cross-Encoder ersetzt die Reihenfolge der Suche.
+- Nur die besten k Chunks gehen in den Prompt; der Score steht im Metadatum 'rerank_score'
+
+Re-Ranking ist optional; die Skripte aktivieren es per Umgebungsvariable RAG_RERANKER=lexical|cross-encoder
+(Standard: none).
+"""
+import hashlib  # Für die Schlüssel des Paar-Caches
+import os  # Für Dateisystem-Operationen
+import sqlite3  # Für den Paar-Cache
+import threading  # Für den gemeinsamen Zugriff aus mehreren Threads
+import time  # Für die LRU-Zeitstempel
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from text_utils import STOPWORDS, tokenize
+
+DEFAULT_FETCH_K = 20
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+def _terms(text):
+    """
+    Wörter (ohne Stoppwörter) und benachbarte Wortpaare, dazu die Anzahl Wörter.
+
+    Wortpaare belohnen Phrasen-Treffer ("castle of Dracula") gegenüber verstreuten Einzelwörtern.
+    """
+    tokens = tokenize(text)
+    words = [t for t in tokens if t not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])], len(tokens)
+
+
+class LexicalOverlapScorer:
+    """
+    BM25-artiger Überlappungs-Score zwischen Frage und Chunk, berechnet für alle Kandidaten in einem Schritt.
+
+    Der Score hängt nur vom Paar (Frage, Chunk) ab, nicht von den anderen Kandidaten,
+    und lässt sich daher im Paar-Cache ablegen.
+
+    Args:
+        k1: Sättigung der Termfrequenz
+        b: Stärke der Längennormierung
+        avg_length: Angenommene mittlere Chunklänge in Wörtern
+    """
+
+    name = "lexical"
+    vector_weight = 0.5  # Anteil des Vektor-Rangs am gemischten Score (siehe Reranker)
+
+    def __init__(self, k1=1.2, b=0.75, avg_length=180):
+        self.k1 = k1
+        self.b = b
+        self.avg_length = avg_length
+
+    def score(self, query, texts):
+        columns = {term: i for i, term in enumerate(dict.fromkeys(_terms(query)[0]))}
+        if not len(texts) or not columns:
+            return np.zeros(len(texts))
+        # Termfrequenzen nur für die Terme der Frage: Matrix (Kandidaten x Frage-Terme)
+        tf = np.zeros((len(texts), len(columns)))
+        lengths = np.zeros(len(texts))
+        for row, text in enumerate(texts):
+            terms, lengths[row] = _terms(text)
+            np.add.at(tf[row], [columns[term] for term in terms if term in columns], 1)
+        norm = self.k1 * (1 - self.b + self.b * lengths / self.avg_length)
+        return (tf * (self.k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+class CrossEncoderScorer:
+    """
+    Cross-Encoder (Frage und Chunk gemeinsam durch ein kleines Transformer-Modell), batchweise auf der CPU.
+
+    Benötigt das optionale Paket sentence-transformers.
+    """
+
+    vector_weight = 0.0  # Der Cross-Encoder bewertet das Paar vollständig
+
+    def __init__(self, model_name=DEFAULT_CROSS_ENCODER, batch_size=32):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as exc:
+            raise ImportError("The cross-encoder scorer needs 'pip install sentence-transformers'") from exc
+        self.name = f"cross-encoder:{model_name}"
+        self.batch_size = batch_size
+        self._model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, query, texts):
+        if not len(texts):
+            return np.zeros(0)
+        return np.asarray(self._model.predict([(query, text) for text in texts], batch_size=self.batch_size))
+
+
+def make_scorer(name):
+    """Scorer nach Name; fehlt sentence-transformers, wird auf den lexikalischen Scorer ausgewichen."""
+    if name == "lexical":
+        return LexicalOverlapScorer()
+    if name == "cross-encoder":
+        try:
+            return CrossEncoderScorer()
+        except ImportError as exc:
+            print(f"{exc}; falling back to the lexical scorer")
+            return LexicalOverlapScorer()
+    raise ValueError(f"Unknown reranker {name!r}, expected 'lexical', 'cross-encoder' or 'none'")
+
+
+class PairScoreCache:
+    """
+    Persistente Scores für (Scorer, Frage, Chunk-Text); bei vollem Cache fliegen die ältesten Einträge.
+
+    Args:
+        path: SQLite-Datei des Caches
+        max_entries: Maximale Anzahl gespeicherter Paare
+    """
+
+    def __init__(self, path, max_entries=100_000):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS scores_lru ON scores (last_used)")
+
+    @staticmethod
+    def key(scorer_name, query, text):
+        return hashlib.sha256(f"{scorer_name}\0{query}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        with self._lock:
+            return self._get_many(keys)
+
+    def put_many(self, items):
+        with self._lock:
+            self._put_many(items)
+
+    def _get_many(self, keys):
+        found = {}
+        for start in range(0, len(keys), 500):  # SQLite-Grenze für Parameter
+            chunk = keys[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT key, score FROM scores WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update(rows)
+        if found:
+            self._conn.executemany("UPDATE scores SET last_used = ? WHERE key = ?",
+                                   [(time.time(), key) for key in found])
+        return found
+
+    def _put_many(self, items):
+        now = time.time()
+        self._conn.executemany("INSERT OR REPLACE INTO scores (key, score, last_used) VALUES (?, ?, ?)",
+                               [(key, float(score), now) for key, score in items])
+        excess = self._conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM scores WHERE key IN (SELECT key FROM scores ORDER BY last_used LIMIT ?)", (excess,)
+            )
+
+
+class Reranker:
+    """
+    Bewertet Kandidaten neu und gibt die besten k zurück.
+
+    Args:
+        scorer: Objekt mit 'name' und score(query, texts) -> Array
+        cache: PairScoreCache (optional)
+        vector_weight: Anteil des Vektor-Rangs am Score (Standard: vector_weight des Scorers, sonst 0)
+    """
+
+    def __init__(self, scorer, cache=None, vector_weight=None):
+        self.scorer = scorer
+        self.cache = cache
+        self.vector_weight = getattr(scorer, "vector_weight", 0.0) if vector_weight is None else vector_weight
+        self.stats = {"queries": 0, "candidates": 0, "scored": 0, "cache_hits": 0}
+
+    def scores(self, query, texts):
+        """Scores aller Texte; nur Paare ohne Cache-Eintrag werden (gemeinsam) berechnet."""
+        self.stats["queries"] += 1
+        self.stats["candidates"] += len(texts)
+        if self.cache is None:
+            self.stats["scored"] += len(texts)
+            return np.asarray(self.scorer.score(query, texts), dtype=float)
+        keys = [PairScoreCache.key(self.scorer.name, query, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+        self.stats["cache_hits"] += sum(key in found for key in keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing:
+            computed = self.scorer.score(query, [texts[i] for i in missing])  # Ein Batch für alle fehlenden Paare
+            self.stats["scored"] += len(missing)
+            new_items = [(keys[i], score) for i, score in zip(missing, computed)]
+            self.cache.put_many(new_items)
+            found.update(new_items)
+        return np.array([found[key] for key in keys], dtype=float)
+
+    @staticmethod
+    def blend(scores, vector_weight):
+        """
+        Mischt Paar-Scores mit dem Rang der Vektorsuche (die Kandidaten kommen nach Ähnlichkeit sortiert an).
+
+        Beide Signale werden auf 0..1 normiert: Scores per Min-Max über die Kandidaten, der Rang linear
+        (erster Kandidat 1, letzter 0). Kandidaten ohne lexikalischen Treffer behalten so ihre Reihenfolge.
+        """
+        spread = scores.max() - scores.min()
+        lexical = (scores - scores.min()) / spread if spread else np.zeros(len(scores))
+        vector = 1.0 - np.arange(len(scores)) / max(1, len(scores) - 1)
+        return (1.0 - vector_weight) * lexical + vector_weight * vector
+
+    def rerank(self, query, docs, k):
+        """Die besten k Documents, absteigend nach Score, mit 'rerank_score' in den Metadaten."""
+        if not docs:
+            return []
+        scores = self.scores(query, [doc.page_content for doc in docs])
+        if self.vector_weight:
+            scores = self.blend(scores, self.vector_weight)
+        order = np.argsort(-scores, kind="stable")[:k]  # Bei Gleichstand bleibt die Reihenfolge der Suche
+        return [
+            Document(id=docs[i].id, page_content=docs[i].page_content,
+                     metadata={**(docs[i].metadata or {}), "rerank_score": round(float(scores[i]), 4)})
+            for i in order
+        ]
+
+    def print_stats(self):
+        """Gibt die Re-Ranking-Statistik aus."""
+        stats = self.stats
+        print(
+            f"\n--- Reranking ({self.scorer.name}): {stats['candidates']} candidates for {stats['queries']} queries, "
+            f"{stats['scored']} scored, {stats['cache_hits']} from cache ---"
+        )
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Retriever mit Re-Ranking: der Basis-Retriever liefert die Kandidaten (mit großem k), zurück gehen die besten k.
+    """
+
+    base_retriever: BaseRetriever
+    reranker: object
+    k: int = 3
+
+    def _get_relevant_documents(self, query, *, run_manager: CallbackManagerForRetrieverRun):
+        candidates = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self.reranker.rerank(query, candidates, self.k)
+
+
+def load_reranker(db_dir, name=None):
+    """
+    Reranker für die Skripte mit Paar-Cache unter db/rerank_cache.sqlite.
+
+    Args:
+        db_dir: Verzeichnis der Datenbanken
+        name: 'lexical', 'cross-encoder' oder 'none' (Standard: Umgebungsvariable RAG_RERANKER oder 'none')
+
+    Returns:
+        Reranker oder None, wenn das Re-Ranking abgeschaltet ist
+    """
+    name = name or os.environ.get("RAG_RERANKER", "none")
+    if name == "none":
+        return None
+    return Reranker(make_scorer(name), PairScoreCache(os.path.join(db_dir, "rerank_cache.sqlite")))
+
+
+if __name__ == "__main__":
+    # Qualität mit und ohne Re-Ranking auf den Benchmark-Abfragen (Offline-Embeddings, siehe rag_benchmark.py)
+    import argparse
+    import json
+    import tempfile
+
+    from rag_benchmark import HashingEmbeddings, is_relevant, load_queries
+    from vector_store import LocalVectorStore
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Recall with and without re-ranking")
+    parser.add_argument("--local-store", required=True, help="Local vector store exported with HashingEmbeddings")
+    parser.add_argument("--scorer", default="lexical")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--fetch-k", type=int, default=DEFAULT_FETCH_K)
+    parser.add_argument("--vector-weight", type=float, help="Weight of the vector rank (default: scorer's)")
+    args = parser.parse_args()
+
+    queries = load_queries(os.path.join(current_dir, "benchmark_queries.json"))
+    store = LocalVectorStore(args.local_store, HashingEmbeddings())
+    reranker = Reranker(make_scorer(args.scorer), PairScoreCache(os.path.join(tempfile.mkdtemp(), "pairs.sqlite")),
+                        vector_weight=args.vector_weight)
+    results = {}
+    for name in ("vector", "reranked"):
+        hits, latencies = 0, []
+        for query in queries:
+            start = time.perf_counter()
+            if name == "vector":
+                docs = store.similarity_search(query["query"], k=args.k)
+            else:
+                docs = reranker.rerank(query["query"], store.similarity_search(query["query"], k=args.fetch_k), args.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += any(is_relevant(doc, query) for doc in docs)
+        results[name] = {f"recall@{args.k}": round(hits / len(queries), 3), "avg_ms": round(float(np.mean(latencies)), 2)}
+    print(json.dumps(results, indent=1))
+    reranker.print_stats()
+
+# docker-compose run --rm app langchain/4_RAGs/reranking.py --local-store langchain/4_RAGs/db/chroma_db_with_metadata_local
@@ -0,0 +1,288 @@
+"""
+Semantischer Antwort-Cache vor dem LLM-Aufruf
+
+Nahezu identische Fragen ("Where is Dracula's castle?" / "Where is Dracula's castle located?")
+führen zu denselben Chunks und damit zur selben Antwort. Dieser Cache spart dann den LLM-Aufruf:
+- Schlüssel: Abfrage-Embedding (Kosinus-Ähnlichkeit >= Schwellenwert) UND die abgerufenen Chunk-IDs
+- Ablauf: Einträge verfallen nach einer TTL, bei vollem Cache wird der am längsten ungenutzte ersetzt (LRU)
+- Invalidierung: alle Einträge werden verworfen, sobald sich der Index ändert (Hash des Ingest-Manifests);
+  lang laufende Prozesse (rag_server.py) übergeben eine Funktion und prüfen die Version bei jeder Abfrage
+- Persistenz: SQLite-Datei, Trefferquote und eingesparte Tokens werden über alle Läufe summiert
+- Die Abfrage-Embeddings liegen als Matrix im Speicher; put() hängt neue Zeilen an, statt die Tabelle
+  neu zu lesen. Zähler und LRU-Zeitstempel von lookup() werden gebündelt geschrieben (flush)
+
+Da die Chunk-IDs Teil des Schlüssels sind, wird eine Antwort nur wiederverwendet,
+wenn sie auf exakt demselben Kontext beruht.
+"""
+import atexit  # Für das Schreiben offener Zähler beim Beenden
+import hashlib  # Für die Index-Version
+import json  # Für die Chunk-IDs
+import os  # Für Dateisystem-Operationen
+import sqlite3  # Für die Persistenz
+import threading  # Für den Zugriff aus Worker-Threads
+import time  # Für TTL und LRU-Zeitstempel
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.95  # Mindest-Kosinus-Ähnlichkeit der Abfragen
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10_000
+FLUSH_EVERY = 50  # Zähler werden gebündelt geschrieben: spätestens nach 50 Abfragen ...
+FLUSH_SECONDS = 5.0  # ... oder 5 Sekunden
+VERSION_CHECK_SECONDS = 1.0  # Index-Version höchstens einmal pro Sekunde prüfen
+
+_manifest_hashes = {}  # Manifest-Pfad -> ((mtime, Größe), Hash)
+
+
+def index_version(persistent_directory):
+    """Version des Index: Hash des Ingest-Manifests (ändert sich mit jedem geänderten Chunk)."""
+    manifest_path = os.path.join(persistent_directory, "ingest_manifest.json")
+    if not os.path.exists(manifest_path):
+        return "unversioned"
+    stat = os.stat(manifest_path)
+    cached = _manifest_hashes.get(manifest_path)
+    if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1]  # Unverändertes Manifest nicht erneut hashen
+    with open(manifest_path, "rb") as f:
+        version = hashlib.sha256(f.read()).hexdigest()
+    _manifest_hashes[manifest_path] = ((stat.st_mtime_ns, stat.st_size), version)
+    return version
+
+
+class SemanticCache:
+    """
+    Persistenter Cache für LLM-Antworten, durchsucht per Embedding-Ähnlichkeit.
+
+    Args:
+        path: SQLite-Datei des Caches
+        index_version: Aktuelle Index-Version oder Funktion, die sie liefert (wird dann bei jeder
+            Abfrage erneut geprüft); bei Abweichung wird der Cache geleert
+        threshold: Mindest-Kosinus-Ähnlichkeit zwischen neuer und gespeicherter Abfrage
+        ttl_seconds: Lebensdauer eines Eintrags
+        max_entries: Maximale Anzahl Einträge (LRU-Verdrängung)
+    """
+
+    def __init__(self, path, index_version, threshold=DEFAULT_THRESHOLD,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Eine Verbindung für alle Threads (z.B. rag_server.py über asyncio.to_thread), geschützt per Lock
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, query TEXT NOT NULL, embedding BLOB NOT NULL,"
+            " chunk_ids TEXT NOT NULL, answer TEXT NOT NULL, tokens INTEGER NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+        self._index_version = index_version if callable(index_version) else lambda: index_version
+        self._pending_counts = {}  # Noch nicht geschriebene Zähler
+        self._pending_used = {}  # Noch nicht geschriebene LRU-Zeitstempel (Eintrags-ID -> Zeit)
+        self._last_flush = time.monotonic()
+        self._version = None  # Index-Version, auf der die Einträge im Speicher beruhen
+        self._check_version()
+        self._conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - ttl_seconds,))
+        self._load()
+        atexit.register(self.flush)
+
+    def _get_meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _increment(self, key, amount=1):
+        self._set_meta(key, int(self._get_meta(key) or 0) + amount)
+
+    def _check_version(self):
+        """Leert den Cache, wenn sich der Index geändert hat, und lädt ihn neu, wenn ein anderer Prozess das tat."""
+        now = time.monotonic()
+        if self._version is not None and now - self._version_checked < VERSION_CHECK_SECONDS:
+            return
+        self._version_checked = now
+        current = self._index_version()
+        if self._get_meta("index_version") != current:
+            # Index hat sich geändert: gespeicherte Antworten beruhen evtl. auf veraltetem Kontext
+            self._conn.execute("DELETE FROM entries")
+            self._set_meta("index_version", current)
+        if self._version is not None and self._version != current:
+            self._pending_used.clear()
+            self._load()
+        self._version = current
+
+    def _load(self):
+        """Lädt Abfrage-Embeddings und Chunk-Schlüssel aller Einträge in den Speicher."""
+        rows = self._conn.execute("SELECT id, chunk_ids, embedding, created FROM entries").fetchall()
+        self._size = len(rows)
+        capacity = max(16, self._size)
+        self._ids = np.full(capacity, -1, dtype=np.int64)
+        self._chunk_keys = np.full(capacity, None, dtype=object)
+        self._created = np.full(capacity, -np.inf, dtype=np.float64)  # Freie Zeilen gelten als abgelaufen
+        self._matrix = None
+        self._rows = {}  # Eintrags-ID -> Zeile
+        self._free = []  # Zeilen verdrängter Einträge, werden wiederverwendet
+        for row, (entry_id, chunk_key, embedding, created) in enumerate(rows):
+            self._set_row(row, entry_id, chunk_key, np.frombuffer(embedding, dtype=np.float32), created)
+
+    def _set_row(self, row, entry_id, chunk_key, vector, created):
+        if self._matrix is None:
+            self._matrix = np.zeros((len(self._ids), len(vector)), dtype=np.float32)
+        self._ids[row], self._chunk_keys[row], self._created[row] = entry_id, chunk_key, created
+        self._matrix[row] = vector
+        self._rows[entry_id] = row
+
+    def _append(self, entry_id, chunk_key, vector, created):
+        """Übernimmt einen neuen Eintrag in die Matrix (amortisiert O(1), ohne die Tabelle neu zu lesen)."""
+        if self._free:
+            row = self._free.pop()
+        else:
+            if self._size == len(self._ids):  # Kapazität verdoppeln
+                grow = len(self._ids)
+                self._ids = np.concatenate([self._ids, np.full(grow, -1, dtype=np.int64)])
+                self._chunk_keys = np.concatenate([self._chunk_keys, np.full(grow, None, dtype=object)])
+                self._created = np.concatenate([self._created, np.full(grow, -np.inf, dtype=np.float64)])
+                if self._matrix is not None:
+                    self._matrix = np.vstack([self._matrix, np.zeros_like(self._matrix)])
+            row = self._size
+            self._size += 1
+        self._set_row(row, entry_id, chunk_key, vector, created)
+
+    def _remove(self, entry_ids):
+        for entry_id in entry_ids:
+            row = self._rows.pop(entry_id, None)
+            if row is not None:
+                self._ids[row], self._chunk_keys[row], self._created[row] = -1, None, -np.inf
+                self._free.append(row)
+
+    def flush(self):
+        """Schreibt gesammelte Zähler und LRU-Zeitstempel in einer Transaktion in die Datenbank."""
+        with self._lock:
+            if not self._pending_counts and not self._pending_used:
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE id = ?",
+                    [(used, entry_id) for entry_id, used in self._pending_used.items()],
+                )
+                for key, amount in self._pending_counts.items():
+                    self._increment(key, amount)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._pending_counts.clear()
+            self._pending_used.clear()
+            self._last_flush = time.monotonic()
+
+    def _count(self, key, amount=1):
+        # Zähler nur im Speicher erhöhen; geschrieben wird gebündelt (siehe flush)
+        self._pending_counts[key] = self._pending_counts.get(key, 0) + amount
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding, chunk_ids):
+        """Liefert die gespeicherte Antwort oder None."""
+        with self._lock:
+            self._check_version()
+            size = self._size
+            candidates = np.flatnonzero(
+                (self._chunk_keys[:size] == json.dumps(list(chunk_ids)))
+                & (self._created[:size] >= time.time() - self.ttl_seconds)
+            ) if size else np.array([], dtype=np.int64)
+            if len(candidates):
+                similarities = self._matrix[candidates] @ self._normalize(embedding)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id = int(self._ids[candidates[best]])
+                    row = self._conn.execute(
+                        "SELECT answer, tokens FROM entries WHERE id = ?", (entry_id,)
+                    ).fetchone()
+                    if row is not None:
+                        answer, tokens = row
+                        self._pending_used[entry_id] = time.time()
+                        self._count("hits")
+                        self._count("saved_tokens", tokens)
+                        self._maybe_flush()
+                        return answer
+                    # Von einem anderen Prozess verdrängt: Fehltreffer, Zeile im Speicher freigeben
+                    self._remove([entry_id])
+                    self._pending_used.pop(entry_id, None)
+            self._count("misses")
+            self._maybe_flush()
+            return None
+
+    def _maybe_flush(self):
+        lookups = self._pending_counts.get("hits", 0) + self._pending_counts.get("misses", 0)
+        if lookups >= FLUSH_EVERY or time.monotonic() - self._last_flush >= FLUSH_SECONDS:
+            self.flush()
+
+    def put(self, query, embedding, chunk_ids, answer, tokens=0):
+        """Speichert eine Antwort und verdrängt bei Bedarf die am längsten ungenutzten Einträge."""
+        with self._lock:
+            self._check_version()
+            self.flush()  # Aktuelle LRU-Zeitstempel für die Verdrängung
+            now = time.time()
+            vector = self._normalize(embedding)
+            chunk_key = json.dumps(list(chunk_ids))
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                entry_id = self._conn.execute(
+                    "INSERT INTO entries (query, embedding, chunk_ids, answer, tokens, created, last_used)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (query, vector.tobytes(), chunk_key, answer, int(tokens), now, now),
+                ).lastrowid
+                overflow = len(self) - self.max_entries
+                evicted = []
+                if overflow > 0:
+                    evicted = [row[0] for row in self._conn.execute(
+                        "DELETE FROM entries WHERE id IN"
+                        " (SELECT id FROM entries ORDER BY last_used ASC LIMIT ?) RETURNING id", (overflow,)
+                    ).fetchall()]
+                    self._increment("evictions", overflow)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._remove(evicted)
+            self._append(entry_id, chunk_key, vector, now)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @property
+    def stats(self):
+        """Über alle Läufe summierte Statistik."""
+        with self._lock:
+            self.flush()
+            hits = int(self._get_meta("hits") or 0)
+            misses = int(self._get_meta("misses") or 0)
+            total = hits + misses
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / total, 3) if total else 0.0,
+                "saved_tokens": int(self._get_meta("saved_tokens") or 0),
+                "evictions": int(self._get_meta("evictions") or 0),
+                "entries": len(self),
+            }
+
+    def print_stats(self):
+        """Gibt die Cache-Statistiken aus."""
+        stats = self.stats
+        print(
+            f"\n--- Semantic cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"(hit rate {stats['hit_rate']:.1%}), {stats['saved_tokens']} tokens saved, "
+            f"{stats['entries']} entries ---"
+        )
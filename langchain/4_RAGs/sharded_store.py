@@ -0,0 +1,369 @@
+"""
+Sharded Vektorspeicher: viele unabhängige Chroma-Collections mit paralleler Suche
+
+Eine einzige Collection wird bei tausenden Büchern groß, und jede Neuindizierung betrifft alles.
+Dieser Speicher verteilt die Quellen stattdessen auf mehrere Chroma-Verzeichnisse (Shards):
+- Strategie 'source': ein Shard pro Quelle (Buch)
+- Strategie 'hash': Quellen per CRC32 des Namens auf eine feste Zahl von Shards verteilt (für sehr viele Bücher)
+- Jeder Shard hat sein eigenes Ingest-Manifest und wird unabhängig synchronisiert (siehe ingestion.py);
+  die Shards werden als Tasks auf einer gemeinsamen Event-Loop synchronisiert (ein Embedding-Client für alle)
+- Suche: alle Shards werden gleichzeitig abgefragt (Thread-Pool), die Top-k-Listen per Heap zusammengeführt.
+  Ein Filter auf genau eine Quelle ('source') fragt nur deren Shard ab.
+- Neuaufbau eines Shards: in ein neues Generationsverzeichnis schreiben, dann atomar umschalten.
+  Suchen auf den anderen (und dem alten) Shard laufen währenddessen weiter.
+
+Eine Quelle bleibt immer vollständig in einem Shard. Würden die Chunks einzeln per Chunk-ID verteilt,
+beträfe jede Änderung an einem Buch alle Shards, und sie ließen sich nicht mehr einzeln neu aufbauen.
+
+Aufbau auf der Festplatte:
+
+    <root>/shards.json                 Strategie, Shards mit Quellen und aktueller Generation
+    <root>/<shard>/g<generation>/      Chroma-Verzeichnis inkl. ingest_manifest.json
+"""
+import asyncio  # Für die nebenläufige Synchronisierung der Shards
+import heapq  # Für das Zusammenführen der Top-k-Listen
+import itertools  # Für das Abschneiden nach k Treffern
+import json  # Für die Shard-Liste
+import os  # Für Dateisystem-Operationen
+import re  # Für die Verzeichnisnamen
+import shutil  # Für das Löschen alter Generationen
+import threading  # Für das Umschalten der Shards
+import time  # Für die Laufzeitmessung
+import zlib  # Für die Hash-Verteilung
+from concurrent.futures import ThreadPoolExecutor  # Für den Fan-out der Suche
+
+from langchain_chroma import Chroma
+from langchain_core.vectorstores import VectorStore
+
+from embedding_pipeline import EmbeddingPipeline, run_sync
+from ingestion import aincremental_ingest, manifest_path_for
+
+LAYOUT_FILE = "shards.json"
+LAYOUT_VERSION = 1
+DEFAULT_NUM_SHARDS = 16
+
+
+def shards_path_for(persistent_directory):
+    """Verzeichnis der Shards neben der einzelnen Chroma-Collection."""
+    return persistent_directory.rstrip(os.sep) + "_shards"
+
+
+def shard_name(source, strategy, num_shards=DEFAULT_NUM_SHARDS):
+    """Name des Shards, in dem eine Quelle liegt (stabil über Prozesse und Läufe)."""
+    if strategy == "hash":
+        return f"{zlib.crc32(source.encode('utf-8')) % num_shards:03d}"
+    if strategy == "source":
+        # Lesbarer Verzeichnisname plus Hash gegen Kollisionen nach dem Ersetzen der Sonderzeichen
+        return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', source)[:60]}-{zlib.crc32(source.encode('utf-8')):08x}"
+    raise ValueError(f"Unknown shard strategy {strategy!r}, expected 'source' or 'hash'")
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    LangChain-VectorStore über mehrere Chroma-Shards.
+
+    Args:
+        root: Verzeichnis der Shards
+        embedding: Embedding-Funktion (für Ingestion und Abfragen)
+        strategy: 'source' oder 'hash' (nur beim ersten Anlegen; danach gilt shards.json)
+        num_shards: Anzahl Shards bei 'hash' (nur beim ersten Anlegen)
+        max_workers: Threads für den Fan-out der Suche und gleichzeitig synchronisierte Shards (Standard: Anzahl CPU-Kerne)
+    """
+
+    def __init__(self, root, embedding, strategy="source", num_shards=DEFAULT_NUM_SHARDS, max_workers=None):
+        self.root = root
+        self.embedding = embedding
+        self._lock = threading.Lock()
+        self.max_workers = max_workers or os.cpu_count()
+        # Eigener Pool für die Suche, damit eine laufende Synchronisierung keine Abfragen aufhält
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._shards = {}  # Name -> (Generation, Chroma)
+        self._layout_mtime = None
+        layout_path = os.path.join(root, LAYOUT_FILE)
+        if os.path.exists(layout_path):
+            self.refresh()
+        else:
+            shard_name("", strategy)  # Strategie prüfen
+            self.layout = {"version": LAYOUT_VERSION, "strategy": strategy, "num_shards": num_shards, "shards": {}}
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    @property
+    def strategy(self):
+        return self.layout["strategy"]
+
+    def __len__(self):
+        return sum(db._collection.count() for _, db in self._shards.values())
+
+    # --- Aufbau und Verwaltung ---
+
+    def _write_layout(self):
+        """Schreibt shards.json atomar (andere Prozesse sehen alte oder neue Fassung, nie eine halbe)."""
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, LAYOUT_FILE)
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.layout, f, indent=1)
+        os.replace(tmp_path, path)
+        self._layout_mtime = os.path.getmtime(path)
+
+    def _shard_dir(self, name, generation):
+        return os.path.join(self.root, name, f"g{generation}")
+
+    def _open(self, name, generation):
+        return Chroma(embedding_function=self.embedding, persist_directory=self._shard_dir(name, generation))
+
+    def refresh(self):
+        """Liest shards.json neu und öffnet Shards, deren Generation sich geändert hat (z.B. durch einen anderen Prozess)."""
+        path = os.path.join(self.root, LAYOUT_FILE)
+        mtime = os.path.getmtime(path)
+        if mtime == self._layout_mtime:
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            layout = json.load(f)
+        if layout.get("version") != LAYOUT_VERSION:
+            raise ValueError(f"Unsupported shard layout version {layout.get('version')!r} in {path}")
+        with self._lock:
+            shards = {}
+            for name, entry in layout["shards"].items():
+                current = self._shards.get(name)
+                if current is not None and current[0] == entry["generation"]:
+                    shards[name] = current
+                else:
+                    shards[name] = (entry["generation"], self._open(name, entry["generation"]))
+            self.layout, self._shards, self._layout_mtime = layout, shards, mtime
+
+    def assign(self, sources):
+        """Verteilt {Quelle: Dateipfad} auf die Shards: {Shard: {Quelle: Dateipfad}}."""
+        assignment = {}
+        for source, file_path in sources.items():
+            name = shard_name(source, self.strategy, self.layout["num_shards"])
+            assignment.setdefault(name, {})[source] = file_path
+        return assignment
+
+    async def _ingest(self, name, generation, sources, text_splitter, workers, pipeline_kwargs):
+        db = await asyncio.to_thread(self._open, name, generation)
+        pipeline = EmbeddingPipeline(self.embedding, **pipeline_kwargs)
+        path = self._shard_dir(name, generation)
+        stats = await aincremental_ingest(db, sources, text_splitter, manifest_path_for(path), pipeline=pipeline,
+                                          workers=workers)
+        return db, stats
+
+    def sync(self, sources, text_splitter, workers=None, **pipeline_kwargs):
+        """
+        Gleicht alle Shards parallel mit den Quelldateien ab (inkrementell, pro Shard eigenes Manifest).
+
+        Die Shards laufen als Tasks auf der gemeinsamen Event-Loop der Embedding-Pipeline (höchstens
+        max_workers gleichzeitig), so teilen sich alle denselben Async-Client der Embeddings.
+
+        Shards, deren Quellen alle verschwunden sind, werden aus der Shard-Liste und von der Festplatte entfernt.
+
+        Args:
+            sources: Dictionary {Quelle: Dateipfad} über alle Shards
+            text_splitter: Splitter für die Chunk-Aufteilung
+            workers: Prozesse für Lesen und Aufteilen pro Shard (siehe incremental_ingest)
+            pipeline_kwargs: Parameter der EmbeddingPipeline pro Shard (z.B. batch_size, max_in_flight)
+
+        Returns:
+            {Shard: Statistik der Ingestion}
+        """
+        assignment = self.assign(sources)
+        names = sorted(set(assignment) | set(self.layout["shards"]))
+
+        async def sync_all():
+            semaphore = asyncio.Semaphore(self.max_workers)
+
+            async def sync_shard(name):
+                generation = self.layout["shards"].get(name, {}).get("generation", 0)
+                async with semaphore:
+                    return await self._ingest(name, generation, assignment.get(name, {}), text_splitter, workers,
+                                              pipeline_kwargs)
+
+            return await asyncio.gather(*(sync_shard(name) for name in names))
+
+        results = dict(zip(names, run_sync(sync_all())))
+        removed = []
+        with self._lock:
+            shards = dict(self._shards)
+            for name, (db, _) in results.items():
+                generation = self.layout["shards"].get(name, {}).get("generation", 0)
+                if name in assignment:
+                    self.layout["shards"][name] = {"generation": generation, "sources": sorted(assignment[name])}
+                    shards[name] = (generation, db)
+                else:
+                    self.layout["shards"].pop(name, None)
+                    shards.pop(name, None)
+                    removed.append(name)
+            self._shards = shards
+            self._write_layout()
+        for name in removed:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        return {name: stats for name, (_, stats) in results.items()}
+
+    def rebuild_shard(self, name, sources, text_splitter, workers=None, **pipeline_kwargs):
+        """
+        Baut einen Shard vollständig neu auf und schaltet danach atomar auf die neue Generation um.
+
+        Suchen laufen währenddessen auf der alten Generation weiter. Die vorletzte Generation wird
+        nach dem Umschalten gelöscht; die letzte bleibt für noch laufende Suchen anderer Prozesse erhalten.
+
+        Args:
+            name: Name des Shards (siehe shard_name)
+            sources: {Quelle: Dateipfad}; nur Quellen, die zu diesem Shard gehören, werden übernommen
+        """
+        sources = self.assign(sources).get(name, {})
+        previous = self.layout["shards"].get(name, {}).get("generation", -1)
+        generation = previous + 1
+        shutil.rmtree(self._shard_dir(name, generation), ignore_errors=True)  # Reste eines abgebrochenen Laufs
+        db, stats = run_sync(self._ingest(name, generation, sources, text_splitter, workers, pipeline_kwargs))
+        with self._lock:
+            self.layout["shards"][name] = {"generation": generation, "sources": sorted(sources)}
+            self._shards = {**self._shards, name: (generation, db)}  # Neues Dictionary: Leser sehen alt oder neu
+            self._write_layout()
+        if previous >= 1:
+            shutil.rmtree(self._shard_dir(name, previous - 1), ignore_errors=True)
+        return stats
+
+    # --- Suche ---
+
+    def _targets(self, filter):
+        """Shards, die für den Filter in Frage kommen (bei 'source'-Shards und Quellen-Filter nur einer)."""
+        shards = self._shards
+        source = (filter or {}).get("source")
+        if isinstance(source, dict) and set(source) == {"$eq"}:
+            source = source["$eq"]
+        if isinstance(source, str):
+            name = shard_name(source, self.strategy, self.layout["num_shards"])
+            return [shards[name][1]] if name in shards else []
+        return [db for _, db in shards.values()]
+
+    def _fan_out(self, function, targets):
+        if len(targets) == 1:
+            return [function(targets[0])]
+        return list(self._executor.map(function, targets))
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None):
+        """Liefert (Document, Distanz)-Paare über alle Shards; kleiner ist ähnlicher (wie bei Chroma)."""
+        targets = self._targets(filter)
+        per_shard = self._fan_out(
+            lambda db: db.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter),
+            targets,
+        )
+        # Jede Liste ist bereits nach Distanz sortiert: k-Wege-Merge über einen Heap
+        return list(itertools.islice(heapq.merge(*per_shard, key=lambda item: item[1]), k))
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def get_by_ids(self, ids):
+        ids = list(ids)
+        found = {}
+        for docs in self._fan_out(lambda db: db.get_by_ids(ids), [db for _, db in self._shards.values()]):
+            found.update((doc.id, doc) for doc in docs)
+        return [found[doc_id] for doc_id in ids if doc_id in found]
+
+    def _select_relevance_score_fn(self):
+        # Alle Shards nutzen dieselbe Distanz; ohne Shards gilt der Chroma-Standard (L2)
+        for _, db in self._shards.values():
+            return db._select_relevance_score_fn()
+        return self._euclidean_relevance_score_fn
+
+    # Geschrieben wird nur über sync()/rebuild_shard(): Chunks ohne Manifest-Eintrag würden beim
+    # nächsten Abgleich als Waisen gelöscht (siehe ingestion.py)
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        raise TypeError(
+            "ShardedVectorStore does not accept individual texts: chunks without an ingest manifest entry "
+            "are deleted by the next sync. Use sync() or rebuild_shard() with the source files instead."
+        )
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise TypeError(
+            "ShardedVectorStore is built from source files: use ShardedVectorStore(root, embedding).sync(sources, text_splitter)"
+        )
+
+
+def print_shard_stats(results):
+    """Gibt die Ingestion-Statistik pro Shard und die Summe aus."""
+    print(f"\n--- Sharded ingestion: {len(results)} shards ---")
+    totals = {}
+    for name, stats in sorted(results.items()):
+        print(f"{name}: +{stats['chunks_added']} -{stats['chunks_deleted']} ={stats['chunks_kept']} "
+              f"({stats['seconds']}s)")
+        for key in ("chunks_added", "chunks_deleted", "chunks_kept", "embedding_requests"):
+            totals[key] = totals.get(key, 0) + stats[key]
+    print(f"total: {totals}")
+
+
+if __name__ == "__main__":
+    # Demo: Shards offline aufbauen (Hashing-Embeddings), Fan-out-Suche gegen eine einzelne Collection
+    # vergleichen und einen Shard neu aufbauen, während weiter gesucht wird
+    import argparse
+    import logging
+    import warnings
+
+    from ingestion import incremental_ingest
+    from rag_benchmark import HashingEmbeddings, load_queries
+    from streaming_splitter import StreamingCharacterSplitter
+
+    logging.disable(logging.WARNING)  # Warnungen über zu große Chunks ausblenden
+    warnings.filterwarnings("ignore", message="Relevance scores must be between")
+
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Sharded vector store demo (offline embeddings)")
+    parser.add_argument("root", help="Directory for the shards (e.g. /tmp/shards)")
+    parser.add_argument("--strategy", choices=["source", "hash"], default="source")
+    parser.add_argument("--num-shards", type=int, default=4)
+    args = parser.parse_args()
+
+    books_dir = os.path.join(current_dir, "documents")
+    sources = {f: os.path.join(books_dir, f) for f in sorted(os.listdir(books_dir)) if f.endswith(".txt")}
+    splitter = StreamingCharacterSplitter(chunk_size=1000, chunk_overlap=50)
+    embeddings = HashingEmbeddings()
+
+    store = ShardedVectorStore(args.root, embeddings, strategy=args.strategy, num_shards=args.num_shards)
+    start = time.perf_counter()
+    print_shard_stats(store.sync(sources, splitter))
+    print(f"sync: {time.perf_counter() - start:.2f}s, {len(store)} chunks")
+
+    single = Chroma(embedding_function=embeddings, persist_directory=os.path.join(args.root, "_single"))
+    incremental_ingest(single, sources, splitter, manifest_path_for(os.path.join(args.root, "_single")))
+    queries = [query["query"] for query in load_queries(os.path.join(current_dir, "benchmark_queries.json"))]
+    same = 0
+    for query in queries:
+        vector = embeddings.embed_query(query)
+        sharded_ids = [doc.id for doc in store.similarity_search_by_vector(vector, k=3)]
+        single_ids = [doc.id for doc in single.similarity_search_by_vector(vector, k=3)]
+        same += sharded_ids == single_ids
+    print(f"identical top-3 to a single collection: {same}/{len(queries)}")
+
+    # Einen Shard neu aufbauen, während ein zweiter Thread weiter sucht
+    name = sorted(store.layout["shards"])[0]
+    searches, errors, stop = [0], [], threading.Event()
+
+    def keep_searching():
+        while not stop.is_set():
+            try:
+                store.similarity_search(queries[searches[0] % len(queries)], k=3)
+                searches[0] += 1
+            except Exception as exc:
+                errors.append(exc)
+
+    reader = threading.Thread(target=keep_searching)
+    reader.start()
+    start = time.perf_counter()
+    stats = store.rebuild_shard(name, sources, splitter)
+    stop.set()
+    reader.join()
+    print(f"rebuilt shard {name} (+{stats['chunks_added']} chunks) in {time.perf_counter() - start:.2f}s "
+          f"while {searches[0]} searches ran, {len(errors)} errors")
+
+# docker-compose run --rm app langchain/4_RAGs/sharded_store.py /tmp/shards --strategy hash
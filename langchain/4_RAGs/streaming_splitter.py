@@ -0,0 +1,146 @@
+"""
+Speicherbegrenzter, streamender Text-Splitter für große Korpora
+
+CharacterTextSplitter.split_documents benötigt den kompletten Text jeder Datei im Speicher.
+StreamingCharacterSplitter liefert dieselben Chunks, liest die Datei aber in festen Fenstern:
+- Die Datei wird fensterweise gelesen (Standard: 1 MiB Zeichen)
+- Ein am Fensterende angeschnittener Abschnitt wird ins nächste Fenster übernommen
+- Chunks werden per Generator erzeugt, sobald sie vollständig sind
+- Die Überlappung (chunk_overlap) wird über Fenstergrenzen hinweg mitgeführt
+- Ein Abschnitt ohne Trennzeichen, der länger als ein Fenster ist, wird in fenstergroße, übergroße
+  Chunks zerlegt, statt ihn vollständig im Speicher zu sammeln
+
+Die Ausgabe ist Chunk für Chunk identisch mit CharacterTextSplitter
+(gleiche Trennzeichen-, Überlappungs- und Whitespace-Regeln), solange kein Abschnitt länger als ein
+Fenster ist (CharacterTextSplitter gibt ihn als einen übergroßen Chunk aus). Der Speicherbedarf hängt
+nur von Fenster- und Chunkgröße ab, nicht von der Dateigröße.
+"""
+import re  # Für das Aufteilen am Trennzeichen
+from collections import deque  # Für die Chunks im aktuellen Fenster
+
+DEFAULT_WINDOW_SIZE = 1 << 20  # Zeichen pro gelesenem Fenster
+
+
+class _Fragment(str):
+    """Teilstück eines Abschnitts, der länger als ein Fenster ist; wird als eigener Chunk ausgegeben."""
+
+
+class StreamingCharacterSplitter:
+    """
+    Streamender Ersatz für CharacterTextSplitter (ohne Regex-Trennzeichen und keep_separator).
+
+    Args:
+        chunk_size: Maximale Chunkgröße in Zeichen
+        chunk_overlap: Maximale Überlappung zwischen aufeinanderfolgenden Chunks
+        separator: Trennzeichen zwischen Abschnitten
+        window_size: Anzahl Zeichen, die pro Lesevorgang aus der Datei gelesen werden
+    """
+
+    def __init__(self, chunk_size=1000, chunk_overlap=50, separator="\n\n", window_size=DEFAULT_WINDOW_SIZE):
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"Got a larger chunk overlap ({chunk_overlap}) than chunk size ({chunk_size}), should be smaller."
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separator = separator
+        self.window_size = window_size
+        self._pattern = re.compile(re.escape(separator)) if separator else None
+
+    def _iter_splits(self, windows):
+        """Zerlegt einen Strom von Textfenstern in Abschnitte (ohne leere Abschnitte)."""
+        carry = ""
+        continued = False  # carry setzt einen bereits zerlegten, übergroßen Abschnitt fort
+        for window in windows:
+            text = carry + window
+            if self._pattern is None:
+                parts = list(text)
+                carry = ""
+            else:
+                parts = self._pattern.split(text)
+                carry = parts.pop()  # Letzter Abschnitt ist evtl. noch nicht vollständig
+            for i, part in enumerate(parts):
+                if part != "":
+                    yield _Fragment(part) if i == 0 and continued else part
+            if parts:
+                continued = False
+            if len(carry) > self.window_size:
+                # Kein Trennzeichen in einem ganzen Fenster: Teilstück ausgeben, damit carry begrenzt bleibt.
+                # Die letzten Zeichen bleiben stehen, falls dort ein Trennzeichen beginnt.
+                keep = len(self.separator) - 1
+                yield _Fragment(carry[:len(carry) - keep])
+                carry = carry[len(carry) - keep:]
+                continued = True
+        if carry != "":
+            yield _Fragment(carry) if continued else carry
+
+    def _merge_splits(self, splits):
+        """Fasst Abschnitte zu Chunks zusammen (gleiche Logik wie TextSplitter._merge_splits)."""
+        separator_len = len(self.separator)
+        current = deque()
+        total = 0
+        for split in splits:
+            if isinstance(split, _Fragment):
+                # Übergroßer Abschnitt: wie bei CharacterTextSplitter eigener Chunk ohne Überlappung
+                chunk = self.separator.join(current).strip()
+                if chunk:
+                    yield chunk
+                current.clear()
+                total = 0
+                if split.strip():
+                    yield split.strip()
+                continue
+            split_len = len(split)
+            if total + split_len + (separator_len if current else 0) > self.chunk_size:
+                if current:
+                    chunk = self.separator.join(current).strip()
+                    if chunk:
+                        yield chunk
+                    # Nur so viele Abschnitte behalten, wie in die Überlappung passen
+                    while total > self.chunk_overlap or (
+                        total + split_len + (separator_len if current else 0) > self.chunk_size
+                        and total > 0
+                    ):
+                        total -= len(current[0]) + (separator_len if len(current) > 1 else 0)
+                        current.popleft()
+            current.append(split)
+            total += split_len + (separator_len if len(current) > 1 else 0)
+        chunk = self.separator.join(current).strip()
+        if chunk:
+            yield chunk
+
+    def iter_text_chunks(self, windows):
+        """Chunks aus einem beliebigen Strom von Textfenstern."""
+        return self._merge_splits(self._iter_splits(windows))
+
+    def iter_file_chunks(self, file_path, encoding="utf-8"):
+        """Chunks einer Datei, fensterweise gelesen."""
+        with open(file_path, "r", encoding=encoding) as f:
+            yield from self.iter_text_chunks(iter(lambda: f.read(self.window_size), ""))
+
+    def split_text(self, text):
+        """Kompatibel zu CharacterTextSplitter.split_text."""
+        return list(self.iter_text_chunks([text]))
+
+
+if __name__ == "__main__":
+    # Prüft, dass die Chunks für alle Dokumente identisch mit CharacterTextSplitter sind
+    import logging
+    import os
+
+    from langchain_text_splitters import CharacterTextSplitter
+
+    logging.disable(logging.WARNING)  # Warnungen über zu große Chunks ausblenden
+    books_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "documents")
+    reference = CharacterTextSplitter(chunk_size=1000, chunk_overlap=50)
+    for window_size in (4096, DEFAULT_WINDOW_SIZE):
+        streaming = StreamingCharacterSplitter(chunk_size=1000, chunk_overlap=50, window_size=window_size)
+        for book_file in sorted(f for f in os.listdir(books_dir) if f.endswith(".txt")):
+            file_path = os.path.join(books_dir, book_file)
+            with open(file_path, "r", encoding="utf-8") as f:
+                expected = reference.split_text(f.read())
+            actual = list(streaming.iter_file_chunks(file_path))
+            status = "OK" if actual == expected else "MISMATCH"
+            print(f"{status}: {book_file} ({len(actual)} chunks, window {window_size})")
+
+# docker-compose run --rm app langchain/4_RAGs/streaming_splitter.py
@@ -0,0 +1,21 @@
+"""
+Gemeinsame Textverarbeitung für lexikalische Suche, Re-Ranking und Offline-Embeddings
+
+- tokenize(): kleingeschriebene Wort-Tokens (BM25-Index, Re-Ranking, HashingEmbeddings)
+- STOPWORDS: häufige englische Wörter, die als Einzelterme kaum etwas über die Relevanz aussagen
+"""
+import re  # Für die Tokenisierung
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Häufige englische Wörter: beim Re-Ranking und beim Feature-Hashing nur Rauschen
+STOPWORDS = frozenset(
+    "a an and are as at be but by did do does for from had has have he her his how i in is it its "
+    "me my of on or she that the their them they this to was were what when where which who whom "
+    "why will with you your".split()
+)
+
+
+def tokenize(text):
+    """Kleingeschriebene Wort-Tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
@@ -0,0 +1,426 @@
+"""
+Lokale Vektorsuche ohne Datenbankserver: exakte Brute-Force-Suche und IVF-Index
+
+LocalVectorStore ist ein schlanker LangChain-VectorStore für kleine bis mittlere Korpora
+und zum Vergleich mit dem HNSW-Index von Chroma:
+- Vektoren werden normiert als float32-Matrix in einer .npy-Datei gespeichert und per mmap geladen
+- Backend 'bruteforce': exakte Kosinus-Suche als eine Matrix-Vektor-Multiplikation + argpartition
+- Backend 'ivf': k-Means-Grobquantisierer; durchsucht werden nur die 'nprobe' nächsten Listen
+- Backend 'int8': skalar quantisierte Codes im Speicher (4x kleiner), exaktes Re-Ranking der Kandidaten
+- Backend 'binary': 1-Bit-Codes mit Hamming-Vorfilter (32x kleiner), exaktes Re-Ranking der Kandidaten
+- Gleiche Schnittstelle wie Chroma: as_retriever, similarity_search_with_relevance_scores, ...
+  Distanzen und Relevanzwerte entsprechen denen von Chroma (quadrierte L2-Distanz, Relevanz 1 - d/√2),
+  ein score_threshold gilt damit für alle Speicher gleich
+- Metadaten-Filter (filter={"source": "Dracula.txt"}) werden vor der Suche über einen
+  Bitmap-Index ausgewertet (siehe metadata_index.py); durchsucht werden nur die passenden Zeilen
+- Texte, IDs und Metadaten liegen kompakt im ChunkStore (siehe chunk_store.py); Documents
+  werden erst für die k Treffer erzeugt
+
+Mit load_vector_store() wählen die Abfrageskripte (1b, 2b, 3) den Speicher per Umgebungsvariable:
+
+    RAG_VECTOR_STORE=chroma|bruteforce|ivf|int8|binary|sharded
+
+Der lokale Speicher wird beim ersten Aufruf einmalig aus der Chroma-Collection exportiert
+(ohne neue Embedding-Aufrufe) und liegt neben ihr in '<persist_directory>_local'.
+Bei den quantisierten Backends liegen nur die Codes im Arbeitsspeicher; die vollen Vektoren
+werden für das Re-Ranking der besten Kandidaten lazy von der Festplatte gelesen.
+'sharded' öffnet die mit 2a_rag_basics_metadata.py --shards gebauten Shards in
+'<persist_directory>_shards' (siehe sharded_store.py).
+"""
+import json  # Für Konfiguration und Chunk-Daten
+import os  # Für Dateisystem-Operationen
+
+import numpy as np
+from langchain_core.vectorstores import VectorStore
+
+from chunk_store import ChunkStore, migrate_jsonl
+from metadata_index import MetadataIndex
+
+DEFAULT_NPROBE = 8
+DEFAULT_RERANK = 100  # Kandidaten für das exakte Re-Ranking bei quantisierten Backends
+
+
+def normalize(vectors):
+    """Normiert Zeilenvektoren auf Länge 1 (Kosinus-Ähnlichkeit = Skalarprodukt)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores, k):
+    """Indizes der k größten Werte, absteigend sortiert (argpartition statt vollständiger Sortierung)."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def gather(vectors, rows):
+    """Liest die Zeilen 'rows' (sortiert); zusammenhängende Bereiche als Slice ohne Index-Kopie."""
+    if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+        return np.asarray(vectors[rows[0]:rows[-1] + 1])
+    return np.asarray(vectors[rows])
+
+
+def kmeans(vectors, n_clusters, iterations=20, sample_size=50_000, seed=42):
+    """Einfaches k-Means (Lloyd) auf normierten Vektoren mit Kosinus-Zuordnung."""
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > sample_size:
+        sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(n_clusters):
+            members = sample[assignment == c]
+            # Leere Cluster mit einem zufälligen Punkt neu starten
+            centroids[c] = members.mean(axis=0) if len(members) else sample[rng.integers(len(sample))]
+        centroids = normalize(centroids)
+    return centroids
+
+
+class BruteForceIndex:
+    """Exakte Suche über alle Vektoren."""
+
+    name = "bruteforce"
+    files = ()
+
+    def __init__(self, path, vectors, **kwargs):
+        self.vectors = vectors
+
+    @staticmethod
+    def build(path, vectors, **kwargs):
+        pass  # Keine zusätzlichen Strukturen nötig
+
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes  # Jede Abfrage liest die komplette Matrix
+
+    def search(self, query, k, rows=None):
+        if rows is not None:
+            scores = gather(self.vectors, rows) @ query
+            best = top_k(scores, k)
+            return rows[best], scores[best]
+        scores = self.vectors @ query
+        rows = top_k(scores, k)
+        return rows, scores[rows]
+
+
+class IVFIndex:
+    """Inverted File Index: k-Means-Zentren als Grobquantisierer, Suche nur in den nprobe nächsten Listen."""
+
+    name = "ivf"
+    files = ("ivf_centroids.npy", "ivf_order.npy", "ivf_offsets.npy")
+
+    def __init__(self, path, vectors, nprobe=DEFAULT_NPROBE, **kwargs):
+        self.vectors = vectors
+        self.nprobe = nprobe
+        self.centroids = np.load(os.path.join(path, "ivf_centroids.npy"))
+        self.order = np.load(os.path.join(path, "ivf_order.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "ivf_offsets.npy"))
+
+    @staticmethod
+    def build(path, vectors, nlist=None, **kwargs):
+        nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        centroids = kmeans(vectors, nlist)
+        # Zuordnung blockweise, damit auch große Matrizen nicht komplett kopiert werden
+        assignment = np.concatenate([
+            np.argmax(np.asarray(vectors[i:i + 65536]) @ centroids.T, axis=1)
+            for i in range(0, len(vectors), 65536)
+        ])
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        np.save(os.path.join(path, "ivf_centroids.npy"), centroids)
+        np.save(os.path.join(path, "ivf_order.npy"), order.astype(np.int64))
+        np.save(os.path.join(path, "ivf_offsets.npy"), offsets.astype(np.int64))
+
+    def search(self, query, k, rows=None):
+        if rows is not None and len(rows) <= k * self.nprobe:
+            # Sehr selektiver Filter: die Teilmenge exakt durchsuchen ist günstiger
+            return BruteForceIndex.search(self, query, k, rows)
+        probes = top_k(self.centroids @ query, self.nprobe)
+        candidates = np.concatenate([self.order[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+        if rows is not None:
+            allowed = np.zeros(len(self.vectors), dtype=bool)
+            allowed[rows] = True
+            candidates = candidates[allowed[candidates]]
+        if len(candidates) == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+        candidates = np.sort(candidates)  # Sortierte Zeilen = sequentielle Lesezugriffe auf die mmap-Datei
+        scores = self.vectors[candidates] @ query
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+
+def _rerank(vectors, query, candidates, k):
+    """Exakte Neubewertung der Kandidaten mit den vollen Vektoren (nur diese Zeilen werden gelesen)."""
+    candidates = np.sort(candidates)  # Sortierte Zeilen = sequentielle Lesezugriffe auf die mmap-Datei
+    scores = np.asarray(vectors[candidates]) @ query
+    best = top_k(scores, k)
+    return candidates[best], scores[best]
+
+
+class Int8Index:
+    """
+    Skalare int8-Quantisierung (4x kleiner als float32) mit exaktem Re-Ranking.
+
+    Pro Dimension werden Minimum und Schrittweite gespeichert; die Codes liegen im Arbeitsspeicher,
+    die vollen Vektoren bleiben auf der Festplatte und werden nur für die Kandidaten gelesen.
+    """
+
+    name = "int8"
+    files = ("int8_codes.npy", "int8_params.npy")
+    block_size = 65536
+
+    def __init__(self, path, vectors, rerank=DEFAULT_RERANK, **kwargs):
+        self.vectors = vectors
+        self.rerank = rerank
+        self.codes = np.load(os.path.join(path, "int8_codes.npy"))
+        self.minimum, self.scale = np.load(os.path.join(path, "int8_params.npy"))
+
+    @classmethod
+    def build(cls, path, vectors, **kwargs):
+        minimum = np.min(vectors, axis=0)
+        scale = (np.max(vectors, axis=0) - minimum) / 255.0
+        scale[scale == 0] = 1.0
+        codes = np.empty(vectors.shape, dtype=np.int8)
+        for i in range(0, len(vectors), cls.block_size):
+            block = np.asarray(vectors[i:i + cls.block_size])
+            codes[i:i + cls.block_size] = np.round((block - minimum) / scale - 128).astype(np.int8)
+        np.save(os.path.join(path, "int8_codes.npy"), codes)
+        np.save(os.path.join(path, "int8_params.npy"), np.stack([minimum, scale]).astype(np.float32))
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def search(self, query, k, rows=None):
+        # q·x ≈ q·min + Σ q_i * scale_i * (code_i + 128), blockweise ohne die ganze Matrix zu kopieren
+        weights = (query * self.scale).astype(np.float32)
+        offset = float(query @ self.minimum) + 128.0 * float(weights.sum())
+        codes = self.codes if rows is None else gather(self.codes, rows)
+        scores = np.concatenate([
+            codes[i:i + self.block_size].astype(np.float32) @ weights
+            for i in range(0, len(codes), self.block_size)
+        ] or [np.empty(0, dtype=np.float32)]) + offset
+        candidates = top_k(scores, max(k, self.rerank))
+        return _rerank(self.vectors, query, candidates if rows is None else rows[candidates], k)
+
+
+class BinaryIndex:
+    """
+    1-Bit-Quantisierung (32x kleiner als float32): Hamming-Vorfilter + exaktes Re-Ranking.
+
+    Jede Dimension wird auf ihr Vorzeichen reduziert und in Bytes gepackt. Die Hamming-Distanz
+    zur Abfrage wird per XOR und Popcount-Tabelle berechnet.
+    """
+
+    name = "binary"
+    files = ("binary_codes.npy",)
+    popcount = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+    def __init__(self, path, vectors, rerank=DEFAULT_RERANK, **kwargs):
+        self.vectors = vectors
+        self.rerank = rerank
+        self.codes = np.load(os.path.join(path, "binary_codes.npy"))
+
+    @staticmethod
+    def build(path, vectors, **kwargs):
+        codes = np.concatenate([
+            np.packbits(np.asarray(vectors[i:i + 65536]) > 0, axis=1)
+            for i in range(0, len(vectors), 65536)
+        ])
+        np.save(os.path.join(path, "binary_codes.npy"), codes)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def search(self, query, k, rows=None):
+        query_bits = np.packbits(query > 0)
+        codes = self.codes if rows is None else gather(self.codes, rows)
+        distances = self.popcount[np.bitwise_xor(codes, query_bits)].sum(axis=1)
+        candidates = top_k(-distances.astype(np.float32), max(k, self.rerank))
+        return _rerank(self.vectors, query, candidates if rows is None else rows[candidates], k)
+
+
+INDEX_CLASSES = {cls.name: cls for cls in (BruteForceIndex, IVFIndex, Int8Index, BinaryIndex)}
+BACKENDS = tuple(INDEX_CLASSES)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    LangChain-VectorStore auf Basis von NumPy-Dateien.
+
+    Args:
+        path: Verzeichnis mit vectors.npy, den Dateien des ChunkStore und index.json
+        embedding: Embedding-Funktion für Abfragen
+        backend: 'bruteforce', 'ivf', 'int8' oder 'binary' (Standard: das beim Bauen gespeicherte Backend)
+        index_kwargs: Backend-Parameter, z.B. nprobe (IVF) oder rerank (int8/binary)
+    """
+
+    def __init__(self, path, embedding, backend=None, **index_kwargs):
+        self.path = path
+        self.embedding = embedding
+        with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        if os.path.exists(os.path.join(path, "chunks.jsonl")):
+            migrate_jsonl(path)  # Export aus einer älteren Version
+        self.chunks = ChunkStore(path)
+        index_cls = INDEX_CLASSES[backend or self.config["backend"]]
+        # Fehlende Indexstrukturen (z.B. IVF für einen Brute-Force-Export) einmalig nachbauen
+        if not all(os.path.exists(os.path.join(path, name)) for name in index_cls.files):
+            index_cls.build(path, self.vectors)
+        self.index = index_cls(path, self.vectors, **index_kwargs)
+        if not all(os.path.exists(os.path.join(path, name)) for name in MetadataIndex.files):
+            MetadataIndex.build(path, self.chunks.iter_metadatas(), len(self.chunks))
+        self.metadata_index = MetadataIndex(path)
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @classmethod
+    def build(cls, path, vectors, ids, texts, metadatas, embedding, backend="bruteforce", **index_kwargs):
+        """
+        Schreibt einen neuen Speicher und gibt ihn geöffnet zurück.
+
+        ids, texts und metadatas dürfen Iteratoren sein; die Chunks werden gestreamt geschrieben.
+        """
+        if backend not in INDEX_CLASSES:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+        if len(vectors) == 0:
+            # Z.B. Export einer leeren Chroma-Collection
+            raise ValueError(
+                f"No vectors to index for {path}: the Chroma collection is empty. "
+                "Run the ingestion first (1a_basic_part_1.py or 2a_rag_basics_metadata.py)."
+            )
+        os.makedirs(path, exist_ok=True)
+        vectors = normalize(vectors)
+        np.save(os.path.join(path, "vectors.npy"), vectors)
+        if os.path.exists(os.path.join(path, "chunks.jsonl")):
+            os.remove(os.path.join(path, "chunks.jsonl"))  # Export aus einer älteren Version
+        count = ChunkStore.build(path, zip(ids, texts, metadatas))
+        with open(os.path.join(path, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"backend": backend, "count": count, "dim": int(vectors.shape[1])}, f)
+        # Eventuell vorhandene Indexstrukturen gehören zu alten Vektoren
+        for index_cls in (*INDEX_CLASSES.values(), MetadataIndex):
+            for name in index_cls.files:
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+        INDEX_CLASSES[backend].build(path, vectors, **index_kwargs)
+        MetadataIndex.build(path, ChunkStore(path).iter_metadatas(), count)
+        return cls(path, embedding, backend=backend)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, path=None, backend="bruteforce", **kwargs):
+        texts = list(texts)
+        ids = ids or [str(i) for i in range(len(texts))]
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = embedding.embed_documents(texts)
+        return cls.build(path, vectors, ids, texts, metadatas, embedding, backend=backend, **kwargs)
+
+    @classmethod
+    def from_chroma(cls, db, path, backend="bruteforce", **index_kwargs):
+        """Exportiert eine Chroma-Collection (inkl. gespeicherter Vektoren) in einen lokalen Speicher."""
+        data = db.get(include=["embeddings", "documents", "metadatas"])
+        # Nach Quelle und Position sortieren: ein Quellen-Filter ergibt dann einen zusammenhängenden Bereich
+        metadatas = [m or {} for m in data["metadatas"]]
+        order = sorted(
+            range(len(data["ids"])),
+            key=lambda i: (str(metadatas[i].get("source", "")), metadatas[i].get("chunk_index", 0), data["ids"][i]),
+        )
+        return cls.build(
+            path, np.asarray(data["embeddings"])[order], [data["ids"][i] for i in order],
+            [data["documents"][i] for i in order], [metadatas[i] for i in order],
+            db.embeddings, backend=backend, **index_kwargs,
+        )
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        """Fügt Texte hinzu (schreibt den Speicher neu; für Massendaten build() verwenden)."""
+        texts = list(texts)
+        ids = list(ids) if ids else [str(len(self) + i) for i in range(len(texts))]
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.vstack([np.asarray(self.vectors), normalize(self.embedding.embed_documents(texts))])
+        rebuilt = self.build(
+            self.path, vectors, [*self.chunks.iter_ids(), *ids], [*self.chunks.iter_texts(), *texts],
+            [*self.chunks.iter_metadatas(), *metadatas], self.embedding, backend=self.index.name,
+        )
+        self.__dict__.update(rebuilt.__dict__)
+        return ids
+
+    def _document(self, row):
+        return self.chunks.document(row)
+
+    def get_by_ids(self, ids):
+        rows = [self.chunks.row(doc_id) for doc_id in ids]
+        return [self._document(row) for row in rows if row is not None]
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, filter=None):
+        """
+        Liefert (Document, Distanz)-Paare; kleiner ist ähnlicher.
+
+        Die Distanz ist wie bei Chroma die quadrierte L2-Distanz; für normierte Vektoren 2 * (1 - Kosinus).
+
+        'filter' ist ein Metadaten-Filter in Chroma-Syntax; nur passende Zeilen werden durchsucht.
+        """
+        query = normalize(embedding)
+        rows = self.metadata_index.rows(filter) if filter else None
+        if rows is not None and len(rows) == 0:
+            return []
+        rows, scores = self.index.search(query, k, rows)
+        return [(self._document(row), float(2.0 * (1.0 - score))) for row, score in zip(rows, scores)]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn  # Wie Chroma: Relevanz = 1 - Distanz / √2
+
+
+def load_vector_store(persistent_directory, embeddings, store=None, **index_kwargs):
+    """
+    Öffnet den konfigurierten Vektorspeicher für eine Chroma-Datenbank.
+
+    Args:
+        persistent_directory: Verzeichnis der Chroma-Datenbank
+        embeddings: Embedding-Funktion für Abfragen
+        store: 'chroma', 'sharded' oder ein lokales Backend (Standard: Umgebungsvariable RAG_VECTOR_STORE oder 'chroma')
+        index_kwargs: Backend-Parameter, z.B. nprobe (IVF) oder rerank (int8/binary)
+    """
+    store = store or os.environ.get("RAG_VECTOR_STORE", "chroma")
+    if store == "sharded":
+        from sharded_store import ShardedVectorStore, shards_path_for
+        return ShardedVectorStore(shards_path_for(persistent_directory), embeddings)
+    if store == "chroma":
+        from langchain_chroma import Chroma  # Erst hier importieren: lokale Backends brauchen Chroma nur zum Export
+        return Chroma(embedding_function=embeddings, persist_directory=persistent_directory)
+    if store not in BACKENDS:
+        raise ValueError(f"Unknown vector store {store!r}, expected 'chroma', 'sharded' or one of {BACKENDS}")
+    local_path = persistent_directory.rstrip(os.sep) + "_local"
+    index_path = os.path.join(local_path, "index.json")
+    manifest_path = os.path.join(persistent_directory, "ingest_manifest.json")
+    # Neu exportieren, wenn es noch keinen Export gibt oder die Ingestion seitdem gelaufen ist
+    if not os.path.exists(index_path) or (
+        os.path.exists(manifest_path) and os.path.getmtime(manifest_path) > os.path.getmtime(index_path)
+    ):
+        from langchain_chroma import Chroma  # Ein aktueller Export kommt ohne den (langsamen) Chroma-Import aus
+
+        print(f"Exporting Chroma collection to {local_path}...")
+        db = Chroma(embedding_function=embeddings, persist_directory=persistent_directory)
+        LocalVectorStore.from_chroma(db, local_path, backend=store)
+    return LocalVectorStore(local_path, embeddings, backend=store, **index_kwargs)
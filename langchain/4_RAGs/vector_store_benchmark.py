@@ -0,0 +1,81 @@
+"""
+Recall- und Latenzvergleich: Chroma (HNSW) vs. lokale Brute-Force- und IVF-Suche
+
+Dieses Skript vergleicht die Vektorspeicher aus vector_store.py mit Chroma:
+- Die Vektoren werden einmalig aus der bestehenden Chroma-Collection exportiert (keine API-Aufrufe)
+- Abfragen sind leicht verrauschte Chunk-Vektoren aus der Collection selbst
+- Referenz ist die exakte Brute-Force-Suche
+- Ausgegeben werden recall@k sowie p50/p95-Latenz pro Konfiguration
+
+Dieses Skript setzt voraus, dass 2a_rag_basics_metadata.py bereits ausgeführt wurde.
+"""
+import argparse  # Für die Kommandozeilenoptionen
+import os  # Für Dateisystem-Operationen
+import time  # Für die Latenzmessung
+
+import numpy as np
+from langchain_chroma import Chroma
+
+from vector_store import LocalVectorStore, normalize
+
+current_dir = os.path.dirname(os.path.abspath(__file__))  # Aktuelles Verzeichnis ermitteln
+
+parser = argparse.ArgumentParser(description="Compare Chroma, brute-force and IVF retrieval")
+parser.add_argument("--persist-directory", default=os.path.join(current_dir, "db", "chroma_db_with_metadata"))
+parser.add_argument("--queries", type=int, default=200, help="Number of sampled queries")
+parser.add_argument("--k", type=int, default=5)
+parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+parser.add_argument("--noise", type=float, default=0.05, help="Gaussian noise added to query vectors")
+args = parser.parse_args()
+
+# Chroma-Collection öffnen und einmalig lokal exportieren
+db = Chroma(persist_directory=args.persist_directory)
+local_path = args.persist_directory.rstrip(os.sep) + "_local"
+exact = LocalVectorStore.from_chroma(db, local_path, backend="bruteforce")
+print(f"{len(exact)} vectors exported to {local_path}")
+
+# Abfragen: zufällige Chunk-Vektoren mit etwas Rauschen
+rng = np.random.default_rng(0)
+rows = rng.choice(len(exact), min(args.queries, len(exact)), replace=False)
+queries = normalize(
+    np.asarray(exact.vectors[rows]) + rng.normal(0, args.noise, (len(rows), exact.vectors.shape[1]))
+)
+
+
+def measure(search):
+    """Führt alle Abfragen aus und liefert (Ergebnis-IDs pro Abfrage, Latenzen in ms)."""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ids = search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids)
+    return results, np.array(latencies)
+
+
+def ids_of(docs_and_scores):
+    return [doc.id for doc, _ in docs_and_scores]
+
+
+truth, exact_latencies = measure(lambda q: ids_of(exact.similarity_search_by_vector_with_score(q, args.k)))
+
+configs = [("bruteforce", exact_latencies, truth)]
+for nprobe in args.nprobe:
+    ivf = LocalVectorStore(local_path, None, backend="ivf", nprobe=nprobe)
+    results, latencies = measure(lambda q: ids_of(ivf.similarity_search_by_vector_with_score(q, args.k)))
+    configs.append((f"ivf nprobe={nprobe}", latencies, results))
+results, latencies = measure(
+    lambda q: ids_of(db.similarity_search_by_vector_with_relevance_scores(q.tolist(), args.k))
+)
+configs.append(("chroma hnsw", latencies, results))
+
+print(f"\n--- recall@{args.k} vs. exact search, {len(queries)} queries ---")
+for name, latencies, results in configs:
+    recall = np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth) if t])
+    print(
+        f"{name:<18} recall@{args.k}={recall:.3f}  "
+        f"p50={np.percentile(latencies, 50):.3f}ms  p95={np.percentile(latencies, 95):.3f}ms"
+    )
+
+# Befehl zum Ausführen des Skripts in einer Docker-Umgebung
+# docker-compose run --rm app langchain/4_RAGs/vector_store_benchmark.py
@@ -3,15 +3,20 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.agents import initialize_agent, AgentType, tool
 from langchain_community.tools import DuckDuckGoSearchRun, TavilySearchResults
 import os
+import sys
 from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # langgraph/ für tool_cache
+from tool_cache import CachedTool, not_a_list
 llm = ChatOpenAI(model="gpt-4o-mini")
 
 # Angepasster Modellname - gemini-2.5.pro-exp-03-25 ist nicht mehr verfügbar
 # Verwende stattdessen ein stabiles und verfügbares Modell
 llm_google = ChatGoogleGenerativeAI(model="gemini-1.5-pro")
 
-search = TavilySearchResults(api_key=os.getenv("TAVILY_API_KEY"))
-search_duckduckgo = DuckDuckGoSearchRun()
+# Suchergebnisse werden lokal mit TTL zwischengespeichert (siehe langgraph/tool_cache.py)
+search = CachedTool.wrap(TavilySearchResults(api_key=os.getenv("TAVILY_API_KEY")), is_error=not_a_list)
+search_duckduckgo = CachedTool.wrap(DuckDuckGoSearchRun())
 
 @tool
 def get_system_time(format: str = "%Y-%m-%d %H:%M:%S"):
@@ -21,6 +26,7 @@ def get_system_time(format: str = "%Y-%m-%d %H:%M:%S"):
 agent = initialize_agent(tools=[search, get_system_time], llm=llm, agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION, verbose=True)
 
 agent.invoke({"input": "Wann ist die letzte SpaceX Rakete gestartet und wie viele Tage ist es von heute her?"})
+search.print_stats()
 
 """
 result = llm_google.invoke("Was ist die Hauptstadt von Deutschland?")
@@ -1,35 +1,47 @@
+import os
+import sys
+
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_openai import ChatOpenAI
-from langgraph.graph import MessageGraph, END
+from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage, BaseMessage
-from chains import generation_chain, reflection_chain
+from chains import generation_chain, reflection_chain, llm
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # langgraph/ for graph_state, checkpointer
+from checkpointer import SQLiteDeltaSaver, graph_fingerprint, run_resumable, thread_id_for
+from graph_state import HistoryWindow, ReflectionState, llm_summarizer
 
+# Counters live in the state; the nodes only see the task and the last KEEP_ROUNDS draft/critique rounds
+MAX_ITERATIONS = 3
+KEEP_ROUNDS = 2
+# REFLECTION_SUMMARY=1: older rounds are summarized instead of left out (one extra LLM call per round)
+history = HistoryWindow(
+    keep_rounds=KEEP_ROUNDS,
+    summarizer=llm_summarizer(llm) if os.environ.get("REFLECTION_SUMMARY") == "1" else None,
+)
 
-graph = MessageGraph()
+graph = StateGraph(ReflectionState)
 
 REFLECT = "reflect"
 GENERATE = "generate"
 
 
-def generate_node(state):
-    return generation_chain.invoke({
-        "messages": state
-    })
+def as_critique(response: BaseMessage) -> HumanMessage:
+    return HumanMessage(content=response.content)
+
 
+generate_node = history.node(generation_chain, name=GENERATE)
 
-def reflect_node(state):
-    response = reflection_chain.invoke({
-        "messages": state
-    })
-    return [HumanMessage(content=response.content)]
+# The critique closes a round
+reflect_node = history.node(reflection_chain | as_critique, closes_round=True, name=REFLECT)
 
 graph.add_node(GENERATE, generate_node)
 graph.add_node(REFLECT, reflect_node)
 
 graph.set_entry_point(GENERATE)
 
-def should_continue(state):
-    if(len(state) > 6):
+def should_continue(state: ReflectionState):
+    if state["iterations"] >= MAX_ITERATIONS:
         return END
     return REFLECT
 
@@ -37,13 +49,22 @@ graph.add_conditional_edges(GENERATE, should_continue)
 
 graph.add_edge(REFLECT, GENERATE)
 
-app = graph.compile()
+# Every finished node is checkpointed in langgraph/checkpoints.sqlite (messages as deltas)
+app = graph.compile(checkpointer=SQLiteDeltaSaver())
 
 # print(app.get_graph().draw_mermaid())
 # app.get_graph().print_ascii()
 
-response = app.invoke([HumanMessage(content="KI Multi Agent System für Content Erstellung")])
+if __name__ == "__main__":
+    # Importing this module only builds the graph (used by batch_runner.py)
+    task = {"messages": [HumanMessage(content="KI Multi Agent System für Content Erstellung")]}
+    # Same task, graph, prompts and model -> same thread: an interrupted run continues after the last
+    # completed node. A finished one runs again, with --reuse its stored result is returned.
+    # REFLECTION_THREAD=<id> starts or continues another thread.
+    fingerprint = graph_fingerprint(app, sys.modules[__name__], sys.modules["chains"], os.environ.get("REFLECTION_SUMMARY"))
+    thread_id = os.environ.get("REFLECTION_THREAD") or thread_id_for(task, "reflection", fingerprint)
+    response = run_resumable(app, task, thread_id, reuse="--reuse" in sys.argv)
 
-print(response)
+    print(response["messages"])
 
-# docker-compose run --rm app langgraph/2_basic_reflection_system/basic.py
\ No newline at end of file
+# docker-compose run --rm app langgraph/2_basic_reflection_system/basic.py
@@ -1,39 +1,110 @@
+import asyncio
 import json
-from typing import List, Dict, Any
-from langchain_core.messages import HumanMessage, ToolMessage, BaseMessage, AIMessage
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
 from langchain_community.tools import TavilySearchResults
 
-# Create the Tavily search tool
-tavily_tool = TavilySearchResults(max_results=5)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # langgraph/ for tool_cache
+from tool_cache import CachedTool, not_a_list
+
+# Create the Tavily search tool; results are cached across iterations and runs (see tool_cache.py).
+# On failure Tavily returns repr(e) instead of a list: not cached, so the next pass searches again
+tavily_tool = CachedTool.wrap(TavilySearchResults(max_results=5), is_error=not_a_list)
+
+# All search queries of one pass run concurrently: one pass costs the slowest search, not the sum
+MAX_CONCURRENT_SEARCHES = 5
+SEARCH_TIMEOUT = 15.0  # Seconds per query; a timed-out query is reported as an error entry
+TOOL_NAMES = ("AnswerQuestion", "ReviseAnswer")
+
+# Threads for the sync node; shared so a hanging search does not block the next pass
+_search_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SEARCHES, thread_name_prefix="tavily")
 
-# Function to execute the search queries from AnswerQuestion tool calls
-def execute_tools(state: List[BaseMessage]) -> List[BaseMessage]:
-    last_ai_message: AIMessage = state[-1]
 
+def _normalize(query: str) -> str:
+    return " ".join(query.split()).casefold()
+
+
+def _plan(state: List[BaseMessage]):
+    """Returns the relevant tool calls and the queries that need a search."""
+    last_ai_message: AIMessage = state[-1]
     # Extract tool calls from the AI message
     if not hasattr(last_ai_message, "tool_calls") or not last_ai_message.tool_calls:
-        return []
-    
-    # Process the AnswerQuestion or ReviseAnswer tool calls to extract search queries
-    tool_messages = []
+        return [], []
+    tool_calls = [tool_call for tool_call in last_ai_message.tool_calls if tool_call["name"] in TOOL_NAMES]
+    # Identical queries across tool calls are searched only once; repeats from earlier
+    # iterations are answered by the tool cache, so the history is not rescanned
+    pending = {}
+    for tool_call in tool_calls:
+        for query in tool_call["args"].get("search_queries", []):
+            pending.setdefault(_normalize(query), query)
+    return tool_calls, list(pending.items())
+
 
-    for tool_call in last_ai_message.tool_calls:
-        if tool_call["name"] in ["AnswerQuestion", "ReviseAnswer"]:
-            call_id = tool_call["id"]
-            # Extract search queries from the tool call arguments
-            search_queries = tool_call["args"].get("search_queries", [])
-
-            query_results = {}
-            for query in search_queries:
-                result = tavily_tool.invoke(query)
-                query_results[query] = result
-
-            # Create a new tool message with the query results
-            tool_messages.append(
-                ToolMessage(
-                    content=json.dumps(query_results),
-                    tool_call_id=call_id,
-                )
+def _tool_messages(tool_calls, results: Dict[str, Any]) -> List[ToolMessage]:
+    """Assembles one ToolMessage per tool call with {query: result} in the original query order."""
+    tool_messages = []
+    for tool_call in tool_calls:
+        query_results = {
+            query: results[_normalize(query)] for query in tool_call["args"].get("search_queries", [])
+        }
+        tool_messages.append(
+            ToolMessage(
+                content=json.dumps(query_results),
+                tool_call_id=tool_call["id"],
             )
+        )
+    return tool_messages
+
+
+def _error(exc: BaseException) -> Dict[str, str]:
+    if isinstance(exc, (TimeoutError, asyncio.TimeoutError)):
+        return {"error": f"search timed out after {SEARCH_TIMEOUT:.0f}s"}
+    return {"error": f"search failed: {exc}"}
+
+
+def _result(result: Any) -> Any:
+    # An error returned as a value is reported like a raised one
+    return {"error": f"search failed: {result}"} if tavily_tool.is_error(result) else result
+
+
+# Function to execute the search queries from AnswerQuestion tool calls
+def execute_tools_sync(state: List[BaseMessage]) -> List[BaseMessage]:
+    tool_calls, pending = _plan(state)
+    results = {}
+    futures = {key: _search_pool.submit(tavily_tool.invoke, query) for key, query in pending}
+    if futures:
+        wait(futures.values(), timeout=SEARCH_TIMEOUT)
+    for key, future in futures.items():
+        if not future.done():
+            future.cancel()
+            results[key] = _error(TimeoutError())
+        elif future.exception() is not None:
+            results[key] = _error(future.exception())
+        else:
+            results[key] = _result(future.result())
+    return _tool_messages(tool_calls, results)
+
+
+async def aexecute_tools(state: List[BaseMessage]) -> List[BaseMessage]:
+    tool_calls, pending = _plan(state)
+    results = {}
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SEARCHES)
+
+    async def search(query: str):
+        async with semaphore:
+            # The timeout starts once the query holds a slot
+            return await asyncio.wait_for(tavily_tool.ainvoke(query), SEARCH_TIMEOUT)
+
+    outcomes = await asyncio.gather(*(search(query) for _, query in pending), return_exceptions=True)
+    for (key, _), outcome in zip(pending, outcomes):
+        results[key] = _error(outcome) if isinstance(outcome, BaseException) else _result(outcome)
+    return _tool_messages(tool_calls, results)
+
 
-    return tool_messages
\ No newline at end of file
+# Graph node: app.invoke uses the thread pool, app.ainvoke the asyncio version
+execute_tools = RunnableLambda(execute_tools_sync, afunc=aexecute_tools, name="execute_tools")
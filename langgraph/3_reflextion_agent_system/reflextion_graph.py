@@ -1,23 +1,35 @@
-from typing import List
-from langchain_core.messages import BaseMessage, ToolMessage, HumanMessage
-from langgraph.graph import MessageGraph, END
+import os
+import sys
+from langchain_core.messages import HumanMessage
+from langgraph.graph import StateGraph, END
 
-from chains import first_responder_chain, revisor_chain
-from execute_tools import execute_tools
+from chains import first_responder_chain, revisor_chain, llm
+from execute_tools import execute_tools, tavily_tool
 
-graph = MessageGraph()
-MAX_ITERATIONS = 2
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # langgraph/ for graph_state, checkpointer
+from checkpointer import SQLiteDeltaSaver, graph_fingerprint, run_resumable, thread_id_for
+from graph_state import HistoryWindow, ReflectionState, llm_summarizer
 
-graph.add_node("responder", first_responder_chain)
-graph.add_node("revisor", revisor_chain)
-graph.add_node("execute_tools", execute_tools)
+graph = StateGraph(ReflectionState)
+MAX_ITERATIONS = 2
+# The revisor sees the question and the last KEEP_ROUNDS answer/search rounds; search payloads
+# outside this window are pruned from the state. REFLECTION_SUMMARY=1 summarizes older rounds.
+KEEP_ROUNDS = 2
+history = HistoryWindow(
+    keep_rounds=KEEP_ROUNDS,
+    summarizer=llm_summarizer(llm) if os.environ.get("REFLECTION_SUMMARY") == "1" else None,
+)
+
+graph.add_node("responder", history.node(first_responder_chain, name="responder"))
+graph.add_node("revisor", history.node(revisor_chain, name="revisor"))
+# The search results close a round
+graph.add_node("execute_tools", history.node(execute_tools, closes_round=True, name="execute_tools"))
 
 graph.add_edge("responder", "execute_tools")
 graph.add_edge("execute_tools", "revisor")
 
-def event_loop(state: List[BaseMessage]) -> str:
-    count_tool_visits = sum(isinstance(item, ToolMessage) for item in state)
-    num_iterations = count_tool_visits
+def event_loop(state: ReflectionState) -> str:
+    num_iterations = state["iterations"]  # Search rounds so far, counted by execute_tools
 
     if num_iterations > MAX_ITERATIONS:
         return END
@@ -27,12 +39,22 @@ graph.add_conditional_edges("revisor",event_loop)
 
 graph.set_entry_point("responder")
 
-app = graph.compile()
+# Every finished node is checkpointed in langgraph/checkpoints.sqlite (messages as deltas)
+app = graph.compile(checkpointer=SQLiteDeltaSaver())
 
-print(app.get_graph().draw_mermaid())
+if __name__ == "__main__":
+    # Importing this module only builds the graph (used by batch_runner.py)
+    print(app.get_graph().draw_mermaid())
 
-response = app.invoke([HumanMessage(content="Informiere dich über das Agenten System manus.im. Was macht es so besonders und welche Alternativen gibt es?")])
+    question = {"messages": [HumanMessage(content="Informiere dich über das Agenten System manus.im. Was macht es so besonders und welche Alternativen gibt es?")]}
+    # Same question, graph, prompts and model -> same thread: an interrupted run continues after the last
+    # completed node. A finished one runs again, with --reuse its stored result is returned.
+    # REFLECTION_THREAD=<id> starts or continues another thread.
+    fingerprint = graph_fingerprint(app, sys.modules[__name__], sys.modules["chains"], os.environ.get("REFLECTION_SUMMARY"))
+    thread_id = os.environ.get("REFLECTION_THREAD") or thread_id_for(question, "reflexion", fingerprint)
+    response = run_resumable(app, question, thread_id, reuse="--reuse" in sys.argv)
 
-print(response[-1].tool_calls[0]["args"]["answer"])
+    print(response["messages"][-1].tool_calls[0]["args"]["answer"])
+    tavily_tool.print_stats()
 
-# docker-compose run --rm app langgraph/3_reflextion_agent_system/reflextion_graph.py
\ No newline at end of file
+# docker-compose run --rm app langgraph/3_reflextion_agent_system/reflextion_graph.py
@@ -0,0 +1,203 @@
+"""
+Batch runner for the reflection (2_basic_reflection_system) and Reflexion (3_reflextion_agent_system) graphs.
+
+Reads prompts from JSONL ({"id": ..., "prompt": ...} per line; id defaults to the line number) and
+runs many graph instances concurrently instead of one hard-coded app.invoke:
+- At most --concurrency graphs run at once; all LLM calls share one rate limiter (--rpm), so wall
+  time is bounded by the provider limit rather than by serial execution
+- Each result is appended to the output JSONL as soon as its graph finishes
+- A failed prompt is retried with exponential backoff; thanks to the checkpointer (checkpointer.py)
+  a retry continues after the last completed node instead of starting over
+- Prompts with an "ok" line in the output file are skipped, so an interrupted batch can be rerun;
+  the checkpoint thread of a prompt is derived from run name, id, prompt text and the graph fingerprint
+  (graph, prompts, model); a finished thread without output line runs again unless --reuse is given
+- At the end: throughput, p50/p95 latency, retries, failures and token usage
+
+    python langgraph/batch_runner.py reflexion prompts.jsonl results.jsonl --concurrency 16 --rpm 500
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+LANGGRAPH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(LANGGRAPH_DIR)
+from checkpointer import arun_resumable, graph_fingerprint, thread_id_for
+
+# Graph name -> (directory, module); the module provides 'app', its chains module the shared 'llm'
+GRAPHS = {
+    "reflection": ("2_basic_reflection_system", "basic"),
+    "reflexion": ("3_reflextion_agent_system", "reflextion_graph"),
+}
+
+
+def load_graph(name: str):
+    """Imports the graph module (both directories have their own 'chains', so one graph per process)."""
+    directory, module_name = GRAPHS[name]
+    sys.path.insert(0, os.path.join(LANGGRAPH_DIR, directory))
+    return importlib.import_module(module_name)
+
+
+def read_prompts(path: str) -> List[Dict[str, Any]]:
+    prompts = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            prompts.append({"id": str(item.get("id", line_number)), "prompt": item["prompt"]})
+    return prompts
+
+
+def finished_ids(path: str) -> set:
+    """IDs with a successful result in an existing output file."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Line cut off by an interrupted run
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def final_answer(messages) -> str:
+    """Answer of the last AIMessage: the 'answer' argument of a tool call (Reflexion) or the content."""
+    for message in reversed(messages):
+        if isinstance(message, AIMessage):
+            for tool_call in message.tool_calls:
+                if "answer" in tool_call["args"]:
+                    return tool_call["args"]["answer"]
+            return message.content
+    return ""
+
+
+def _usage(handler: UsageMetadataCallbackHandler) -> Dict[str, int]:
+    totals = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+    for usage in handler.usage_metadata.values():
+        for key in totals:
+            totals[key] += usage.get(key, 0)
+    return totals
+
+
+async def run_prompt(app, item, thread_id: str, retries: int, backoff: float, reuse: bool = False) -> Dict[str, Any]:
+    """Runs one prompt with retries; the record is what ends up in the output file."""
+    handler = UsageMetadataCallbackHandler()  # Tokens of the calls made in this run (not of earlier runs)
+    config = {"callbacks": [handler]}
+    start = time.perf_counter()
+    for attempt in range(1, retries + 2):
+        try:
+            state = await arun_resumable(app, {"messages": [HumanMessage(content=item["prompt"])]}, thread_id, config,
+                                         reuse=reuse)
+            return {
+                "id": item["id"], "status": "ok", "answer": final_answer(state["messages"]),
+                "iterations": state.get("iterations", 0), "attempts": attempt,
+                "latency_s": round(time.perf_counter() - start, 3), "usage": _usage(handler),
+            }
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if attempt <= retries:
+                # Exponential backoff with jitter; the next attempt resumes from the last checkpoint
+                await asyncio.sleep(min(60.0, backoff * 2 ** (attempt - 1)) * (0.5 + random.random()))
+    return {
+        "id": item["id"], "status": "error", "error": error, "attempts": attempt,
+        "latency_s": round(time.perf_counter() - start, 3), "usage": _usage(handler),
+    }
+
+
+async def run_batch(app, prompts, output: str, run_name: str, concurrency: int = 8, retries: int = 2,
+                    backoff: float = 2.0, progress_every: Optional[int] = None, fingerprint: Optional[str] = None,
+                    reuse: bool = False) -> List[Dict[str, Any]]:
+    """Runs all prompts with at most `concurrency` graphs at once and appends each result to `output`."""
+    semaphore = asyncio.Semaphore(concurrency)
+    records = []
+    progress_every = progress_every or max(1, len(prompts) // 20)
+    start = time.perf_counter()
+
+    async def worker(item):
+        async with semaphore:
+            # Prompt and graph fingerprint are part of the thread ID: an edited prompt under the same id or a
+            # changed graph starts a new thread instead of resuming (or returning) the old run
+            thread_id = thread_id_for(item["prompt"], f"{run_name}-{item['id']}", fingerprint)
+            record = await run_prompt(app, item, thread_id, retries, backoff, reuse)
+        # Single event loop: writes of finished prompts cannot interleave
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        records.append(record)
+        if len(records) % progress_every == 0 or len(records) == len(prompts):
+            elapsed = time.perf_counter() - start
+            print(f"{len(records)}/{len(prompts)} done ({len(records) / elapsed:.2f} prompts/s)", flush=True)
+
+    with open(output, "a", encoding="utf-8") as out:
+        await asyncio.gather(*(worker(item) for item in prompts))
+    return records
+
+
+def print_report(records: List[Dict[str, Any]], wall_s: float, skipped: int) -> None:
+    ok = [r for r in records if r["status"] == "ok"]
+    failed = len(records) - len(ok)
+    print(f"\n--- Batch: {len(ok)} ok, {failed} failed, {skipped} skipped (already done) in {wall_s:.1f}s ---")
+    if records:
+        latencies = np.array([r["latency_s"] for r in records])
+        print(f"throughput: {len(records) / wall_s:.2f} prompts/s ({len(records) / wall_s * 60:.0f}/min)")
+        print(f"latency: p50 {np.percentile(latencies, 50):.2f}s, p95 {np.percentile(latencies, 95):.2f}s, "
+              f"max {latencies.max():.2f}s")
+        print(f"retries: {sum(r['attempts'] - 1 for r in records)}")
+    tokens = {key: sum(r["usage"][key] for r in records) for key in ("input_tokens", "output_tokens", "total_tokens")}
+    print(f"tokens: {tokens['input_tokens']} in, {tokens['output_tokens']} out, {tokens['total_tokens']} total"
+          + (f" ({tokens['total_tokens'] / len(ok):.0f} per successful prompt)" if ok else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a reflection graph over many prompts")
+    parser.add_argument("graph", choices=sorted(GRAPHS))
+    parser.add_argument("prompts", help="JSONL with {'id': ..., 'prompt': ...} per line")
+    parser.add_argument("output", help="JSONL for the results (appended)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Graphs running at the same time")
+    parser.add_argument("--rpm", type=float, default=500, help="LLM requests per minute across all graphs")
+    parser.add_argument("--retries", type=int, default=2, help="Retries per failed prompt")
+    parser.add_argument("--backoff", type=float, default=2.0, help="Seconds before the first retry")
+    parser.add_argument("--run-name", help="Prefix of the checkpoint threads (default: output file name)")
+    parser.add_argument("--reuse", action="store_true", help="Return stored results of finished threads instead of rerunning")
+    args = parser.parse_args()
+
+    module = load_graph(args.graph)
+    # One bucket for every LLM call of every graph; requests wait instead of hitting HTTP 429
+    sys.modules["chains"].llm.rate_limiter = InMemoryRateLimiter(
+        requests_per_second=args.rpm / 60, check_every_n_seconds=0.05, max_bucket_size=max(1, args.concurrency)
+    )
+
+    prompts = read_prompts(args.prompts)
+    done = finished_ids(args.output)
+    pending = [item for item in prompts if item["id"] not in done]
+    run_name = args.run_name or os.path.splitext(os.path.basename(args.output))[0]
+    print(f"{len(pending)} prompts to run ({len(prompts) - len(pending)} already done), graph '{args.graph}', "
+          f"concurrency {args.concurrency}, {args.rpm:.0f} LLM requests/min")
+
+    start = time.perf_counter()
+    fingerprint = graph_fingerprint(module.app, module, sys.modules["chains"], os.environ.get("REFLECTION_SUMMARY"))
+    records = asyncio.run(run_batch(module.app, pending, args.output, run_name, args.concurrency, args.retries,
+                                    args.backoff, fingerprint=fingerprint, reuse=args.reuse))
+    print_report(records, time.perf_counter() - start, len(prompts) - len(pending))
+    if hasattr(module, "tavily_tool"):
+        module.tavily_tool.print_stats()
+
+
+if __name__ == "__main__":
+    main()
+
+# docker-compose run --rm app langgraph/batch_runner.py reflexion prompts.jsonl results.jsonl --concurrency 16 --rpm 500
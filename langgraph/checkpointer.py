@@ -0,0 +1,488 @@
+"""
+Durable, resumable execution for the reflection graphs: a local SQLite checkpointer.
+
+Without a checkpointer a crash or timeout in the third LLM call throws away every completed LLM and
+search call. With SQLiteDeltaSaver every finished node is persisted and a rerun continues from there:
+- Messages are stored as deltas: ReflectionState.messages is a DeltaChannel, so a checkpoint keeps
+  only the messages a node added (checkpoint writes) plus a full snapshot every few updates. The
+  state is rebuilt by replaying the writes since the nearest snapshot (get_delta_channel_history)
+- Writes of nodes that finished before a failure are kept; on resume only the failed node runs again
+- One small transaction per node (WAL, synchronous=NORMAL): survives a crashed process, costs well
+  below a millisecond per checkpoint
+- Every step stays addressable: history() lists them, replay() re-executes from a step and fork()
+  branches off with changed values, both without touching the original run
+
+- Finished threads are run again unless reuse=True (--reuse in the scripts); thread_id_for() mixes a
+  fingerprint of graph, prompts and model into the ID, so a changed graph never resumes an old run
+
+    app = graph.compile(checkpointer=SQLiteDeltaSaver())
+    result = run_resumable(app, {"messages": [...]}, thread_id="manus-research")
+"""
+import hashlib
+import inspect
+import json
+import os
+import random
+import sqlite3
+import threading
+from types import ModuleType
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    DeltaChannelHistory,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, parent_id TEXT,
+    type TEXT NOT NULL, checkpoint BLOB NOT NULL, metadata_type TEXT NOT NULL, metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, channel TEXT NOT NULL, version TEXT NOT NULL,
+    type TEXT NOT NULL, blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT NOT NULL, value BLOB, task_path TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+class SQLiteDeltaSaver(BaseCheckpointSaver[str]):
+    """
+    LangGraph checkpointer in a local SQLite file.
+
+    Channel values are stored per (channel, version), so a checkpoint only adds the channels that
+    changed; DeltaChannel values (the messages) are reconstructed from the stored node writes.
+
+    Args:
+        path: SQLite file (':memory:' for tests)
+        serde: Serializer (default: LangGraph's JsonPlusSerializer)
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, *, serde=None):
+        super().__init__(serde=serde)
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # Durable against process crashes, no fsync per node
+        self._conn.executescript(_SCHEMA)
+
+    # --- Reading ---
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        if not versions:
+            return {}
+        values = {}
+        with self._lock:
+            for channel, version in versions.items():
+                row = self._conn.execute(
+                    "SELECT type, blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                    (thread_id, checkpoint_ns, channel, str(version)),
+                ).fetchone()
+                if row is not None and row[0] != "empty":
+                    values[channel] = self.serde.loads_typed((row[0], row[1]))
+        return values
+
+    def _load_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str):
+        """Writes of a checkpoint as (task_id, channel, value) in writes_sort_key order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchall()
+        rows.sort(key=lambda row: writes_sort_key(row[5], row[0], row[1]))
+        return [(task_id, channel, self.serde.loads_typed((type_, value))) for task_id, _, channel, type_, value, _ in rows]
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        checkpoint_: Checkpoint = self.serde.loads_typed((type_, checkpoint))
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={
+                **checkpoint_,
+                "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint_["channel_versions"]),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id
+                else None
+            ),
+            pending_writes=self._load_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+        return self._tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        conditions, params = [], []
+        if config:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            conditions.append("checkpoint_id < ?")
+            params.append(before_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and limit <= 0:
+                break
+            if filter:
+                metadata = self.serde.loads_typed((row[4], row[5]))
+                if not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            yield self._tuple(thread_id, checkpoint_ns, row)
+
+    def get_delta_channel_history(
+        self, *, config: RunnableConfig, channels: Sequence[str]
+    ) -> Mapping[str, DeltaChannelHistory]:
+        """
+        Writes and seed per delta channel: walks the parents of the checkpoint once (one query for
+        the whole chain) until every channel has reached a stored snapshot.
+        """
+        if not channels:
+            return {}
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        with self._lock:
+            if not checkpoint_id:
+                row = self._conn.execute(
+                    "SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+                checkpoint_id = row[0] if row else None
+            chain = self._conn.execute(
+                "WITH RECURSIVE chain(id, depth) AS ("
+                " SELECT parent_id, 1 FROM checkpoints WHERE thread_id = ?1 AND checkpoint_ns = ?2 AND checkpoint_id = ?3"
+                " UNION ALL SELECT c.parent_id, chain.depth + 1 FROM checkpoints c JOIN chain"
+                " ON c.thread_id = ?1 AND c.checkpoint_ns = ?2 AND c.checkpoint_id = chain.id)"
+                " SELECT c.checkpoint_id, c.type, c.checkpoint FROM chain JOIN checkpoints c"
+                " ON c.thread_id = ?1 AND c.checkpoint_ns = ?2 AND c.checkpoint_id = chain.id ORDER BY chain.depth",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchall() if checkpoint_id else []
+
+        collected: Dict[str, List] = {channel: [] for channel in channels}
+        seeds: Dict[str, Any] = {}
+        remaining = set(channels)
+        for ancestor_id, type_, checkpoint in chain:  # Newest ancestor first
+            if not remaining:
+                break
+            versions = self.serde.loads_typed((type_, checkpoint)).get("channel_versions", {})
+            stored = self._load_blobs(
+                thread_id, checkpoint_ns, {channel: versions[channel] for channel in remaining if channel in versions}
+            )
+            for write in reversed(self._load_writes(thread_id, checkpoint_ns, ancestor_id)):
+                if write[1] in remaining:
+                    collected[write[1]].append(write)
+            for channel, value in stored.items():
+                seeds[channel] = value
+                remaining.discard(channel)
+
+        result: Dict[str, DeltaChannelHistory] = {}
+        for channel in channels:
+            entry: DeltaChannelHistory = {"writes": list(reversed(collected[channel]))}
+            if channel in seeds:
+                entry["seed"] = seeds[channel]
+            result[channel] = entry
+        return result
+
+    # --- Writing ---
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_ = checkpoint.copy()
+        values = checkpoint_.pop("channel_values")
+        # Only channels with a new version are stored; delta channels mostly as 'empty'
+        blobs = []
+        for channel, version in new_versions.items():
+            type_, blob = self.serde.dumps_typed(values[channel]) if channel in values else ("empty", None)
+            blobs.append((thread_id, checkpoint_ns, channel, str(version), type_, blob))
+        type_, serialized = self.serde.dumps_typed(checkpoint_)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blobs)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                    type_, serialized, metadata_type, serialized_metadata,
+                ),
+            )
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, type_, blob, task_path))
+        # Special writes (errors, interrupts) replace earlier ones; regular writes are stored once
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            for table in ("checkpoints", "blobs", "writes"):
+                self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # Random suffix: versions stay unique when a fork writes the same step again
+        current_v = 0 if current is None else current if isinstance(current, int) else int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    def size(self, thread_id: Optional[str] = None) -> Dict[str, int]:
+        """Stored bytes per table (checkpoints, blobs, writes), optionally for one thread."""
+        columns = {"checkpoints": "LENGTH(checkpoint) + LENGTH(metadata)", "blobs": "LENGTH(blob)", "writes": "LENGTH(value)"}
+        sizes = {}
+        with self._lock:
+            for table, column in columns.items():
+                where, params = ("WHERE thread_id = ?", (thread_id,)) if thread_id else ("", ())
+                sizes[table] = self._conn.execute(f"SELECT COALESCE(SUM({column}), 0) FROM {table} {where}", params).fetchone()[0]
+        return sizes
+
+    # --- Async: local SQLite calls take well below a millisecond, so they run inline ---
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+    async def aget_delta_channel_history(self, *, config, channels):
+        return self.get_delta_channel_history(config=config, channels=channels)
+
+
+def thread_config(thread_id: str, checkpoint_id: Optional[str] = None) -> RunnableConfig:
+    configurable = {"thread_id": thread_id}
+    if checkpoint_id:
+        configurable["checkpoint_id"] = checkpoint_id
+    return {"configurable": configurable}
+
+
+def graph_fingerprint(app, *parts: Any) -> str:
+    """Short hash of the graph structure plus modules (their source: prompts, model settings) or other values."""
+    digest = hashlib.sha256(app.get_graph().draw_mermaid().encode("utf-8"))
+    for part in parts:
+        text = inspect.getsource(part) if isinstance(part, ModuleType) else repr(part)
+        digest.update(b"\0" + text.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def thread_id_for(input: Any, prefix: str = "run", fingerprint: Optional[str] = None) -> str:
+    """Stable thread ID for an input (and graph fingerprint): rerunning the same prompt resumes its run."""
+    payload = json.dumps([input, fingerprint], sort_keys=True,
+                         default=lambda value: getattr(value, "content", str(value)))
+    return f"{prefix}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]}"
+
+
+def run_resumable(app, input: Any, thread_id: str, config: Optional[RunnableConfig] = None,
+                  reuse: bool = False) -> Dict[str, Any]:
+    """
+    Runs the graph in the given thread:
+    - new thread: normal run, every finished node is checkpointed
+    - interrupted run (crash, timeout, Ctrl+C): continues after the last completed node
+    - finished run: deleted and run again, or with reuse=True the stored result is returned
+    """
+    config = {**(config or {}), **thread_config(thread_id)}
+    state = app.get_state(config)
+    if state.next:
+        print(f"Resuming thread {thread_id} at {list(state.next)}")
+        return app.invoke(None, config)
+    if state.values:
+        if reuse:
+            print(f"Thread {thread_id} already finished, returning the stored result")
+            return state.values
+        app.checkpointer.delete_thread(thread_id)
+    return app.invoke(input, config)
+
+
+async def arun_resumable(app, input: Any, thread_id: str, config: Optional[RunnableConfig] = None,
+                         reuse: bool = False) -> Dict[str, Any]:
+    config = {**(config or {}), **thread_config(thread_id)}
+    state = await app.aget_state(config)
+    if state.next:
+        print(f"Resuming thread {thread_id} at {list(state.next)}")
+        return await app.ainvoke(None, config)
+    if state.values:
+        if reuse:
+            print(f"Thread {thread_id} already finished, returning the stored result")
+            return state.values
+        await app.checkpointer.adelete_thread(thread_id)
+    return await app.ainvoke(input, config)
+
+
+def history(app, thread_id: str) -> List[Any]:
+    """All steps of a thread as StateSnapshots, oldest first (checkpoint_id in snapshot.config)."""
+    return list(reversed(list(app.get_state_history(thread_config(thread_id)))))
+
+
+def replay(app, thread_id: str, checkpoint_id: str) -> Dict[str, Any]:
+    """Re-executes the run from a step; the new steps branch off, the original ones stay."""
+    return app.invoke(None, thread_config(thread_id, checkpoint_id))
+
+
+def fork(app, thread_id: str, checkpoint_id: str, values: Dict[str, Any], as_node: Optional[str] = None) -> Dict[str, Any]:
+    """Branches off a step with changed values (e.g. an edited message) and runs the branch to the end."""
+    branch = app.update_state(thread_config(thread_id, checkpoint_id), values, as_node=as_node)
+    return app.invoke(None, branch)
+
+
+def print_history(app, thread_id: str) -> None:
+    for snapshot in history(app, thread_id):
+        step = snapshot.metadata.get("step") if snapshot.metadata else None
+        print(f"step {step:>3}  {snapshot.config['configurable']['checkpoint_id']}  next={list(snapshot.next)}")
+
+
+if __name__ == "__main__":
+    # Demo: a run crashes in the third LLM call, is resumed, replayed and forked
+    import sys
+    import tempfile
+    import time
+
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.graph import END, StateGraph
+
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    from graph_state import HistoryWindow, ReflectionState
+
+    calls = {"llm": 0}
+    fail_at = {3}
+
+    def fake_llm(messages):
+        calls["llm"] += 1
+        if calls["llm"] in fail_at:
+            raise TimeoutError("LLM call timed out")
+        return AIMessage(content=f"draft {calls['llm']}: " + "x" * 2000)
+
+    history_window = HistoryWindow(keep_rounds=2)
+    graph = StateGraph(ReflectionState)
+    graph.add_node("generate", history_window.node(RunnableLambda(fake_llm)))
+    graph.add_node("reflect", history_window.node(RunnableLambda(
+        lambda messages: HumanMessage(content="critique: " + "y" * 500)), closes_round=True))
+    graph.set_entry_point("generate")
+    graph.add_conditional_edges("generate", lambda state: END if state["iterations"] >= 6 else "reflect")
+    graph.add_edge("reflect", "generate")
+
+    with tempfile.TemporaryDirectory() as directory:
+        saver = SQLiteDeltaSaver(os.path.join(directory, "checkpoints.sqlite"))
+        app = graph.compile(checkpointer=saver)
+        task = {"messages": [HumanMessage(content="Write a post")]}
+        thread_id = thread_id_for(task, "demo", graph_fingerprint(app))
+        try:
+            run_resumable(app, task, thread_id)
+        except TimeoutError as e:
+            print(f"run 1 failed after {calls['llm']} LLM calls: {e}")
+        start = time.perf_counter()
+        result = run_resumable(app, task, thread_id)
+        elapsed = time.perf_counter() - start
+        print(f"run 2 resumed: {calls['llm']} LLM calls in total (none repeated except the failed one), "
+              f"{len(result['messages'])} messages")
+        steps = history(app, thread_id)
+        print(f"{len(steps)} checkpoints, {elapsed / len(steps) * 1000:.2f}ms per step including the graph itself")
+        stored = saver.size(thread_id)
+        full = sum(len(saver.serde.dumps_typed(snapshot.values.get("messages", []))[1]) for snapshot in steps)
+        print(f"stored: {sum(stored.values())} bytes {stored}; full message lists per step would be {full} bytes")
+        before = calls["llm"]
+        run_resumable(app, task, thread_id, reuse=True)
+        print(f"run 3 (finished thread, reuse=True): {calls['llm'] - before} LLM calls")
+
+        fork_from = next(s for s in steps if s.next == ("reflect",))
+        before = calls["llm"]
+        replayed = replay(app, thread_id, fork_from.config["configurable"]["checkpoint_id"])
+        print(f"replay from step {fork_from.metadata['step']}: {calls['llm'] - before} LLM calls, {len(replayed['messages'])} messages")
+        forked = fork(app, thread_id, fork_from.config["configurable"]["checkpoint_id"],
+                      {"messages": [AIMessage(content="hand-edited draft", id=fork_from.values["messages"][-1].id)]})
+        edited = forked["messages"][len(fork_from.values["messages"]) - 1].content
+        print(f"fork with an edited draft: {len(forked['messages'])} messages, draft in the branch: {edited!r}")
+        before = calls["llm"]
+        run_resumable(app, task, thread_id)
+        print(f"run 4 (finished thread, default): {calls['llm'] - before} LLM calls, {len(history(app, thread_id))} checkpoints")
+
+# docker-compose run --rm app langgraph/checkpointer.py
@@ -0,0 +1,204 @@
+"""
+Bounded state for the reflection graphs.
+
+With a plain MessageGraph every node receives and resends the whole history, and routers count
+messages by rescanning the state, so prompt tokens grow quadratically with the iterations. This
+module keeps the per-iteration work flat:
+- ReflectionState holds the messages plus typed counters ('iterations' is incremented by the node
+  that closes a round, routers read it instead of counting messages)
+- A round starts with an AIMessage (draft/answer) and ends with the node that closes it
+  (critique, search results). Nodes only see the task, the summary and the last keep_rounds rounds
+- When a round leaves the window, its JSON tool payloads are replaced in the state by a stub and,
+  with a summarizer, it is folded into the running summary
+
+    history = HistoryWindow(keep_rounds=2)
+    graph = StateGraph(ReflectionState)
+    graph.add_node("generate", history.node(generation_chain))
+    graph.add_node("reflect", history.node(reflection_chain, closes_round=True))
+
+All lookups walk back from the end of the state over at most keep_rounds + 1 rounds.
+"""
+import json
+import operator
+import uuid
+from typing import Annotated, Any, Dict, List, Optional, Sequence, TypedDict
+
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage, ToolMessage, convert_to_messages
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import Runnable, RunnableLambda
+from langgraph.channels import DeltaChannel
+from langgraph.graph import add_messages
+
+SUPERSEDED = "[superseded]"
+SNAPSHOT_FREQUENCY = 20  # With a checkpointer: full message list every 20 updates, deltas in between
+
+_MESSAGE_IDS = uuid.UUID("6f1c2a4e-8b3d-4c5f-9a7e-1d2b3c4d5e6f")
+
+
+def add_message_batches(messages: List[BaseMessage], batches: Sequence[Any]) -> List[BaseMessage]:
+    """
+    add_messages over several node outputs at once (reducer of the DeltaChannel). New messages get
+    IDs derived from their predecessor instead of random ones, so a state rebuilt from the stored
+    deltas has the same IDs as the live one and later replacements by ID still match.
+    """
+    for batch in batches:
+        batch = convert_to_messages(batch if isinstance(batch, list) else [batch])
+        previous = messages[-1].id if messages else ""
+        for offset, message in enumerate(batch):
+            if message.id is None:
+                message.id = str(uuid.uuid5(_MESSAGE_IDS, f"{previous}:{offset}"))
+        messages = add_messages(messages, batch)
+    return messages
+
+
+class ReflectionState(TypedDict):
+    # Stored as deltas by checkpointers (see checkpointer.py); behaves like add_messages
+    messages: Annotated[List[BaseMessage], DeltaChannel(add_message_batches, snapshot_frequency=SNAPSHOT_FREQUENCY)]
+    iterations: Annotated[int, operator.add]  # Completed rounds; nodes return {"iterations": 1}
+    summary: str  # Summary of the rounds outside the window ("" without summarizer)
+
+
+def prune_payload(message: ToolMessage) -> ToolMessage:
+    """Same ToolMessage (same id, so add_messages replaces it) with the payload reduced to its keys."""
+    try:
+        payload = json.loads(message.content)
+    except (TypeError, ValueError):
+        payload = None
+    content = json.dumps({key: SUPERSEDED for key in payload}) if isinstance(payload, dict) else SUPERSEDED
+    return ToolMessage(content=content, tool_call_id=message.tool_call_id, id=message.id)
+
+
+def llm_summarizer(llm) -> Runnable:
+    """Summarizer for HistoryWindow: folds a round that leaves the window into the running summary."""
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", """Maintain a short summary of earlier rounds of an iterative draft/critique process.
+Keep the decisions, the critique that still applies and facts with their sources. At most 150 words.
+Current summary:
+{summary}"""),
+        MessagesPlaceholder(variable_name="messages"),
+        ("system", "Return the updated summary including the round above."),
+    ])
+    return prompt | llm | StrOutputParser()
+
+
+class HistoryWindow:
+    """
+    Windowed view on ReflectionState and the nodes that use it.
+
+    Args:
+        keep_rounds: Number of most recent rounds the nodes see verbatim
+        summarizer: Optional Runnable ({"summary", "messages"} -> str) for rounds leaving the window,
+            e.g. llm_summarizer(llm); without it older rounds are simply left out of the prompts
+        prune_tool_payloads: Replace ToolMessage payloads outside the window by a stub
+    """
+
+    def __init__(self, keep_rounds: int = 2, summarizer: Optional[Runnable] = None, prune_tool_payloads: bool = True):
+        if keep_rounds < 1:
+            raise ValueError("keep_rounds must be at least 1")
+        self.keep_rounds = keep_rounds
+        self.summarizer = summarizer
+        self.prune_tool_payloads = prune_tool_payloads
+
+    @staticmethod
+    def _task_end(messages: List[BaseMessage]) -> int:
+        # The task: everything before the first AIMessage
+        for index, message in enumerate(messages):
+            if isinstance(message, AIMessage):
+                return index
+        return len(messages)
+
+    @staticmethod
+    def _round_starts(messages: List[BaseMessage], task_end: int, count: int) -> List[int]:
+        """Start indices of the last `count` rounds, newest first."""
+        starts = []
+        index = len(messages) - 1
+        while index >= task_end and len(starts) < count:
+            if isinstance(messages[index], AIMessage):
+                starts.append(index)
+            index -= 1
+        return starts
+
+    def prompt(self, state: ReflectionState) -> List[BaseMessage]:
+        """Task + summary + the last keep_rounds rounds."""
+        messages = state["messages"]
+        task_end = self._task_end(messages)
+        starts = self._round_starts(messages, task_end, self.keep_rounds)
+        view = messages[:task_end]
+        if state.get("summary"):
+            view.append(SystemMessage(content=f"Summary of earlier rounds:\n{state['summary']}"))
+        return view + messages[starts[-1]:] if starts else view + messages[task_end:]
+
+    def _leaving_round(self, state: ReflectionState) -> List[BaseMessage]:
+        # Closing the current round pushes round keep_rounds + 1 (counted from the end) out of the window
+        messages = state["messages"]
+        starts = self._round_starts(messages, self._task_end(messages), self.keep_rounds + 1)
+        if len(starts) <= self.keep_rounds:
+            return []
+        return messages[starts[-1]:starts[-2]]
+
+    def _close_round(self, state: ReflectionState, new_messages: List[BaseMessage]):
+        leaving = self._leaving_round(state)
+        if self.prune_tool_payloads:
+            new_messages = new_messages + [prune_payload(m) for m in leaving if isinstance(m, ToolMessage)]
+        return {"messages": new_messages, "iterations": 1}, leaving
+
+    def close_round(self, state: ReflectionState, new_messages: List[BaseMessage]) -> Dict[str, Any]:
+        """State update of the node that closes a round: new messages, counter, pruning, summary."""
+        update, leaving = self._close_round(state, new_messages)
+        if leaving and self.summarizer is not None:
+            update["summary"] = self.summarizer.invoke({"summary": state.get("summary") or "", "messages": leaving})
+        return update
+
+    async def aclose_round(self, state: ReflectionState, new_messages: List[BaseMessage]) -> Dict[str, Any]:
+        update, leaving = self._close_round(state, new_messages)
+        if leaving and self.summarizer is not None:
+            update["summary"] = await self.summarizer.ainvoke(
+                {"summary": state.get("summary") or "", "messages": leaving}
+            )
+        return update
+
+    def node(self, runnable: Runnable, closes_round: bool = False, name: Optional[str] = None) -> Runnable:
+        """
+        Graph node that calls runnable with the windowed messages and appends its output
+        (a message or a list of messages). Supports invoke and ainvoke.
+        """
+        def as_list(output):
+            return list(output) if isinstance(output, (list, tuple)) else [output]
+
+        def call(state: ReflectionState):
+            output = as_list(runnable.invoke(self.prompt(state)))
+            return self.close_round(state, output) if closes_round else {"messages": output}
+
+        async def acall(state: ReflectionState):
+            output = as_list(await runnable.ainvoke(self.prompt(state)))
+            return await self.aclose_round(state, output) if closes_round else {"messages": output}
+
+        return RunnableLambda(call, afunc=acall, name=name or getattr(runnable, "name", None))
+
+
+if __name__ == "__main__":
+    # Demo: prompt size per iteration with the full history vs. the window
+    from langchain_core.messages import HumanMessage
+
+    payload = json.dumps({f"query {i}": [{"url": "https://example.com", "content": "x" * 2000}] for i in range(3)})
+    history = HistoryWindow(keep_rounds=2)
+    state = {"messages": [HumanMessage(content="task", id="0")], "iterations": 0, "summary": ""}
+    full = list(state["messages"])
+    for iteration in range(1, 9):
+        answer = AIMessage(content="", id=f"a{iteration}", tool_calls=[
+            {"name": "ReviseAnswer", "args": {"answer": "y" * 1500}, "id": f"call{iteration}"}
+        ])
+        state["messages"] = add_messages(state["messages"], [answer])
+        full.append(answer)
+        result = ToolMessage(content=payload, tool_call_id=f"call{iteration}", id=f"t{iteration}")
+        update = history.close_round(state, [result])
+        state["messages"] = add_messages(state["messages"], update["messages"])
+        state["iterations"] += update["iterations"]
+        full.append(result)
+        windowed = sum(len(str(m.content)) + len(str(getattr(m, "tool_calls", ""))) for m in history.prompt(state))
+        unbounded = sum(len(str(m.content)) + len(str(getattr(m, "tool_calls", ""))) for m in full)
+        stored = sum(len(str(m.content)) for m in state["messages"])
+        print(f"iteration {iteration}: prompt {windowed:>6} chars (full history {unbounded:>6}), state payloads {stored:>6} chars")
+
+# docker-compose run --rm app langgraph/graph_state.py
@@ -0,0 +1,298 @@
+"""
+Persistent result cache for LangChain tools (search tools in particular).
+
+The research agents send the same or very similar queries again and again, across Reflexion
+iterations and across runs. CachedTool wraps any tool and answers repeated calls from a local
+SQLite store:
+- Key: tool name + tool parameters (e.g. max_results) + normalized input (whitespace collapsed, case folded)
+- Entries expire after ttl seconds; beyond max_entries the least recently used ones are evicted
+- Concurrent identical calls share one in-flight call (threads and asyncio tasks alike)
+- Exceptions, error results and results that are not JSON-serializable are not cached. Some tools
+  catch their own errors and return them as a value (TavilySearchResults returns repr(e) instead of
+  a list); an is_error predicate per tool recognizes those, so the next call tries again
+
+    search = CachedTool.wrap(TavilySearchResults(max_results=5), is_error=not_a_list)
+
+The wrapper keeps name, description and args schema of the tool, so agents see no difference.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.tools import BaseTool
+from pydantic import PrivateAttr
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tool_cache.sqlite")
+DEFAULT_TTL = 24 * 3600.0
+
+# Tool fields that describe the tool rather than change its results
+_IGNORED_FIELDS = {
+    "name", "description", "args_schema", "return_direct", "verbose", "callbacks", "callback_manager",
+    "tags", "metadata", "handle_tool_error", "handle_validation_error", "response_format", "extras",
+}
+
+
+_ERROR_REPR = re.compile(r"^\w*(Error|Exception|Timeout)\w*\(")
+
+
+def error_repr(result: Any) -> bool:
+    """Default is_error: the result is the repr of an exception, e.g. "HTTPError('429 ...')"."""
+    return isinstance(result, str) and _ERROR_REPR.match(result) is not None
+
+
+def not_a_list(result: Any) -> bool:
+    """is_error for tools that return a list of results and something else (a message) on failure."""
+    return not isinstance(result, list)
+
+
+def normalize(value: Any) -> Any:
+    """Collapses whitespace and case in strings (also inside dicts and lists)."""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    return value
+
+
+def tool_params(tool: BaseTool) -> Dict[str, Any]:
+    """Scalar configuration fields of a tool (e.g. max_results); secrets and clients are skipped."""
+    params = {}
+    for field in type(tool).model_fields:
+        value = getattr(tool, field, None)
+        if field in _IGNORED_FIELDS or "key" in field.lower() or "token" in field.lower():
+            continue
+        if isinstance(value, (str, int, float, bool)) or (
+            isinstance(value, (list, tuple)) and all(isinstance(item, (str, int, float, bool)) for item in value)
+        ):
+            params[field] = value
+    return params
+
+
+class ToolResultCache:
+    """
+    SQLite store for tool results with TTL and LRU eviction.
+
+    Args:
+        path: SQLite file
+        ttl: Seconds until an entry expires
+        max_entries: Maximum number of stored results
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, ttl: float = DEFAULT_TTL, max_entries: int = 10_000):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, tool TEXT NOT NULL, value TEXT NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_lru ON results (last_used)")
+
+    @staticmethod
+    def key(tool_name: str, params: Dict[str, Any], tool_input: Any) -> str:
+        payload = json.dumps([tool_name, params, normalize(tool_input)], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Returns (True, result) for a fresh entry, otherwise (False, None)."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False, None
+            if row[1] + self.ttl < now:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return False, None
+            self._conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+        return True, json.loads(row[0])
+
+    def put(self, key: str, tool_name: str, result: Any) -> bool:
+        try:
+            value = json.dumps(result)
+        except (TypeError, ValueError):
+            return False  # Not serializable: simply not cached
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, tool, value, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, tool_name, value, now, now),
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)", (excess,)
+                )
+        return True
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM results WHERE created < ?", (time.time() - self.ttl,)).rowcount
+
+
+_default_cache: Optional[ToolResultCache] = None
+
+
+def default_cache() -> ToolResultCache:
+    """Shared cache in langgraph/tool_cache.sqlite (TTL from TOOL_CACHE_TTL in seconds, default 24h)."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ToolResultCache(ttl=float(os.environ.get("TOOL_CACHE_TTL", DEFAULT_TTL)))
+    return _default_cache
+
+
+class CachedTool(BaseTool):
+    """LangChain tool that answers from ToolResultCache and coalesces identical in-flight calls."""
+
+    tool: BaseTool
+    cache: Any = None
+    params: Dict[str, Any] = {}
+    stats: Dict[str, int] = {}
+    is_error: Callable[[Any], bool] = error_repr
+    _inflight: Dict[str, Future] = PrivateAttr(default_factory=dict)
+    _inflight_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def wrap(cls, tool: BaseTool, cache: Optional[ToolResultCache] = None,
+             is_error: Callable[[Any], bool] = error_repr) -> "CachedTool":
+        """Wraps tool; results for which is_error(result) is true are returned but not cached."""
+        # Tools without an explicit args_schema infer it from _run; the wrapper's own _run takes *args
+        args_schema = tool.args_schema or tool.get_input_schema()
+        return cls(
+            name=tool.name, description=tool.description, args_schema=args_schema, return_direct=tool.return_direct,
+            tool=tool, cache=cache or default_cache(), params=tool_params(tool),
+            stats={"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}, is_error=is_error,
+        )
+
+    def _tool_input(self, args, kwargs):
+        # 'query' and {"query": "query"} are the same call: positional arguments by schema field name
+        if args and len(args) <= len(self.args):
+            kwargs = {**dict(zip(self.args, args)), **kwargs}
+        return kwargs if kwargs else args[0]
+
+    def _lookup(self, tool_input):
+        """Returns (key, cached result or None, in-flight future, True if this caller has to run the tool)."""
+        key = ToolResultCache.key(self.name, self.params, tool_input)
+        found, result = self.cache.get(key)
+        if found and not self.is_error(result):  # Error entries written before is_error existed count as misses
+            self.stats["hits"] += 1
+            return key, (result,), None, False
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return key, None, future, False
+            future = self._inflight[key] = Future()
+        self.stats["misses"] += 1
+        return key, None, future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._inflight_lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            self.stats["errors"] += 1
+            future.set_exception(error)
+        else:
+            if self.is_error(result):
+                self.stats["errors"] += 1  # Returned to this call and its followers, retried by the next one
+            else:
+                self.cache.put(key, self.name, result)
+            future.set_result(result)
+
+    def _run(self, *args, run_manager=None, **kwargs):
+        tool_input = self._tool_input(args, kwargs)
+        key, cached, future, leader = self._lookup(tool_input)
+        if cached is not None:
+            return cached[0]
+        if not leader:
+            return future.result()
+        try:
+            result = self.tool.invoke(tool_input)
+        except BaseException as exc:
+            self._finish(key, future, error=exc)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def _arun(self, *args, run_manager=None, **kwargs):
+        tool_input = self._tool_input(args, kwargs)
+        key, cached, future, leader = self._lookup(tool_input)
+        if cached is not None:
+            return cached[0]
+        if not leader:
+            # shield: a cancelled follower must not cancel the shared call
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await self.tool.ainvoke(tool_input)
+        except BaseException as exc:  # Including cancellation, so followers do not wait forever
+            self._finish(key, future, error=exc)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def print_stats(self) -> None:
+        s = self.stats
+        calls = s["hits"] + s["misses"] + s["coalesced"]
+        rate = (s["hits"] + s["coalesced"]) / calls if calls else 0.0
+        print(
+            f"--- Tool cache '{self.name}': {s['hits']} hits, {s['coalesced']} coalesced, {s['misses']} misses "
+            f"({rate:.0%} served without a call), {s['errors']} errors ---"
+        )
+
+
+if __name__ == "__main__":
+    # Demo: a slow fake search called concurrently and repeatedly
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    from langchain_core.tools import tool
+
+    calls = []
+
+    @tool
+    def slow_search(query: str) -> list:
+        """Fake search with 200ms latency."""
+        calls.append(query)
+        time.sleep(0.2)
+        return [{"url": "https://example.com", "content": f"result for {query}"}]
+
+    with tempfile.TemporaryDirectory() as directory:
+        search = CachedTool.wrap(slow_search, ToolResultCache(os.path.join(directory, "cache.sqlite")))
+        queries = ["manus.im agent", "Manus.im  agent", "manus alternatives", "manus.im agent"] * 4
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(search.invoke, queries))
+        print(f"{len(queries)} concurrent calls: {len(calls)} real searches in {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        for query in queries:
+            search.invoke(query)
+        print(f"{len(queries)} repeated calls: {len(calls)} real searches in total, {time.perf_counter() - start:.3f}s")
+        search.print_stats()
+
+        # A search that reports its failure as a value (like Tavily) is retried instead of cached
+        outage = [True]
+
+        @tool
+        def flaky_search(query: str) -> list:
+            """Fake search that returns repr(e) during an outage."""
+            calls.append(query)
+            return repr(ConnectionError("service unavailable")) if outage[0] else [{"content": query}]
+
+        flaky = CachedTool.wrap(flaky_search, ToolResultCache(os.path.join(directory, "flaky.sqlite")), not_a_list)
+        failed = flaky.invoke("manus.im agent")
+        outage[0] = False
+        print(f"during outage: {failed!r}, afterwards: {flaky.invoke('manus.im agent')!r}")
+        flaky.print_stats()
+
+# docker-compose run --rm app langgraph/tool_cache.py
@@ -0,0 +1,424 @@
+"""
+Schneller Start der Kurs-Skripte: Import-Profile, verzögerte Provider-Importe und ein vorgewärmter Daemon
+
+Ein kurzer Lauf wie 1_chat_models_starter.py verbringt den Großteil seiner Zeit mit Importen
+(langchain_openai, langchain_chroma, chromadb, ...). Der Runner bietet drei Werkzeuge dagegen:
+
+- profile: Führt ein Skript mit 'python -X importtime' aus und speichert pro Skript die Importzeit
+  der Top-Level-Pakete in .runner/import_profiles.json
+- run (Standard): Führt ein Skript aus. Läuft ein Daemon, übernimmt er den Lauf; sonst wird das Skript
+  lokal gestartet, wobei 'import <provider>' erst beim ersten Attributzugriff ausgeführt wird
+  ('from <provider> import X' lädt sofort, weil X gebraucht wird)
+- serve: Startet den Daemon. Er importiert die schweren Pakete (Standardliste + alles, was in den
+  Import-Profilen über der Schwelle liegt) einmalig, wärmt ChatOpenAI/OpenAIEmbeddings (Pydantic-Schemas,
+  gecachte HTTP-Clients inkl. TLS-Kontext) und die Chroma-Bindings vor und wartet auf einem Unix-Socket.
+  Der Socket liegt in einem privaten Verzeichnis (0700, pro Benutzer) und hat Modus 0600: nur der eigene
+  Benutzer kann Skripte starten, und der Client schickt seine Umgebung nur an einen Socket dieses Benutzers.
+  Ungültige Anfragen werden mit einer Fehlermeldung beantwortet, der Daemon läuft weiter.
+  Jeder Lauf ist ein per fork() abgespaltener Kindprozess mit den Terminal-Dateideskriptoren, der
+  Umgebung, dem Arbeitsverzeichnis und den Argumenten des Aufrufers. Skripte laufen damit isoliert
+  (eigene Modul-Globals), aber ohne Importkosten.
+
+Der Chroma-Client selbst wird im Kind geöffnet: die Rust-Bindings starten beim Öffnen native Threads,
+die ein fork() nicht überleben. Offene HTTP-Verbindungen gibt es im Daemon aus demselben Grund nicht,
+nur bereits gebaute (unbenutzte) Clients.
+
+Der Client (run/ask/status/stop) importiert nur die Standardbibliothek.
+"""
+import json  # Für das Protokoll und die Profile
+import os  # Für fork, Dateideskriptoren und Umgebung
+import socket  # Für die Verbindung zum Daemon
+import stat  # Für die Rechte des Socket-Verzeichnisses
+import sys  # Für Argumente und Interpreter
+import tempfile  # Für das Standardverzeichnis des Sockets
+import time  # Für die Zeitmessung
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Privates Verzeichnis pro Benutzer statt eines für alle beschreibbaren Pfads in /tmp
+SOCKET_DIR = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), f"langchain_runner-{os.getuid()}")
+SOCKET_PATH = os.environ.get("RUNNER_SOCKET", os.path.join(SOCKET_DIR, "runner.sock"))
+PROFILE_PATH = os.path.join(ROOT, ".runner", "import_profiles.json")
+PROFILE_THRESHOLD_MS = 20.0  # Pakete ab dieser Importzeit lädt der Daemon vor
+RAG_QUESTION_SCRIPT = os.path.join(ROOT, "langchain", "4_RAGs", "3_rag_one_off_question.py")
+
+# Schwere Provider-Pakete: im Daemon vorgeladen, bei lokalen Läufen verzögert importiert
+HEAVY_MODULES = (
+    "langchain_openai", "langchain_chroma", "langchain_community", "chromadb", "chromadb_rust_bindings",
+    "langchain_anthropic", "langchain_mistralai", "langchain_google_genai", "firebase_admin",
+    "google.cloud.firestore", "tiktoken", "langchain_text_splitters",
+)
+
+
+# --- Import-Profile ---
+
+def parse_importtime(lines):
+    """Summiert die kumulative Importzeit (ms) der Top-Level-Importe aus 'python -X importtime' pro Paket."""
+    packages = {}
+    for line in lines:
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if name.startswith("  ") or not cumulative.strip().isdigit():
+            continue  # Verschachtelte Importe stecken schon in der kumulativen Zeit ihres Pakets
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(cumulative) / 1000
+    return packages
+
+
+def load_profiles():
+    if not os.path.exists(PROFILE_PATH):
+        return {}
+    with open(PROFILE_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def profile(script, args):
+    """Führt das Skript mit -X importtime aus, gibt die teuersten Pakete aus und speichert das Profil."""
+    import subprocess
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", script, *args], stderr=subprocess.PIPE, text=True,
+    )
+    timings = []
+    for line in process.stderr:
+        if line.startswith("import time:"):
+            timings.append(line)
+        else:
+            sys.stderr.write(line)  # Fehlermeldungen des Skripts durchreichen
+    returncode = process.wait()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    packages = parse_importtime(timings)
+
+    profiles = load_profiles()
+    profiles[os.path.relpath(os.path.abspath(script), ROOT)] = {
+        "total_ms": round(elapsed_ms, 1),
+        "import_ms": round(sum(packages.values()), 1),
+        "packages": {name: round(ms, 1) for name, ms in sorted(packages.items(), key=lambda item: -item[1])},
+    }
+    os.makedirs(os.path.dirname(PROFILE_PATH), exist_ok=True)
+    with open(PROFILE_PATH, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=2)
+
+    print(f"\n--- Import profile: {sum(packages.values()):.0f}ms of {elapsed_ms:.0f}ms spent importing ---", file=sys.stderr)
+    for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:15]:
+        print(f"{ms:>9.1f}ms  {name}", file=sys.stderr)
+    print(f"(saved to {os.path.relpath(PROFILE_PATH)})", file=sys.stderr)
+    return returncode
+
+
+def preload_modules():
+    """Standardliste plus alle Pakete, die in einem gespeicherten Profil über der Schwelle liegen."""
+    modules = dict.fromkeys(HEAVY_MODULES)
+    for entry in load_profiles().values():
+        for name, ms in entry["packages"].items():
+            if ms >= PROFILE_THRESHOLD_MS and name not in sys.stdlib_module_names and name != "__main__":
+                modules.setdefault(name)
+    return list(modules)
+
+
+# --- Verzögerte Importe ---
+
+class _LazyFinder:
+    """Meta-Path-Finder, der die Ausführung der angegebenen Top-Level-Pakete bis zum ersten Attributzugriff verschiebt."""
+
+    def __init__(self, names):
+        self.names = set(names)
+
+    def find_spec(self, name, path=None, target=None):
+        if name not in self.names:
+            return None
+        import importlib.util
+
+        sys.meta_path.remove(self)  # Den eigentlichen Spec mit den übrigen Findern suchen
+        try:
+            spec = importlib.util.find_spec(name)
+        finally:
+            sys.meta_path.insert(0, self)
+        if spec is None or not hasattr(spec.loader, "exec_module") or spec.origin in (None, "built-in", "frozen"):
+            return spec
+        spec.loader = importlib.util.LazyLoader(spec.loader)
+        return spec
+
+
+def enable_lazy_imports(names=HEAVY_MODULES):
+    sys.meta_path.insert(0, _LazyFinder(name for name in names if "." not in name))
+
+
+# --- Skripte ausführen ---
+
+def run_script(script, args):
+    """Führt ein Skript wie 'python script args' aus (im aktuellen Prozess); liefert den Exit-Code."""
+    import runpy
+    import traceback
+
+    script = os.path.abspath(script)
+    sys.argv = [script, *args]
+    sys.path[0] = os.path.dirname(script)  # Wie beim direkten Aufruf: Hilfsmodule neben dem Skript finden
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as exc:
+        code = exc.code
+        if code is None or isinstance(code, int):
+            return code or 0
+        print(code, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return 0
+
+
+# --- Daemon ---
+
+def _warm_up(modules):
+    """Importiert die Pakete und baut fork-sichere Objekte vor; liefert die Ladezeit pro Paket."""
+    import importlib
+
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception:
+            continue  # Nicht installierte Provider überspringen
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    if "langchain_openai" in sys.modules:
+        from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+        # Pydantic-Validierung und die von langchain_openai gecachten httpx-Clients (je Basis-URL);
+        # ein noch unbenutzter Client hat keine offenen Verbindungen und darf geforkt werden
+        api_key = os.environ.get("OPENAI_API_KEY") or "warm-up"
+        ChatOpenAI(model="gpt-4o-mini", api_key=api_key)
+        ChatOpenAI(model="gpt-4o-mini", api_key=api_key, stream_usage=True)
+        OpenAIEmbeddings(model="text-embedding-3-small", api_key=api_key)
+    if "tiktoken" in sys.modules:
+        try:
+            sys.modules["tiktoken"].get_encoding("o200k_base")
+        except Exception:
+            pass  # Ohne Netz fehlt die Kodierung; context_packing schätzt dann
+    return timings
+
+
+def _handle(connection, request, fds):
+    """Im Kindprozess: Terminal, Umgebung und Argumente des Aufrufers übernehmen und das Skript ausführen."""
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False)
+    os.environ.clear()
+    os.environ.update(request["env"])
+    os.chdir(request["cwd"])
+    return run_script(request["script"], request["args"])
+
+
+def _private_socket_dir():
+    """
+    Legt das Standardverzeichnis des Sockets mit Modus 0700 an und prüft, dass es dem eigenen Benutzer gehört.
+
+    Bei einem eigenen Pfad (RUNNER_SOCKET) schützen der Modus 0600 des Sockets und die Prüfung im Client.
+    """
+    os.makedirs(os.path.dirname(SOCKET_PATH), mode=0o700, exist_ok=True)
+    if os.path.dirname(SOCKET_PATH) != SOCKET_DIR:
+        return
+    info = os.lstat(SOCKET_DIR)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise SystemExit(f"{SOCKET_DIR} is not a directory owned by the current user")
+    os.chmod(SOCKET_DIR, 0o700)
+
+
+def _validate(request, fds):
+    """Fehlermeldung für eine ungültige Anfrage oder None."""
+    if not isinstance(request, dict) or request.get("command") not in ("run", "status", "stop"):
+        return "expected a JSON object with 'command' set to 'run', 'status' or 'stop'"
+    if request["command"] != "run":
+        return None
+    if not isinstance(request.get("script"), str) or not isinstance(request.get("cwd"), str):
+        return "'run' needs 'script' and 'cwd' strings"
+    if not isinstance(request.get("args"), list) or not all(isinstance(arg, str) for arg in request["args"]):
+        return "'args' must be a list of strings"
+    env = request.get("env")
+    if not isinstance(env, dict) or not all(isinstance(k, str) and isinstance(v, str) for k, v in env.items()):
+        return "'env' must be an object of strings"
+    if len(fds) != 3:
+        return "'run' needs the caller's stdin, stdout and stderr file descriptors"
+    return None
+
+
+def serve():
+    import signal
+
+    started = time.perf_counter()
+    timings = _warm_up(preload_modules())
+    _private_socket_dir()
+    if os.path.exists(SOCKET_PATH):
+        os.remove(SOCKET_PATH)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)  # Socket direkt mit Modus 0600 anlegen
+    try:
+        server.bind(SOCKET_PATH)
+    finally:
+        os.umask(umask)
+    os.chmod(SOCKET_PATH, 0o600)
+    server.listen(64)
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # Beendete Kindprozesse automatisch aufräumen
+    served = 0
+    print(
+        f"Runner daemon ready on {SOCKET_PATH} after {time.perf_counter() - started:.1f}s "
+        f"({len(timings)} packages preloaded)", flush=True,
+    )
+    try:
+        while True:
+            connection, _ = server.accept()
+            try:
+                message, fds, _, _ = socket.recv_fds(connection, 1 << 20, 3)
+                request = json.loads(message)
+            except (OSError, ValueError):
+                connection.close()
+                continue
+            error = _validate(request, fds)
+            if error is not None:
+                for fd in fds:
+                    os.close(fd)
+                try:
+                    connection.sendall(json.dumps({"error": error}).encode() + b"\n")
+                except OSError:
+                    pass  # Aufrufer ist schon weg
+                connection.close()
+                continue
+            if request["command"] == "status":
+                connection.sendall(json.dumps({
+                    "pid": os.getpid(), "uptime_s": round(time.perf_counter() - started, 1),
+                    "runs": served, "preloaded_ms": timings,
+                }).encode() + b"\n")
+                connection.close()
+                continue
+            if request["command"] == "stop":
+                connection.sendall(b'{"stopped": true}\n')
+                connection.close()
+                break
+            served += 1
+            pid = os.fork()
+            if pid == 0:
+                server.close()
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.default_int_handler)  # Auch wenn der Daemon im Hintergrund läuft
+                code = 1
+                try:
+                    connection.sendall(json.dumps({"pid": os.getpid()}).encode() + b"\n")
+                    code = _handle(connection, request, fds)
+                finally:
+                    try:
+                        connection.sendall(json.dumps({"exit": code}).encode() + b"\n")
+                    finally:
+                        os._exit(code)
+            for fd in fds:
+                os.close(fd)
+            connection.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(SOCKET_PATH):
+            os.remove(SOCKET_PATH)
+
+
+# --- Client ---
+
+def _connect():
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(SOCKET_PATH):
+        return None
+    if os.stat(SOCKET_PATH).st_uid != os.getuid():
+        # Die Anfrage enthält die Umgebung (API-Schlüssel): nur an einen Daemon des eigenen Benutzers
+        print(f"Ignoring {SOCKET_PATH}: not owned by the current user", file=sys.stderr)
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(SOCKET_PATH)
+    except OSError:
+        client.close()
+        return None  # Verwaister Socket: Daemon läuft nicht mehr
+    return client
+
+
+def _send(client, request, fds=()):
+    socket.send_fds(client, [json.dumps(request).encode()], list(fds))
+    return client.makefile("r", encoding="utf-8")
+
+
+def run_via_daemon(client, script, args):
+    """Übergibt den Lauf an den Daemon; liefert den Exit-Code des Skripts."""
+    import signal
+
+    request = {"command": "run", "script": os.path.abspath(script), "args": args,
+               "cwd": os.getcwd(), "env": dict(os.environ)}
+    replies = _send(client, request, fds=(0, 1, 2))
+    reply = json.loads(replies.readline() or "{}")
+    if "pid" not in reply:
+        print(f"Runner daemon rejected the run: {reply.get('error', 'no reply')}", file=sys.stderr)
+        return 1
+    pid = reply["pid"]
+    # Strg+C an das Skript weiterleiten, das nicht in der Vordergrund-Prozessgruppe des Terminals läuft
+    signal.signal(signal.SIGINT, lambda *_: os.kill(pid, signal.SIGINT))
+    line = replies.readline()
+    return json.loads(line)["exit"] if line else 1
+
+
+def run(script, args):
+    client = _connect()
+    if client is not None:
+        return run_via_daemon(client, script, args)
+    if os.environ.get("RUNNER_LAZY_IMPORTS", "1") != "0":
+        enable_lazy_imports()
+    return run_script(script, args)
+
+
+def main():
+    argv = sys.argv[1:]
+    usage = (
+        "usage: runner.py [run] <script> [args...] | ask <question> | profile <script> [args...] | serve | status | stop"
+    )
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage)
+        return 0
+    command, rest = argv[0], argv[1:]
+    if command == "serve":
+        serve()
+        return 0
+    if command in ("status", "stop"):
+        client = _connect()
+        if client is None:
+            print("Runner daemon is not running")
+            return 1
+        print(_send(client, {"command": command}).readline().strip())
+        return 0
+    if command == "profile" and rest:
+        return profile(rest[0], rest[1:])
+    if command == "ask" and rest:
+        return run(RAG_QUESTION_SCRIPT, ["--query", " ".join(rest)])
+    if command == "run":
+        command, rest = (rest[0], rest[1:]) if rest else (None, [])
+    if command is None or not os.path.exists(command):
+        print(usage, file=sys.stderr)
+        return 2
+    return run(command, rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# Befehl zum Ausführen des Skripts in einer Docker-Umgebung
+# docker-compose run --rm app runner.py profile langchain/1_chat_moddels/1_chat_models_starter.py
+# docker-compose run --rm app runner.py langchain/1_chat_moddels/1_chat_models_starter.py
+# Vorgewärmter Daemon in einem langlebigen Container, Aufrufe per docker exec:
+# docker-compose run -d --name langchain_warm app runner.py serve
+# docker exec -it langchain_warm python runner.py langchain/1_chat_moddels/1_chat_models_starter.py
+# docker exec -it langchain_warm python runner.py ask "Where is Dracula's castle located?"